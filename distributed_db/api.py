@@ -1,166 +1,210 @@
 from pprint import pprint
-from flask import Flask, jsonify, request
+import asyncio
+import hashlib
+import json
+import os
+import time
+from quart import Quart, Response, g, jsonify, request
 import pymysql
-from db.manager import DatabaseManager
-from constants import METADATA_LOCAL, AZURE_METADATA_PATH, METADATA_COPY
-
-md = METADATA_LOCAL
-
-app = Flask(__name__)
+from db.async_manager import AsyncDatabaseManager
+from db.cache import TTLCache
+from db import counters
+from db.profiling import Profiler
+from constants import METADATA_LOCAL, AZURE_METADATA_PATH, METADATA_COPY, LOGIN_CACHE_SIZE, LOGIN_CACHE_TTL, PREFERENCE_CACHE_SIZE, PREFERENCE_CACHE_TTL, PREFERENCE_BATCH_SIZE
+
+# e.g. the metadata of a local SQLite cluster made by `python3 -m benchmarks.generate --sqlite-cluster`
+md = os.environ.get('DISTRIBUTED_DB_METADATA', METADATA_LOCAL)
+
+# Quart is the asyncio port of Flask: each request is a coroutine, and the blocking pymysql work is handed to the
+# async manager's thread pool, so one process can keep hundreds of requests in flight.
+app = Quart(__name__)
 try:
-    dbm = DatabaseManager(md)
+    dbm = AsyncDatabaseManager(md)
     
 except FileNotFoundError:
-    dbm = DatabaseManager('/Users/charlottekho/Documents/GIT/DSCI-551-Project/distributed_db/db/metadata.json')
-metadata = dbm.read_metadata()
+    dbm = AsyncDatabaseManager('/Users/charlottekho/Documents/GIT/DSCI-551-Project/distributed_db/db/metadata.json')
+dbm.read_metadata()  # fail fast if the metadata file is missing; routes re-read it so `cli.py expand` is picked up
+
+# username -> (metadata version, home date, home db) of recent logins, so a returning user skips the directory and
+# any fan-out. Entries from an older metadata version (e.g. before a reshard) are ignored.
+login_homes = TTLCache(LOGIN_CACHE_SIZE, LOGIN_CACHE_TTL)
+
+# username -> (pivoted preferences, ETag) as served by /api/preferences/<username>. The save and delete routes write
+# the new document through; the TTL bounds how long a change made elsewhere (the CLI, another API process) goes unseen.
+preference_docs = TTLCache(PREFERENCE_CACHE_SIZE, PREFERENCE_CACHE_TTL)
+
+
+def pivot_preferences(rows) -> dict:
+    """
+    Pivot (name, type, preference) rows into the lists shown by the web UI, each sorted so the same preferences
+    always give the same document (and ETag).
+    """
+    preferences = {
+        "favorite_teams": [],
+        "bandwagon_teams": [],
+        "rival": [],
+        "favorite_players": []
+    }
+    for name, nba_type, preference in rows:
+        if nba_type == 'team':
+            if preference == 'favorite':
+                preferences['favorite_teams'].append(name)
+            elif preference == 'bandwagon':
+                preferences['bandwagon_teams'].append(name)
+            elif preference == 'rival':
+                preferences['rival'].append(name)
+        elif nba_type == 'player':
+            if preference == 'favorite':
+                preferences['favorite_players'].append(name)
+    for names in preferences.values():
+        names.sort()
+    return preferences
+
+
+def cache_preferences(username, preferences: dict) -> tuple[dict, str]:
+    etag = hashlib.sha1(json.dumps(preferences, sort_keys=True).encode()).hexdigest()
+    preference_docs.put(username, (preferences, etag))
+    return preferences, etag
 
 @app.route('/login', methods=['POST'])
-def login():
-    data = request.get_json()
+async def login():
+    data = await request.get_json()
     username = data.get('username')
     password = data.get('password')
     date = data.get('date')
-    db_key = dbm.locate_db(metadata, int(date), username)
+    metadata = dbm.read_metadata()
+    
+    # returning users stay on the shard they were created on; only new users are placed by the login date
+    version = getattr(metadata, 'version', None)
+    cached = login_homes.get(username)
+    if cached is not None and cached[0] == version and cached[2] in metadata['Connections']:
+        home = cached[1:]
+    else:
+        home = await dbm.find_user(username, metadata)
+    if home:
+        date, db_key = home
+    else:
+        db_key = dbm.locate_db(metadata, int(date), username)
     credentials = metadata['Connections'][db_key]
 
-    connection = get_connection(credentials)
-    try:
-        with connection.cursor() as cursor:
-            # Check if the user already exists
-            sql_check = "SELECT * FROM Users WHERE user = %s"
-            cursor.execute(sql_check, (username,))
-            exists = cursor.fetchone()
-            
-            if exists:
-                # Update the existing user
-                sql_update = "UPDATE Users SET date = %s, password = %s WHERE user = %s"
-                cursor.execute(sql_update, (date, password, username))
-            else:
-                # Insert new user
-                sql_insert = "INSERT INTO Users (user, password, date) VALUES (%s, %s, %s)"
-                cursor.execute(sql_insert, (username, password, date))
-            
-            connection.commit()
-            return jsonify({"message": "Login successful", "username": username, "timestamp": date}), 200
-    finally:
-        connection.close()
+    payload, status = await dbm.transaction(credentials, _login, username, password, int(date), db_key)
+    if status == 200:
+        login_homes.put(username, (version, int(date), db_key))
+    return jsonify(payload), status
+
+
+def _login(connection, username, password, date, db_key):
+    with connection.cursor() as cursor:
+        # Insert a new user, or update the password of an existing one. The date is the user's shard key, so an
+        # existing user's is left alone
+        sql_upsert = """
+            INSERT INTO Users (user, password, date) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE password = VALUES(password);
+        """
+        rows = cursor.execute(sql_upsert, (username, password, date))
+        connection.commit()
+    
+    # 1 row affected: inserted, 2: password changed, 0: nothing changed
+    if rows:
+        dbm.invalidate_cache('users')
+    if rows == 1:
+        dbm.directory.register(username, date, db_key)
+    return {"message": "Login successful", "username": username, "timestamp": str(date)}, 200
 
 @app.route('/api/save_preferences', methods=['POST'])
-def save_preferences():
-    data = request.get_json()
+async def save_preferences():
+    data = await request.get_json()
     print(data)
     username = data['username']
     timestamp = data['timestamp']
 
-    db_key = dbm.locate_db(metadata, int(timestamp), username)
+    metadata = dbm.read_metadata()
+    db_key = await dbm.home_shard(metadata, username, int(timestamp) if timestamp else None)
     credentials = metadata['Connections'][db_key]
-    connection = get_connection(credentials)
 
+    payload, status = await dbm.transaction(credentials, _save_preferences, username, data)
+    return jsonify(payload), status
+
+
+def _save_preferences(connection, username, data):
+    # Create a mapping for the incoming data to database labels
+    category_mapping = {
+        'favorite_teams': 'favorite',
+        'bandwagon_teams': 'bandwagon',
+        'rival_teams': 'rival', 
+        'favorite_players': 'favorite'
+    }
+    
+    # only the categories sent are replaced; a user's other preferences are left alone
+    categories = [category for category in data.keys() if category in category_mapping]
+    
     try:
         with connection.cursor() as cursor:
-            # Create a mapping for the incoming data to database labels
-            category_mapping = {
-                'favorite_teams': 'favorite',
-                'bandwagon_teams': 'bandwagon',
-                'rival_teams': 'rival', 
-                'favorite_players': 'favorite'
-            }
-            
             # Retrieve existing preferences to identify changes needed
-            existing_preferences = {
-                'favorite_teams': set(),
-                'bandwagon_teams': set(),
-                'rival_teams': set(), 
-                'favorite_players': set()
-            }
-
-            cursor.execute("SELECT nba_entity, type, preference FROM Preferences, Nba WHERE Nba.name = Preferences.nba_entity AND user = %s", (username,))
-
-
-            for row in cursor:
-                existing_preferences[f"{row['preference']}_{row['type']}s"].add(row['nba_entity'])
+            cursor.execute("""
+                SELECT Preferences.nba_entity, Preferences.preference, Nba.type
+                FROM Preferences
+                JOIN Nba ON Nba.name = Preferences.nba_entity
+                WHERE Preferences.user = %s;
+            """, (username,))
+            # Preferences is keyed by (user, nba_entity, preference): an entity can be held under several preferences
+            rows = cursor.fetchall()
+            existing = {(nba_entity, preference) for nba_entity, preference, _ in rows}
+            known = {nba_entity: nba_type for nba_entity, _, nba_type in rows}
             
-            if not existing_preferences:
-                for category in data.keys():
-                    if category in category_mapping:
-                        sql_nba = """
-                                 INSERT INTO Nba (name, type)
-                                 VALUES (%s, %s)
-                             """
-                        sql_preferences = """
-                                INSERT INTO Preferences (user, nba_entity, preference)
-                                VALUES (%s, %s, %s);
-                        """
-                        for item in data[category]:
-                            cursor.execute(sql_nba, (item, 'team' if 'teams' in category else 'player'))
-                            
-                            cursor.execute(sql_preferences, (username, item, category_mapping[category]))
-                        connection.commit()
-            else:
-                
-                # create a list of new preferences that reflect the current state of the streamlit app
-                new_preferences = {}
-                
-                for category in data.keys():
-                    if category in category_mapping:
-                        new_preferences[category] = set(data[category])
-                
-                for p in new_preferences:
-
-                    # get items to delete
-                    to_delete = existing_preferences[p].difference(new_preferences[p].intersection(existing_preferences[p]))
-                    
-                    # get items to add
-                    to_add = new_preferences[p].difference(existing_preferences[p])
-
-                    for item in to_add:
-                        sql_nba = """
-                                 INSERT INTO Nba (name, type)
-                                 VALUES (%s, %s)
-                        """
-                        sql_preferences = """
-                                INSERT INTO Preferences (user, nba_entity, preference)
-                                VALUES (%s, %s, %s);
-                        """
-                        
-                        try:
-                            cursor.execute(sql_nba, (item, 'player' if p == 'favorite_players' else 'team'))
-                               
-                            
-                            
-                        except pymysql.err.IntegrityError as err:
-                            if err.args[0] == 1062:
-                                pass
-                        try:                       
-                            cursor.execute(sql_preferences, (username, item, category_mapping[p]))
-                        except pymysql.err as err:
-                            print(err)
-                         
-                            
-                    for item in to_delete:
-                        delete_stmt = """
-                            DELETE FROM Preferences
-                            WHERE user = %s 
-                            AND nba_entity = %s 
-                            AND preference = %s;
-                        """
-                        cursor.execute(delete_stmt, (username, item, category_mapping[p]))
-                        connection.commit()   
-                        
-                connection.commit()
-                    
-            return jsonify({"message": "Preferences saved successfully"}), 200
+            current = {(item, preference) for item, preference in existing if f'{preference}_{known[item]}s' in categories}
+            
+            types = dict(known)
+            wanted = set()
+            for category in categories:
+                for item in data[category]:
+                    wanted.add((item, category_mapping[category]))
+                    types.setdefault(item, 'player' if category == 'favorite_players' else 'team')
+            
+            # sorted, so concurrent saves take row locks in the same order
+            to_delete = sorted(current - wanted)
+            to_add = sorted(wanted - existing)
+            
+            if to_add:
+                cursor.executemany("INSERT IGNORE INTO Nba (name, type) VALUES (%s, %s);", sorted({(item, types[item]) for item, _ in to_add}))
+                # INSERT IGNORE keeps an Nba row that already exists, whose type may not be the one guessed from the
+                # category; the counters and the cached document use the stored type, as a cold read would
+                new = sorted({item for item, _ in to_add} - known.keys())
+                if new:
+                    cursor.execute(f"SELECT name, type FROM Nba WHERE name IN ({', '.join(['%s'] * len(new))});", new)
+                    types.update(cursor.fetchall())
+            if to_delete:
+                cursor.execute(f"""
+                    DELETE FROM Preferences
+                    WHERE user = %s
+                    AND (nba_entity, preference) IN ({', '.join(['(%s, %s)'] * len(to_delete))});
+                """, (username, *[value for pair in to_delete for value in pair]))
+            if to_add:
+                cursor.executemany("INSERT INTO Preferences (user, nba_entity, preference) VALUES (%s, %s, %s);",
+                                   [(username, item, preference) for item, preference in to_add])
+            
+            # keep the shard's fandom counters in step, in the same transaction
+            deltas = counters.deltas_for(to_add)
+            deltas.update(counters.deltas_for(to_delete, -1))
+            counters.apply(cursor, deltas, types=types)
+            connection.commit()
+            
+        if to_add or to_delete:
+            dbm.invalidate_cache('prefs')
+        
+        # write the saved profile through to the preference cache
+        saved = (existing - set(to_delete)) | set(to_add)
+        cache_preferences(username, pivot_preferences((item, types[item], preference) for item, preference in saved))
+        return {"message": "Preferences saved successfully"}, 200
     except Exception as e:
         print(e)
         connection.rollback()
-        return jsonify({"error": str(e)}), 500
-    finally:
-        connection.close()
+        return {"error": str(e)}, 500
 
 
 @app.route('/api/delete_preferences', methods=['POST'])
-def delete_preferences():
-    data = request.get_json()
+async def delete_preferences():
+    data = await request.get_json()
     username = data.get('username')
     timestamp = data.get('timestamp')
 
@@ -168,30 +212,57 @@ def delete_preferences():
         return jsonify({"error": "Missing username"}), 400
 
     # Get database credentials
-    db_key = dbm.locate_db(metadata, int(timestamp), username)
+    metadata = dbm.read_metadata()
+    db_key = await dbm.home_shard(metadata, username, int(timestamp) if timestamp else None)
     credentials = metadata['Connections'][db_key]
-    connection = get_connection(credentials)
+
+    payload, status = await dbm.transaction(credentials, _delete_preferences, username)
+    return jsonify(payload), status
+
+
+def _delete_preferences(connection, username):
 
     try:
         with connection.cursor() as cursor:
-            # Delete all preferences for the user
+            # Delete all preferences for the user, and take them off the shard's fandom counters
+            deltas = counters.deltas_for_condition(cursor, 'user = %s', (username,))
             sql_delete = "DELETE FROM Preferences WHERE user = %s"
             cursor.execute(sql_delete, (username,))
+            counters.apply(cursor, deltas)
             connection.commit()
-            return jsonify({"message": "Preferences deleted successfully"}), 200
+            dbm.invalidate_cache('prefs')
+            cache_preferences(username, pivot_preferences([]))
+            return {"message": "Preferences deleted successfully"}, 200
     except Exception as e:
         connection.rollback()
-        return jsonify({"error": str(e)}), 500
-    finally:
-        connection.close()
+        return {"error": str(e)}, 500
 
 
 @app.route('/api/preferences/<username>', methods=['GET'])
-def get_preferences(username):
-    timestamp = request.args.get('timestamp', '')
-    db_key = dbm.locate_db(metadata, int(timestamp), username)
-    credentials = metadata['Connections'][db_key]
-    connection = get_connection(credentials)
+async def get_preferences(username):
+    cached = preference_docs.get(username)
+    if cached is None:
+        timestamp = request.args.get('timestamp', '')
+        metadata = dbm.read_metadata()
+        db_key = await dbm.home_shard(metadata, username, int(timestamp) if timestamp else None)
+        credentials = metadata['Connections'][db_key]
+
+        payload, status = await dbm.transaction(credentials, _get_preferences, username)
+        if status != 200:
+            return jsonify(payload), status
+        cached = cache_preferences(username, payload)
+    
+    # an unchanged profile is answered with 304 and no body
+    preferences, etag = cached
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(preferences)
+    response.set_etag(etag)
+    return response
+
+
+def _get_preferences(connection, username):
 
     try:
         with connection.cursor() as cursor:
@@ -206,34 +277,139 @@ def get_preferences(username):
 
             print("Debug: Fetched preferences:", results)
 
-
-
-            preferences = {
-                "favorite_teams": [],
-                "bandwagon_teams": [],
-                "rival": [],
-                "favorite_players": []
-            }
-            for row in results:
-                if row['type'] == 'team':
-                    if row['preference'] == 'favorite':
-                        preferences['favorite_teams'].append(row['name'])
-                    elif row['preference'] == 'bandwagon':
-                        preferences['bandwagon_teams'].append(row['name'])
-                    elif row['preference'] == 'rival':
-                        preferences['rival'].append(row['name'])
-                elif row['type'] == 'player':
-                    if row['preference'] == 'favorite':
-                        preferences['favorite_players'].append(row['name'])
-
-                
+            preferences = pivot_preferences(results)
             print(preferences)
             
-            return jsonify(preferences), 200
+            return preferences, 200
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+
+@app.route('/api/preferences/batch', methods=['POST'])
+async def batch_preferences():
+    """
+    Preferences of many users at once, for jobs that would otherwise call /api/preferences/<username> per user.
+    
+    Takes a JSON list of {"username", "timestamp"} and answers with NDJSON, one {"username", "preferences"} (or
+    {"username", "error"}) line per user. Users are grouped by home shard and each shard is sent one
+    `WHERE user IN (...)` query per PREFERENCE_BATCH_SIZE users, all shards in parallel; lines are streamed as each
+    shard answers, cached profiles first.
+    """
+    users = await request.get_json()
+    if not isinstance(users, list) or not all(isinstance(user, dict) and user.get('username') for user in users):
+        return jsonify({"error": "Expected a list of {username, timestamp}"}), 400
+    
+    # the last timestamp given for a user wins
+    users = {user['username']: user.get('timestamp') for user in users}
+    metadata = dbm.read_metadata()
+    
+    cached = {}
+    pending = {}
+    for username, timestamp in users.items():
+        doc = preference_docs.get(username)
+        if doc is not None:
+            cached[username] = doc[0]
+        else:
+            pending[username] = timestamp
+    groups, errors = await dbm.run(_group_by_shard, metadata, pending)
+    
+    async def lines():
+        for username, preferences in cached.items():
+            yield json.dumps({"username": username, "preferences": preferences}) + '\n'
+        for username, error in errors.items():
+            yield json.dumps({"username": username, "error": error}) + '\n'
+        
+        async def fetch(db_key, usernames):
+            try:
+                return usernames, await dbm.transaction(metadata['Connections'][db_key], _batch_preferences, usernames)
+            except Exception as e:
+                return usernames, e
+        
+        tasks = [
+            fetch(db_key, usernames[i:i + PREFERENCE_BATCH_SIZE])
+            for db_key, usernames in groups.items()
+            for i in range(0, len(usernames), PREFERENCE_BATCH_SIZE)
+        ]
+        for task in asyncio.as_completed(tasks):
+            usernames, result = await task
+            if isinstance(result, Exception):
+                for username in usernames:
+                    yield json.dumps({"username": username, "error": str(result)}) + '\n'
+                continue
+            for username, preferences in result.items():
+                yield json.dumps({"username": username, "preferences": preferences}) + '\n'
+    
+    return lines(), 200, {'Content-Type': 'application/x-ndjson'}
+
+
+def _group_by_shard(metadata, users: dict) -> tuple[dict, dict]:
+    """
+    Returns:
+    \tgroups - {db: [username, ...]}.\n
+    \terrors - {username: reason} for users that could not be placed.\n
+    """
+    groups = {}
+    errors = {}
+    for username, timestamp in users.items():
+        try:
+            date = int(timestamp) if timestamp else None
+            # the timestamp a client holds is the user's home date, so a user missing from the directory is placed
+            # by it instead of asking every shard
+            if date is not None and dbm.directory.lookup(username) is None:
+                db_key = dbm.locate_db(metadata, date, username)
+            else:
+                db_key = dbm.manager.home_shard(metadata, username, date)
+        except Exception as e:
+            errors[username] = str(e)
+            continue
+        groups.setdefault(db_key, []).append(username)
+    return groups, errors
+
+
+def _batch_preferences(connection, usernames) -> dict:
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT pref.user, nba.name, nba.type, pref.preference
+            FROM Preferences pref
+            JOIN Nba nba ON nba.name = pref.nba_entity
+            WHERE pref.user IN ({', '.join(['%s'] * len(usernames))});
+        """, tuple(usernames))
+        rows = {username: [] for username in usernames}
+        for user, name, nba_type, preference in cursor.fetchall():
+            rows.setdefault(user, []).append((name, nba_type, preference))
+    
+    return {username: cache_preferences(username, pivot_preferences(user_rows))[0] for username, user_rows in rows.items()}
+
+
+@app.route('/api/bulk_insert/<table>', methods=['POST'])
+async def bulk_insert(table):
+    """
+    Insert a JSON list of records into 'users', 'prefs' or 'nba', grouped by shard.
+    """
+    if table not in dbm.manager.insert_columns:
+        return jsonify({"error": f"Unknown table {table}"}), 400
+    
+    records = await request.get_json()
+    if not isinstance(records, list):
+        return jsonify({"error": "Expected a list of records"}), 400
+    
+    batch_size = request.args.get('batch_size', type=int)
+    metadata = dbm.read_metadata()
+    try:
+        if batch_size:
+            report = await dbm.insert_many(table, records, metadata=metadata, batch_size=batch_size)
+        else:
+            report = await dbm.insert_many(table, records, metadata=metadata)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        connection.close()
+    
+    return jsonify({
+        "inserted": report['inserted'],
+        "per_shard": report['per_shard'],
+        "duplicates": [{"db": db, "record": record} for db, record in report['duplicates']],
+        "missing_references": [{"db": db, "record": record} for db, record in report['missing_references']],
+        "errors": [{"db": db, "record": record, "error": reason} for db, record, reason in report['errors']]
+    }), 200
 
 
 # @app.route('/api/shared_preferences/<username>', methods=['GET'])
@@ -275,20 +451,59 @@ def get_preferences(username):
 #         print(f"Database error: {str(e)}")
 #         return jsonify({"error": str(e)}), 500
 #     finally:
-#         connection.close()
+#         release_connection(credentials, connection)
+
+
+
+
+@app.route('/api/pool_stats', methods=['GET'])
+async def pool_stats():
+    return jsonify(dbm.pool_stats()), 200
+
+@app.route('/api/cache_stats', methods=['GET'])
+async def cache_stats():
+    return jsonify(dbm.cache_stats()), 200
+
+@app.route('/api/capacity', methods=['GET'])
+async def capacity():
+    # the last snapshot, kept fresh by the poller below; only shards that were never polled are queried here
+    return jsonify(await dbm.run(dbm.manager.capacity.report, None, float('inf'))), 200
+
+@app.before_serving
+async def start_capacity_poller():
+    dbm.manager.capacity.start()
+
+@app.after_serving
+async def stop_capacity_poller():
+    await dbm.run(dbm.manager.capacity.stop)
+
+# latency per route template (not per URL, so usernames do not each get a series), method and status
+request_seconds = dbm.metrics.histogram('distributed_db_api_request_seconds', 'API request latency by route, method and status.', ('route', 'method', 'status'))
 
+@app.before_request
+async def start_timer():
+    g.request_start = time.perf_counter()
 
+@app.after_request
+async def record_latency(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - start, route=route, method=request.method, status=response.status_code)
+    return response
 
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    # Prometheus text exposition format: per-shard latency histograms, rows and errors, pool and cache gauges
+    return dbm.metrics_text(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
-def get_connection(credentials):
-    return pymysql.connect(
-        host=credentials['vm_ip'],
-        user=credentials['mysql_username'],
-        password=credentials['mysql_password'],
-        db=credentials['mysql_database'],
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
-    )
+# DISTRIBUTED_DB_PROFILE=<sample rate> profiles that fraction of requests and keeps the ones slower than
+# DISTRIBUTED_DB_PROFILE_MIN_MS (see db/profiling.py)
+profiler = Profiler.from_environment()
+if profiler is not None:
+    for endpoint, view in app.view_functions.items():
+        if endpoint != 'static':
+            app.view_functions[endpoint] = profiler.wrap(view, lambda: f'{request.method} {request.url_rule.rule}')
 
 
 
@@ -296,4 +511,5 @@ def get_connection(credentials):
 
 
 if __name__ == '__main__':
+    # development server; in production run it under an ASGI server, e.g. `hypercorn api:app`
     app.run(debug=True)
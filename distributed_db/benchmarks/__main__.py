@@ -0,0 +1,43 @@
+"""
+Run the whole benchmark suite against local SQLite shards and write one JSON document with the results and the
+commit they were measured on.
+
+Run from the distributed_db directory:
+    python3 -m benchmarks [-o] <results.json> [--quick] [--only routing inserts fanout routes]
+
+Compare two runs with:
+    python3 -m benchmarks.compare <before.json> <after.json>
+"""
+import argparse
+import time
+
+from benchmarks import fanout, inserts, routes, routing
+from benchmarks.common import environment, write_results
+
+
+SUITES = {
+    'routing': lambda quick: routing.run(lookups=20_000 if quick else 200_000, num_ranges=64),
+    'inserts': lambda quick: inserts.run(num_users=500 if quick else 5000, num_shards=4, single=50 if quick else 500),
+    'fanout': lambda quick: fanout.run(shard_counts=[2, 8, 32] if quick else fanout.SHARD_COUNTS, num_users=500 if quick else 5000, repeat=10 if quick else 50),
+    'routes': lambda quick: routes.run(requests=20 if quick else 200, num_shards=4)
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suite on local SQLite shards')
+    parser.add_argument('-o', '--output', help='Write the JSON results to this file')
+    parser.add_argument('--quick', action='store_true', help='Smaller workloads, e.g. for CI')
+    parser.add_argument('--only', nargs='+', choices=list(SUITES), help='Run only these benchmarks')
+    args = parser.parse_args()
+
+    results = {'environment': environment(), 'quick': args.quick, 'benchmarks': {}}
+    for name in args.only or SUITES:
+        start = time.perf_counter()
+        results['benchmarks'][name] = SUITES[name](args.quick)
+        results['benchmarks'][name]['wall_seconds'] = round(time.perf_counter() - start, 2)
+
+    write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
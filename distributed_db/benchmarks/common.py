@@ -0,0 +1,177 @@
+"""
+Shared helpers for the benchmarks: local SQLite clusters to run against, timing summaries and the JSON result
+format.
+"""
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+from db.drivers import DRIVERS, sqlite_credentials
+from db.manager import DatabaseManager
+from db.store import write_metadata
+
+
+# every cluster gets its own range start (a day apart, so it stays a real date), so the in-memory shards of two
+# clusters never share a name
+_cluster_ids = itertools.count()
+
+NBA_ROWS = [
+    {'name': 'Boston Celtics', 'type': 'team'},
+    {'name': 'Denver Nuggets', 'type': 'team'},
+    {'name': 'Golden State Warriors', 'type': 'team'},
+    {'name': 'Los Angeles Lakers', 'type': 'team'},
+    {'name': 'Miami Heat', 'type': 'team'},
+    {'name': 'Nikola Jokic', 'type': 'player'},
+    {'name': 'Stephen Curry', 'type': 'player'},
+    {'name': 'LeBron James', 'type': 'player'},
+    {'name': 'Jayson Tatum', 'type': 'player'},
+    {'name': 'Jimmy Butler', 'type': 'player'}
+]
+
+
+def local_metadata(directory: str, num_shards: int, on_disk: bool = True, start: int = 2024010100, hash_function: str = 'jump') -> dict:
+    """
+    Metadata for one range of `num_shards` SQLite shards, stored as files in `directory` or in memory.
+    """
+    names = [f'r{start}h{h}' for h in range(num_shards)]
+    return {
+        'Ranges': {'Start': [start], 'End': [None], 'Moduli': [num_shards], 'Hashes': [hash_function]},
+        'Connections': {name: sqlite_credentials(name, directory if on_disk else None) for name in names}
+    }
+
+
+class LocalCluster():
+    """
+    A throwaway distributed database on SQLite shards (see db/drivers.py): one range of `num_shards` shards, a
+    metadata file in a temporary directory, and a DatabaseManager over it. Shards are in memory unless
+    `on_disk` is set. Use as a context manager; everything is removed on exit.
+    """
+    def __init__(self, num_shards: int, on_disk: bool = False, hash_function: str = 'jump', **pool_options) -> None:
+        self.directory = tempfile.mkdtemp(prefix='dsci551-bench-')
+        self.start = int((datetime(2024, 1, 1) + timedelta(days=next(_cluster_ids))).strftime('%Y%m%d%H'))
+        self.metadata_path = os.path.join(self.directory, 'metadata.json')
+        metadata = local_metadata(self.directory, num_shards, on_disk=on_disk, start=self.start, hash_function=hash_function)
+        self.names = list(metadata['Connections'])
+        write_metadata(self.metadata_path, metadata)
+        self.dbm = DatabaseManager(self.metadata_path, **pool_options)
+        with quiet():
+            self.dbm.broadcast_insert('nba', NBA_ROWS)
+
+    @property
+    def metadata(self) -> dict:
+        return self.dbm.read_metadata()
+
+    def users(self, count: int, prefix: str = 'user') -> list[dict]:
+        return [{'user': f'{prefix}{i}', 'password': 'password', 'date': self.start + i % 24} for i in range(count)]
+
+    def preferences(self, users: list[dict], per_user: int = 3) -> list[dict]:
+        levels = ['favorite', 'bandwagon', 'rival']
+        return [
+            {'user': user['user'], 'date': user['date'], 'nba_entity': NBA_ROWS[(i + j) % len(NBA_ROWS)]['name'], 'preference': levels[(i + j) % 3]}
+            for i, user in enumerate(users)
+            for j in range(per_user)
+        ]
+
+    def populate(self, num_users: int, per_user: int = 3) -> list[dict]:
+        users = self.users(num_users)
+        with quiet():
+            self.dbm.insert_many('users', users)
+            self.dbm.insert_many('prefs', self.preferences(users, per_user))
+        return users
+
+    def close(self) -> None:
+        self.dbm.close()
+        DRIVERS['sqlite'].close_memory_databases(self.names)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@contextmanager
+def quiet():
+    """
+    Swallow the "Query OK" lines the manager prints, so they are neither timed nor mixed into the results.
+    """
+    with redirect_stdout(io.StringIO()):
+        yield
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: list[float], scale: float = 1e3) -> dict:
+    """
+    Latency summary of samples in seconds, reported in ms by default.
+    """
+    if not samples:
+        return {'n': 0}
+    return {
+        'n': len(samples),
+        'mean': round(sum(samples) / len(samples) * scale, 4),
+        'min': round(min(samples) * scale, 4),
+        'p50': round(percentile(samples, 50) * scale, 4),
+        'p90': round(percentile(samples, 90) * scale, 4),
+        'p99': round(percentile(samples, 99) * scale, 4),
+        'max': round(max(samples) * scale, 4)
+    }
+
+
+def sample(fn: Callable[[], object], repeat: int, warmup: int = 1) -> list[float]:
+    """
+    Call `fn` `warmup` + `repeat` times and return the durations of the timed calls, in seconds.
+    """
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def write_results(results: dict, path: Optional[str]) -> None:
+    """
+    Write the results as JSON to `path`, or to stdout if no path is given.
+    """
+    text = json.dumps(results, indent=2)
+    if path:
+        with open(path, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,72 @@
+"""
+Compare two result files written by `python3 -m benchmarks`, e.g. from two commits, and flag regressions.
+
+Run from the distributed_db directory:
+    python3 -m benchmarks.compare <before.json> <after.json> [-t] <threshold %> [--fail]
+"""
+import argparse
+import json
+import sys
+
+
+# keys whose values should go up; every other timing should go down
+HIGHER_IS_BETTER = ('rows_per_sec', 'speedup')
+IGNORED = ('n', 'rows', 'users', 'shards', 'repeat', 'lookups', 'ranges', 'requests_per_route', 'batch_size', 'wall_seconds')
+
+
+def flatten(results, prefix: str = '') -> dict:
+    """
+    {'a.b.c': number} for every numeric leaf.
+    """
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(flatten(value, f'{prefix}.{key}' if prefix else str(key)))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix] = results
+    return flat
+
+
+def compare(before: dict, after: dict, threshold: float = 10.0) -> list[tuple]:
+    """
+    Returns:
+    \trows - (metric, before, after, change %, regressed) for every metric present in both runs.
+    """
+    old = flatten(before.get('benchmarks', before))
+    new = flatten(after.get('benchmarks', after))
+    rows = []
+    for metric in sorted(old.keys() & new.keys()):
+        if metric.rsplit('.', 1)[-1] in IGNORED or not old[metric]:
+            continue
+        change = (new[metric] - old[metric]) / old[metric] * 100
+        worse = -change if metric.rsplit('.', 1)[-1] in HIGHER_IS_BETTER else change
+        rows.append((metric, old[metric], new[metric], round(change, 1), worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('-t', '--threshold', type=float, default=10.0, help='Percent change counted as a regression')
+    parser.add_argument('--fail', action='store_true', help='Exit with status 1 if anything regressed')
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    print(f"before: {before.get('environment', {}).get('commit')}  after: {after.get('environment', {}).get('commit')}")
+    rows = compare(before, after, args.threshold)
+    for metric, old, new, change, regressed in rows:
+        print(f"{'REGRESSED' if regressed else '':9} {metric:70} {old:>12} {new:>12} {change:>+8.1f}%")
+
+    regressions = sum(1 for row in rows if row[-1])
+    print(f'{regressions} of {len(rows)} metrics regressed by more than {args.threshold}%')
+    if args.fail and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Fan-out read latency of the fandom breakdown (`cli.py breakdown`) as the number of shards grows: every shard is
+asked for its partial counts in parallel and the partials are merged. Measured both from the materialized
+FandomCounts and live from Preferences.
+
+Run from the distributed_db directory:
+    python3 -m benchmarks.fanout [-s] 2 4 8 16 32 64 [-u] <users>
+"""
+import argparse
+
+from benchmarks.common import LocalCluster, quiet, sample, summarize, write_results
+from db.aggregation import FandomBreakdown
+
+
+SHARD_COUNTS = [2, 4, 8, 16, 32, 64]
+
+
+def breakdown(dbm, metadata, use_counters: bool, **filters) -> list:
+    aggregate = FandomBreakdown(use_counters=use_counters, **filters)
+    query, params = aggregate.query()
+    for result in dbm.scatter_gather(query, params=params, metadata=metadata):
+        if result.error:
+            raise result.error
+        aggregate.add(result.value)
+    return aggregate.top()
+
+
+def run(shard_counts: list[int] = SHARD_COUNTS, num_users: int = 2000, repeat: int = 30) -> dict:
+    """
+    Parameters:
+    \tshard_counts - cluster sizes to measure.\n
+    \tnum_users - users spread over each cluster, with 3 preferences each.\n
+    \trepeat - timed breakdowns per cluster size and mode.\n
+    """
+    results = {'users': num_users, 'repeat': repeat, 'shards': {}}
+    for num_shards in shard_counts:
+        with LocalCluster(num_shards) as cluster:
+            cluster.populate(num_users)
+            metadata = cluster.metadata
+            timings = {}
+            with quiet():
+                for mode, use_counters in (('counters', True), ('live', False)):
+                    timings[f'{mode}_full_ms'] = summarize(sample(lambda: breakdown(cluster.dbm, metadata, use_counters), repeat))
+                    timings[f'{mode}_filtered_ms'] = summarize(sample(lambda: breakdown(cluster.dbm, metadata, use_counters, nba_type='team', level='favorite'), repeat))
+            results['shards'][str(num_shards)] = timings
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark breakdown fan-out latency over growing shard counts')
+    parser.add_argument('-s', '--shards', type=int, nargs='+', default=SHARD_COUNTS)
+    parser.add_argument('-u', '--users', type=int, default=2000)
+    parser.add_argument('-r', '--repeat', type=int, default=30)
+    parser.add_argument('-o', '--output', help='Write the JSON results to this file')
+    args = parser.parse_args()
+
+    write_results(run(args.shards, args.users, args.repeat), args.output)
+
+
+if __name__ == '__main__':
+    main()
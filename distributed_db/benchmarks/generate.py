@@ -0,0 +1,223 @@
+"""
+Synthetic Users, Preferences and Nba data at any scale, in the format of sample_data/.
+
+Creation dates are spread over the ranges of a metadata file, so every shard gets users. Preferences are skewed
+the way real fandom is: team and player popularity follow a Zipf distribution over a fixed popularity ranking, so
+a few teams (Lakers, Warriors, Celtics) have far more fans than the rest. Output is deterministic for a given seed.
+
+Run from the distributed_db directory:
+    python3 -m benchmarks.generate <users> [-m] <metadata> [-o] <out dir> [--insert] [--seed] <seed> [--skew] <s>
+    python3 -m benchmarks.generate 0 --sqlite-cluster 8 -o ./bench_cluster    # metadata for 8 local SQLite shards
+
+With --insert the data is written straight into the databases of the metadata file, in chunks, instead of JSON.
+"""
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Iterator
+import argparse
+import bisect
+import json
+import os
+import random
+
+from benchmarks.common import local_metadata, quiet
+from db.manager import DatabaseManager
+from db.store import MetadataStore, write_metadata
+
+
+# most followed first; bandwagon fans pick from the contenders first
+TEAMS_BY_POPULARITY = [
+    'Los Angeles Lakers', 'Golden State Warriors', 'Boston Celtics', 'Chicago Bulls', 'Miami Heat', 'New York Knicks',
+    'Cleveland Cavaliers', 'Philadelphia 76ers', 'Brooklyn Nets', 'Milwaukee Bucks', 'Dallas Mavericks',
+    'Houston Rockets', 'San Antonio Spurs', 'Toronto Raptors', 'Oklahoma City Thunder', 'Phoenix Suns',
+    'Denver Nuggets', 'LA Clippers', 'Portland Trail Blazers', 'Minnesota Timberwolves', 'Sacramento Kings',
+    'Memphis Grizzlies', 'New Orleans Pelicans', 'Atlanta Hawks', 'Orlando Magic', 'Indiana Pacers', 'Utah Jazz',
+    'Detroit Pistons', 'Charlotte Hornets', 'Washington Wizards'
+]
+CONTENDERS = [
+    'Boston Celtics', 'Denver Nuggets', 'Oklahoma City Thunder', 'Minnesota Timberwolves', 'New York Knicks',
+    'Milwaukee Bucks', 'Dallas Mavericks', 'Phoenix Suns', 'Los Angeles Lakers', 'Golden State Warriors'
+]
+PLAYERS_BY_POPULARITY = [
+    'LeBron James', 'Stephen Curry', 'Kevin Durant', 'Giannis Antetokounmpo', 'Nikola Jokic', 'Jayson Tatum',
+    'Joel Embiid', 'Anthony Edwards', 'Shai Gilgeous-Alexander', 'Ja Morant', 'Devin Booker', 'Jimmy Butler',
+    'Kawhi Leonard', 'Damian Lillard', 'Zion Williamson', 'Victor Wembanyama', 'Kyrie Irving', 'Anthony Davis',
+    'Jalen Brunson', 'Donovan Mitchell'
+]
+
+DATE_FORMAT = '%Y%m%d%H'
+
+
+class Zipf():
+    """
+    Draws items with probability proportional to 1 / rank^s.
+    """
+    def __init__(self, items: list, s: float, rng: random.Random) -> None:
+        self.items = items
+        self.cumulative = list(accumulate(1 / rank ** s for rank in range(1, len(items) + 1)))
+        self.rng = rng
+
+    def draw(self):
+        return self.items[bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+    def draw_distinct(self, k: int, exclude: set) -> list:
+        picked = []
+        for _ in range(k * 10):
+            if len(picked) == k:
+                break
+            item = self.draw()
+            if item not in exclude and item not in picked:
+                picked.append(item)
+        return picked
+
+
+def nba_rows() -> list[dict]:
+    return [{'name': name, 'type': 'team'} for name in TEAMS_BY_POPULARITY] + [{'name': name, 'type': 'player'} for name in PLAYERS_BY_POPULARITY]
+
+
+class DataGenerator():
+    """
+    Parameters:
+    \tranges - metadata["Ranges"]; user creation dates are spread over these ranges, up to the current hour.\n
+    \tseed - random seed.\n
+    \tskew - the Zipf exponent; 0 is uniform, higher is more skewed.\n
+    \trange_weights - 'uniform' (each range equally likely) or 'duration' (proportional to how long it lasted).\n
+    """
+    def __init__(self, ranges: dict, seed: int = 551, skew: float = 1.1, range_weights: str = 'uniform') -> None:
+        self.rng = random.Random(seed)
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        self.windows = []
+        for start, end in zip(ranges['Start'], ranges['End']):
+            first = datetime.strptime(str(start), DATE_FORMAT)
+            last = datetime.strptime(str(end), DATE_FORMAT) if end else now
+            self.windows.append((first, max(0, int((last - first).total_seconds() // 3600))))
+        weights = [hours + 1 for _, hours in self.windows] if range_weights == 'duration' else [1] * len(self.windows)
+        self.window_weights = list(accumulate(weights))
+
+        self.favorite_teams = Zipf(TEAMS_BY_POPULARITY, skew, self.rng)
+        self.bandwagon_teams = Zipf(CONTENDERS + [t for t in TEAMS_BY_POPULARITY if t not in CONTENDERS], skew, self.rng)
+        self.rival_teams = Zipf(TEAMS_BY_POPULARITY, skew, self.rng)
+        self.players = Zipf(PLAYERS_BY_POPULARITY, skew, self.rng)
+
+    def date(self) -> int:
+        first, hours = self.windows[bisect.bisect(self.window_weights, self.rng.random() * self.window_weights[-1])]
+        return int((first + timedelta(hours=self.rng.randint(0, hours))).strftime(DATE_FORMAT))
+
+    def user(self, index: int) -> dict:
+        return {'user': f'fan{index}', 'date': self.date(), 'password': f'pw{self.rng.getrandbits(32):08x}'}
+
+    def preferences(self, user: dict) -> list[dict]:
+        """
+        One user's preferences: usually one favorite team, a few bandwagon and rival teams and favorite players.
+        An entity gets at most one preference per user, as in the web UI.
+        """
+        rng = self.rng
+        taken = set()
+        picks = []
+        for generator, level, count in (
+            (self.favorite_teams, 'favorite', 1 if rng.random() < 0.9 else 2),
+            (self.bandwagon_teams, 'bandwagon', rng.choice([0, 0, 1, 1, 2])),
+            (self.rival_teams, 'rival', rng.choice([0, 1, 1, 2, 3])),
+            (self.players, 'favorite', rng.choice([0, 1, 1, 2, 3]))
+        ):
+            for name in generator.draw_distinct(count, taken):
+                taken.add(name)
+                picks.append({'user': user['user'], 'date': user['date'], 'nba_entity': name, 'preference': level})
+        return picks
+
+    def generate(self, num_users: int, offset: int = 0) -> Iterator[tuple[dict, list[dict]]]:
+        for index in range(offset, offset + num_users):
+            user = self.user(index)
+            yield user, self.preferences(user)
+
+
+class JsonArrayWriter():
+    """
+    Writes a JSON list one record at a time, so millions of rows never sit in memory.
+    """
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'w')
+        self.file.write('[')
+        self.count = 0
+
+    def write(self, record: dict) -> None:
+        self.file.write((',\n' if self.count else '\n') + json.dumps(record))
+        self.count += 1
+
+    def close(self) -> None:
+        self.file.write('\n]\n')
+        self.file.close()
+
+
+def write_json(generator: DataGenerator, num_users: int, out_dir: str) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'nba.json'), 'w') as file:
+        json.dump(nba_rows(), file, indent=4)
+
+    users = JsonArrayWriter(os.path.join(out_dir, 'users.json'))
+    prefs = JsonArrayWriter(os.path.join(out_dir, 'prefs.json'))
+    try:
+        for user, preferences in generator.generate(num_users):
+            users.write(user)
+            for preference in preferences:
+                prefs.write(preference)
+    finally:
+        users.close()
+        prefs.close()
+    return {'users': users.count, 'prefs': prefs.count, 'nba': len(nba_rows()), 'out_dir': out_dir}
+
+
+def insert(generator: DataGenerator, num_users: int, metadata_path: str, chunk_size: int = 10000, offset: int = 0) -> dict:
+    """
+    Write the data straight into the databases of the metadata file with insert_many, `chunk_size` users at a time.
+    """
+    dbm = DatabaseManager(metadata_path)
+    metadata = dbm.read_metadata()
+    totals = {'users': 0, 'prefs': 0, 'errors': 0}
+    try:
+        with quiet():
+            dbm.insert_many('nba', nba_rows(), metadata=metadata)
+            stream = generator.generate(num_users, offset)
+            while True:
+                chunk = [pair for _, pair in zip(range(chunk_size), stream)]
+                if not chunk:
+                    break
+                for table, records in (('users', [u for u, _ in chunk]), ('prefs', [p for _, ps in chunk for p in ps])):
+                    report = dbm.insert_many(table, records, metadata=metadata)
+                    totals[table] += report['inserted']
+                    totals['errors'] += len(report['errors']) + len(report['duplicates']) + len(report['missing_references'])
+    finally:
+        dbm.close()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate skewed synthetic users, preferences and NBA entities')
+    parser.add_argument('users', type=int, help='Number of users to generate')
+    parser.add_argument('-m', '--metadata', default='./db/metadata/metadata_local.json', help='Metadata whose ranges the creation dates are spread over')
+    parser.add_argument('-o', '--out-dir', default='./generated_data', help='Where to write users.json, prefs.json and nba.json')
+    parser.add_argument('--insert', action='store_true', help='Insert into the databases of the metadata file instead of writing JSON')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Users per insert_many call with --insert')
+    parser.add_argument('--offset', type=int, default=0, help='Index of the first user, to add more users to an existing dataset')
+    parser.add_argument('--seed', type=int, default=551)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of team and player popularity (0 = uniform)')
+    parser.add_argument('--range-weights', choices=['uniform', 'duration'], default='uniform')
+    parser.add_argument('--sqlite-cluster', type=int, metavar='SHARDS', help='First write metadata for this many SQLite shards (files in the output directory) and use it')
+    args = parser.parse_args()
+
+    metadata_path = args.metadata
+    if args.sqlite_cluster:
+        os.makedirs(args.out_dir, exist_ok=True)
+        metadata_path = os.path.join(args.out_dir, 'metadata.json')
+        write_metadata(metadata_path, local_metadata(os.path.abspath(args.out_dir), args.sqlite_cluster))
+        print(f'Wrote metadata for {args.sqlite_cluster} SQLite shards to {metadata_path}')
+
+    generator = DataGenerator(MetadataStore(metadata_path).get()['Ranges'], seed=args.seed, skew=args.skew, range_weights=args.range_weights)
+    if args.insert:
+        print(insert(generator, args.users, metadata_path, args.chunk_size, args.offset))
+    elif args.users:
+        print(write_json(generator, args.users, args.out_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Write throughput on local SQLite shards: insert_one (one row, one transaction) versus insert_many (rows grouped by
+shard, multi-row INSERTs, one transaction per shard), for users and preferences.
+
+Run from the distributed_db directory:
+    python3 -m benchmarks.inserts [-u] <users> [-s] <shards> [--on-disk]
+"""
+import argparse
+import time
+
+from benchmarks.common import LocalCluster, quiet, summarize, write_results
+
+
+def run(num_users: int = 2000, num_shards: int = 4, on_disk: bool = False, single: int = 200) -> dict:
+    """
+    Parameters:
+    \tnum_users - users (and 3x as many preferences) written with insert_many.\n
+    \tnum_shards - shards in the cluster.\n
+    \ton_disk - SQLite files instead of in-memory shards.\n
+    \tsingle - rows written one at a time with insert_one.\n
+    """
+    results = {'users': num_users, 'shards': num_shards, 'on_disk': on_disk}
+
+    with LocalCluster(num_shards, on_disk=on_disk) as cluster:
+        metadata = cluster.metadata
+
+        singles = cluster.users(single, prefix='single')
+        latencies = []
+        with quiet():
+            for record in singles:
+                credentials = metadata['Connections'][cluster.dbm.locate_db(metadata, record['date'], record['user'])]
+                start = time.perf_counter()
+                cluster.dbm.insert_one(record, 'users', credentials)
+                latencies.append(time.perf_counter() - start)
+        results['insert_one_users'] = {
+            'rows_per_sec': round(len(latencies) / sum(latencies), 1),
+            'latency_ms': summarize(latencies)
+        }
+
+        users = cluster.users(num_users)
+        preferences = cluster.preferences(users)
+        for table, records in (('users', users), ('prefs', preferences)):
+            with quiet():
+                start = time.perf_counter()
+                report = cluster.dbm.insert_many(table, records, metadata=metadata)
+                elapsed = time.perf_counter() - start
+            results[f'insert_many_{table}'] = {
+                'rows': report['inserted'],
+                'seconds': round(elapsed, 4),
+                'rows_per_sec': round(report['inserted'] / elapsed, 1)
+            }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark single and bulk inserts on local shards')
+    parser.add_argument('-u', '--users', type=int, default=2000)
+    parser.add_argument('-s', '--shards', type=int, default=4)
+    parser.add_argument('--on-disk', action='store_true', help='Use SQLite files instead of in-memory shards')
+    parser.add_argument('-o', '--output', help='Write the JSON results to this file')
+    args = parser.parse_args()
+
+    write_results(run(args.users, args.shards, args.on_disk), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Open-loop load driver for a running api.py: replays a mix of login, save, get and delete requests at a target
+request rate and reports p50/p99 latency and errors per operation.
+
+Requests are started on a fixed schedule (rate per second) whether or not earlier ones have finished, and latency
+is measured from the scheduled start. A server that falls behind therefore shows up as growing latency instead of
+a silently lower request rate.
+
+Run from the distributed_db directory, with the API running (e.g. on a local SQLite cluster):
+    python3 -m benchmarks.generate 10000 --sqlite-cluster 8 -o ./bench_cluster --insert -m ./bench_cluster/metadata.json
+    DISTRIBUTED_DB_METADATA=./bench_cluster/metadata.json hypercorn api:app -b 127.0.0.1:5000
+    python3 -m benchmarks.load [--rate] 200 [--duration] 30 [--mix] login=1,save=2,get=6,delete=1 [--users-file] <users.json>
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Optional
+import argparse
+import json
+import random
+import threading
+import time
+
+import requests
+
+from benchmarks.common import environment, summarize, write_results
+from benchmarks.generate import DataGenerator, TEAMS_BY_POPULARITY
+
+
+DEFAULT_MIX = 'login=1,save=2,get=6,delete=1'
+CATEGORIES = {
+    ('team', 'favorite'): 'favorite_teams',
+    ('team', 'bandwagon'): 'bandwagon_teams',
+    ('team', 'rival'): 'rival_teams',
+    ('player', 'favorite'): 'favorite_players'
+}
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(','):
+        op, weight = part.split('=')
+        if op not in ('login', 'save', 'get', 'delete'):
+            raise ValueError(f'Unknown operation {op}')
+        weights[op] = float(weight)
+    return weights
+
+
+class LoadDriver():
+    """
+    Parameters:
+    \turl - base URL of the API.\n
+    \tusers - [{'user', 'password', 'date'}] to act as. They are logged in before the run (warmup).\n
+    \tmix - {operation: weight} for 'login', 'save', 'get' and 'delete'.\n
+    \trate - requests started per second.\n
+    \tduration - seconds to run for.\n
+    \tconcurrency - max requests in flight; further requests queue (and their latency grows).\n
+    """
+    def __init__(self, url: str, users: list[dict], mix: dict, rate: float, duration: float, concurrency: int = 64, seed: int = 551) -> None:
+        self.url = url.rstrip('/')
+        self.users = users
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.preferences = DataGenerator({'Start': [2024010100], 'End': [None]}, seed=seed)
+        self.timestamps = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.latencies = {op: [] for op in mix}
+        self.errors = {op: {} for op in mix}
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _payload(self, user: dict) -> dict:
+        with self._lock:
+            picks = self.preferences.preferences(user)
+        payload = {category: [] for category in CATEGORIES.values()}
+        for pick in picks:
+            nba_type = 'team' if pick['nba_entity'] in TEAMS_BY_POPULARITY else 'player'
+            payload[CATEGORIES[(nba_type, pick['preference'])]].append(pick['nba_entity'])
+        return payload
+
+    def request(self, op: str, user: dict) -> requests.Response:
+        session = self._session()
+        timestamp = self.timestamps.get(user['user'], user['date'])
+        if op == 'login':
+            response = session.post(f'{self.url}/login', json={'username': user['user'], 'password': user['password'], 'date': str(user['date'])})
+            if response.ok:
+                self.timestamps[user['user']] = response.json().get('timestamp', user['date'])
+            return response
+        if op == 'save':
+            return session.post(f'{self.url}/api/save_preferences', json={'username': user['user'], 'timestamp': timestamp, **self._payload(user)})
+        if op == 'get':
+            return session.get(f"{self.url}/api/preferences/{user['user']}", params={'timestamp': timestamp})
+        return session.post(f'{self.url}/api/delete_preferences', json={'username': user['user'], 'timestamp': timestamp})
+
+    def _execute(self, op: str, user: dict, scheduled: float) -> None:
+        try:
+            response = self.request(op, user)
+            error = None if response.status_code < 400 else f'HTTP {response.status_code}'
+        except requests.RequestException as err:
+            error = type(err).__name__
+        latency = time.perf_counter() - scheduled
+        with self._lock:
+            if error is None:
+                self.latencies[op].append(latency)
+            else:
+                self.errors[op][error] = self.errors[op].get(error, 0) + 1
+
+    def warmup(self) -> int:
+        """
+        Log every user in once, untimed, so the saves, gets and deletes act on users that exist.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            responses = list(executor.map(lambda user: self.request('login', user), self.users))
+        return sum(1 for response in responses if response.ok)
+
+    def run(self) -> dict:
+        ops = list(self.mix)
+        weights = [self.mix[op] for op in ops]
+        total = int(self.rate * self.duration)
+        futures = []
+        late = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='load')
+        start = time.perf_counter()
+        for k in range(total):
+            scheduled = start + k / self.rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.01:
+                late += 1
+            op = self.rng.choices(ops, weights)[0]
+            futures.append(executor.submit(self._execute, op, self.rng.choice(self.users), scheduled))
+        wait(futures)
+        executor.shutdown()
+        elapsed = time.perf_counter() - start
+
+        operations = {}
+        for op in ops:
+            errors = sum(self.errors[op].values())
+            operations[op] = {
+                'requests': len(self.latencies[op]) + errors,
+                'errors': errors,
+                'error_kinds': self.errors[op],
+                'latency_ms': summarize(self.latencies[op])
+            }
+        all_latencies = [latency for op in ops for latency in self.latencies[op]]
+        return {
+            'target_rate': self.rate,
+            'achieved_rate': round(total / elapsed, 1),
+            'requests': total,
+            'errors': sum(o['errors'] for o in operations.values()),
+            'late_starts': late,
+            'seconds': round(elapsed, 2),
+            'latency_ms': summarize(all_latencies),
+            'operations': operations
+        }
+
+
+def load_users(path: Optional[str], count: int) -> list[dict]:
+    if path:
+        with open(path) as file:
+            return json.load(file)[:count]
+    date = int(datetime.now().strftime('%Y%m%d%H'))
+    return [{'user': f'load{i}', 'password': 'password', 'date': date} for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a login/save/get/delete mix against api.py at a target rate')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--rate', type=float, default=50, help='Requests started per second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run for')
+    parser.add_argument('--concurrency', type=int, default=64, help='Max requests in flight')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Operation weights, e.g. login=1,save=2,get=6,delete=1')
+    parser.add_argument('--users', type=int, default=1000, help='Number of users to act as')
+    parser.add_argument('--users-file', help='users.json from benchmarks.generate; by default new load<i> users are created')
+    parser.add_argument('--no-warmup', action='store_true', help='Skip logging every user in before the run')
+    parser.add_argument('--seed', type=int, default=551)
+    parser.add_argument('-o', '--output', help='Write the JSON results to this file')
+    args = parser.parse_args()
+
+    driver = LoadDriver(args.url, load_users(args.users_file, args.users), parse_mix(args.mix), args.rate, args.duration, args.concurrency, args.seed)
+    if not args.no_warmup:
+        print(f'Warmup: {driver.warmup()} of {len(driver.users)} users logged in')
+    results = driver.run()
+
+    print(f"{results['requests']} requests in {results['seconds']} sec ({results['achieved_rate']}/sec, target {results['target_rate']}/sec), {results['errors']} errors, {results['late_starts']} late starts")
+    for op, stats in results['operations'].items():
+        latency = stats['latency_ms']
+        print(f"{op:8} {stats['requests']:>7} requests {stats['errors']:>5} errors   p50 {latency.get('p50', '-'):>9} ms   p99 {latency.get('p99', '-'):>9} ms")
+    if args.output:
+        write_results({'environment': environment(), 'url': args.url, 'mix': args.mix, 'load': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Request latency of every API route, served in-process by the Quart test client against local SQLite shards. This
+measures the handlers (routing, pools, queries, caches) without network or HTTP server overhead.
+
+Run from the distributed_db directory:
+    python3 -m benchmarks.routes [-n] <requests per route> [-s] <shards>
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import LocalCluster, NBA_ROWS, quiet, summarize, write_results
+from db.async_manager import AsyncDatabaseManager
+
+
+async def _time(samples: list, request) -> object:
+    start = time.perf_counter()
+    response = await request
+    samples.append(time.perf_counter() - start)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.status_code}: {await response.get_data(as_text=True)}')
+    return response
+
+
+async def _run_routes(api, cluster: LocalCluster, requests: int, batch_size: int) -> dict:
+    client = api.app.test_client()
+    date = str(cluster.start)
+    teams = [row['name'] for row in NBA_ROWS if row['type'] == 'team']
+    players = [row['name'] for row in NBA_ROWS if row['type'] == 'player']
+    samples = {route: [] for route in (
+        'login_new', 'login_returning', 'save_preferences', 'get_preferences_cold', 'get_preferences_cached',
+        'get_preferences_not_modified', 'batch_preferences', 'delete_preferences', 'bulk_insert_users'
+    )}
+
+    for i in range(requests):
+        username = f'api{i}'
+        login = {'username': username, 'password': 'password', 'date': date}
+        await _time(samples['login_new'], client.post('/login', json=login))
+        await _time(samples['login_returning'], client.post('/login', json=login))
+
+        preferences = {
+            'username': username, 'timestamp': date,
+            'favorite_teams': [teams[i % len(teams)]], 'bandwagon_teams': [teams[(i + 1) % len(teams)]],
+            'rival_teams': [teams[(i + 2) % len(teams)]], 'favorite_players': players[:1 + i % len(players)]
+        }
+        await _time(samples['save_preferences'], client.post('/api/save_preferences', json=preferences))
+
+        url = f'/api/preferences/{username}?timestamp={date}'
+        api.preference_docs.pop(username)
+        response = await _time(samples['get_preferences_cold'], client.get(url))
+        await _time(samples['get_preferences_cached'], client.get(url))
+        await _time(samples['get_preferences_not_modified'], client.get(url, headers={'If-None-Match': response.headers['ETag']}))
+
+    users = [{'username': f'api{i}', 'timestamp': date} for i in range(min(batch_size, requests))]
+    for _ in range(requests):
+        for user in users:
+            api.preference_docs.pop(user['username'])
+        response = await _time(samples['batch_preferences'], client.post('/api/preferences/batch', json=users))
+        await response.get_data()
+
+    for i in range(requests):
+        await _time(samples['delete_preferences'], client.post('/api/delete_preferences', json={'username': f'api{i}', 'timestamp': date}))
+        records = [{'user': f'bulk{i}_{j}', 'password': 'password', 'date': cluster.start} for j in range(100)]
+        await _time(samples['bulk_insert_users'], client.post('/api/bulk_insert/users', json=records))
+
+    return {route: summarize(durations) for route, durations in samples.items()}
+
+
+def run(requests: int = 100, num_shards: int = 4, batch_size: int = 100) -> dict:
+    """
+    Parameters:
+    \trequests - timed requests per route.\n
+    \tnum_shards - shards in the cluster.\n
+    \tbatch_size - users per /api/preferences/batch request.\n
+    """
+    import api
+
+    with LocalCluster(num_shards) as cluster:
+        cluster.populate(1000)
+        original = api.dbm
+        api.dbm = AsyncDatabaseManager(cluster.metadata_path, manager=cluster.dbm)
+        try:
+            with quiet():
+                routes = asyncio.run(_run_routes(api, cluster, requests, batch_size))
+        finally:
+            api.dbm = original
+            api.login_homes.clear()
+            api.preference_docs.clear()
+
+    return {'requests_per_route': requests, 'shards': num_shards, 'batch_size': batch_size, 'routes_ms': routes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark API route latency on local shards')
+    parser.add_argument('-n', '--requests', type=int, default=100)
+    parser.add_argument('-s', '--shards', type=int, default=4)
+    parser.add_argument('-b', '--batch-size', type=int, default=100)
+    parser.add_argument('-o', '--output', help='Write the JSON results to this file')
+    args = parser.parse_args()
+
+    write_results(run(args.requests, args.shards, args.batch_size), args.output)
+
+
+if __name__ == '__main__':
+    main()
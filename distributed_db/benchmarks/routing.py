@@ -0,0 +1,130 @@
+"""
+Micro-benchmark for shard routing: the compiled RoutingTable behind DatabaseManager.locate_db versus the
+original per-call zip + binary search, and DatabaseManager.calculate_hash for every hash function.
+
+Run from the distributed_db directory:
+    python3 -m benchmarks.routing [-n] <lookups> [-r] <ranges>
+"""
+from datetime import datetime
+import argparse
+import random
+import timeit
+
+from db.manager import DatabaseManager
+from db.exceptions import DateOutOfRangeError, UnknownHashError
+from db.hashing import HASH_FUNCTIONS, get_hash_function
+
+
+def legacy_locate_db(dbm: DatabaseManager, metadata: dict, data_date: int, user_name: str) -> str:
+    """
+    locate_db as it was before the routing table, kept here as the baseline (with the binary search bound fixed to
+    len - 1 so it cannot index past the end).
+    """
+    available_partitions = list(
+        zip(
+            metadata["Ranges"]["Start"],
+            metadata["Ranges"]["End"],
+            metadata["Ranges"]["Moduli"]
+        )
+    )
+
+    now = datetime.now()
+    today = int(now.strftime("%Y%m%d%H"))
+
+    if data_date > today:
+        raise DateOutOfRangeError("This date is in the future.", data_date)
+    elif data_date < available_partitions[0][0]:
+        raise DateOutOfRangeError("This date was prior to the initiation of the database system.", data_date)
+    elif data_date > available_partitions[-1][0]:
+        target_range_index = -1
+    else:
+        left = 0
+        right = len(available_partitions) - 1
+        while left <= right:
+            mid = (right + left) // 2
+            db_start_date = available_partitions[mid][0]
+            db_end_date = available_partitions[mid][1] if available_partitions[mid][1] else today
+            if data_date < db_start_date:
+                right = mid - 1
+            elif data_date > db_end_date:
+                left = mid + 1
+            else:
+                target_range_index = mid
+                break
+
+    modulus = available_partitions[target_range_index][2]
+    db_range_value = available_partitions[target_range_index][0]
+    db_hash_value = dbm.calculate_hash(user=user_name, modulus=modulus)
+    return f'r{db_range_value}h{db_hash_value}'
+
+
+def synthetic_metadata(num_ranges: int, start: int = 2024010100) -> dict:
+    """
+    Metadata with `num_ranges` back-to-back ranges, each one hour long.
+    """
+    starts = [start + i * 2 for i in range(num_ranges)]
+    ends = [s + 1 for s in starts[:-1]] + [None]
+    moduli = [random.randint(2, 8) for _ in starts]
+    return {'Ranges': {'Start': starts, 'End': ends, 'Moduli': moduli}, 'Connections': {}}
+
+
+def hash_timings(dbm: DatabaseManager, calls: int, modulus: int = 16) -> dict:
+    """
+    ns per calculate_hash call for every available hash function.
+    """
+    users = [f'user{i}' for i in range(1024)]
+    timings = {}
+    for name in HASH_FUNCTIONS:
+        try:
+            get_hash_function(name)
+        except UnknownHashError:
+            continue    # xxhash is optional
+
+        def loop():
+            for i in range(calls):
+                dbm.calculate_hash(users[i & 1023], modulus, name)
+        timings[name] = round(min(timeit.repeat(loop, number=1, repeat=3)) / calls * 1e9, 1)
+    return timings
+
+
+def run(lookups: int = 200_000, num_ranges: int = 64) -> dict:
+    dbm = DatabaseManager(metadata_path=None)
+    metadata = synthetic_metadata(num_ranges)
+    starts = metadata['Ranges']['Start']
+    keys = [(random.choice(starts) + random.randint(0, 1), f'user{i}') for i in range(1024)]
+
+    for date, user in keys:
+        assert dbm.locate_db(metadata, date, user) == legacy_locate_db(dbm, metadata, date, user)
+
+    def bench(fn) -> float:
+        def loop():
+            for i in range(lookups):
+                date, user = keys[i & 1023]
+                fn(metadata, date, user)
+        return min(timeit.repeat(loop, number=1, repeat=3)) / lookups * 1e9
+
+    legacy_ns = bench(lambda m, d, u: legacy_locate_db(dbm, m, d, u))
+    compiled_ns = bench(dbm.locate_db)
+
+    return {
+        'lookups': lookups,
+        'ranges': num_ranges,
+        'legacy_ns_per_lookup': round(legacy_ns, 1),
+        'compiled_ns_per_lookup': round(compiled_ns, 1),
+        'speedup': round(legacy_ns / compiled_ns, 2),
+        'hash_ns_per_call': hash_timings(dbm, lookups)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DatabaseManager.locate_db')
+    parser.add_argument('-n', '--lookups', type=int, default=200_000)
+    parser.add_argument('-r', '--ranges', type=int, default=64)
+    args = parser.parse_args()
+
+    for key, value in run(args.lookups, args.ranges).items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,28 +3,45 @@ import json
 from typing import Optional
 from db.provisioner import DatabaseProvisioner
 from db.manager import DatabaseManager
+from db.executor import critical_path
+from db.hashing import HASH_FUNCTIONS
+from db.aggregation import FandomBreakdown
+from db.resharding import RangeResharder
 from db.exceptions import DateOutOfRangeError, EmptyMetadataError, DuplicateDataError
-from constants import METADATA_LOCAL, TERRAFORM_DIR, AZURE_METADATA_PATH, METADATA_COPY
+from db.metrics import parse_text, histogram_quantile
+from db.profiling import Profiler
+from db.constants import PROFILE_DIR, CAPACITY_LIMIT_MB
+from constants import METADATA_LOCAL, TERRAFORM_DIR, AZURE_METADATA_PATH, METADATA_COPY, SELECT_PAGE_SIZE, API_URL
 from pprint import pprint
+from itertools import islice
+from urllib.request import urlopen
 import argparse
+import sys
 import pymysql
 import pandas as pd
 from tabulate import tabulate
 
 md = AZURE_METADATA_PATH
 
-dbp = DatabaseProvisioner(md, TERRAFORM_DIR)
 dbm = DatabaseManager(md)
+dbp = DatabaseProvisioner(md, TERRAFORM_DIR, capacity=dbm.capacity)
+resharder = RangeResharder(dbm, md)
 
 def init_parsers():
     parser = argparse.ArgumentParser(description='Distributed DB Management CLI Tool')
+    # python3 cli.py --profile [--profile-dir] <dir> <command> ...
+    parser.add_argument('--profile', action='store_true', help='Profile the command with cProfile and write it to --profile-dir (pstats, collapsed stacks and tags)')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR, help='Where --profile writes profiles')
+    parser.add_argument('--profile-min-ms', type=float, default=0, help='Only keep the profile if the command took at least this long')
     subparsers = parser.add_subparsers(dest='command')
     
-    # python3 cli.py insert <table> [-j] <json file> [-d] <manual input>
-    insert_parser = subparsers.add_parser('insert', help='Insert records across tables in the distributed database.', usage='python3 cli.py insert <table> [-j] <json file> [-d] <manual input>')
+    # python3 cli.py insert <table> [-j] <json file> [-d] <manual input> [-b] <batch size>
+    insert_parser = subparsers.add_parser('insert', help='Insert records across tables in the distributed database.', usage='python3 cli.py insert <table> [-j] <json file> [-d] <manual input> [-b] <batch size>')
     insert_parser.add_argument('table', choices=['users', 'prefs', 'nba'], help='Name of the table')
     insert_parser.add_argument('-j', '--json', required=False, help='Indicates the data is a JSON file name')
     insert_parser.add_argument('-d', '--data', nargs='+', required=False, type=str, help='Indicates that user will type out all records to insert')
+    insert_parser.add_argument('-b', '--batch-size', type=int, required=False, help='Max number of rows per INSERT statement')
+    insert_parser.add_argument('--upsert', action='store_true', help='nba only: overwrite rows that already exist instead of skipping them')
     
     # python3 cli.py delete <table> [-d] <database> [-c] <condition>
     delete_parser = subparsers.add_parser('delete', help='Delete records across tables in the distributed database.', usage='python3 cli.py delete <table> [-d] <database> [-c] <condition>')
@@ -45,98 +62,120 @@ def init_parsers():
     select_parser.add_argument('-n', '--nbaType', type=str, choices=['teams', 'players'], help='Select Nba teams, or players')
     # select_parser.add_argument('-j', '--join', type)
 
-    # python3 cli.py breakdown [--type] <team | player> [--level] <fandom level> [--name] <name>
-    breakdown_parser = subparsers.add_parser('breakdown', help='Show the breakdown of fandoms stored in the distributed database', usage='python3 cli.py count [--type] <team | player> [--level] <fandom level> [--name] <name>')
+    # python3 cli.py breakdown [--type] <team | player> [--level] <fandom level> [--name] <name> [--top] <k>
+    breakdown_parser = subparsers.add_parser('breakdown', help='Show the breakdown of fandoms stored in the distributed database', usage='python3 cli.py count [--type] <team | player> [--level] <fandom level> [--name] <name> [--top] <k>')
     breakdown_parser.add_argument('--type', choices=['team', 'player'], required=False)
     breakdown_parser.add_argument('--level', choices=['favorite', 'bandwagon', 'rival', 'hates'], required=False)
     breakdown_parser.add_argument('--name', required=False)
+    breakdown_parser.add_argument('--top', type=int, required=False, help='Only show the k largest fandoms')
+    breakdown_parser.add_argument('--live', action='store_true', help='Count the Preferences tables instead of reading the fandom counters')
     
     # python3 cli.py user <user>
     user_parser = subparsers.add_parser('user', help='Shows all data associated with a user name.')
     user_parser.add_argument('user')
     
+    # python3 cli.py directory <rebuild | lookup> [user]
+    directory_parser = subparsers.add_parser('directory', help='Rebuild the user directory, or look up the shard a user lives on.', usage='python3 cli.py directory <rebuild | lookup> [user]')
+    directory_parser.add_argument('action', choices=['rebuild', 'lookup'])
+    directory_parser.add_argument('user', nargs='?')
+    
+    # python3 cli.py counters rebuild [-d] <database>
+    counters_parser = subparsers.add_parser('counters', help='Recompute the materialized fandom counters from the Preferences tables.', usage='python3 cli.py counters rebuild [-d] <database>')
+    counters_parser.add_argument('action', choices=['rebuild'])
+    counters_parser.add_argument('-d', '--database', help='Only rebuild this database', required=False)
+    
     # python3 cli.py metadata <metadata>
     metadata_parser = subparsers.add_parser('metadata', help='Displays the metadata for the distributed database')
     metadata_parser.add_argument('-v', '--verbose', required=False, action='store_true')
+    metadata_parser.add_argument('--refresh', action='store_true', help='Poll the size of every database instead of showing the last snapshot')
     # metadata_parser.add_argument('metadata')
     
-    # python3 cli.py init <num_dbs>
-    init_parser = subparsers.add_parser('init', usage='python3 cli.py init <num_dbs>')
+    # python3 cli.py capacity [--refresh]
+    capacity_parser = subparsers.add_parser('capacity', help='Shows the size of every database, its growth rate and the projected days until it is full.', usage='python3 cli.py capacity [--refresh]')
+    capacity_parser.add_argument('--refresh', action='store_true', help='Poll every database now instead of only those with a stale sample')
+    
+    # python3 cli.py init <num_dbs> [--hash] <hash function>
+    init_parser = subparsers.add_parser('init', usage='python3 cli.py init <num_dbs> [--hash] <hash function>')
     init_parser.add_argument('dbs', type=int)
+    init_parser.add_argument('--hash', choices=list(HASH_FUNCTIONS), required=False, help='Hash function used to place users within the first range')
     
     # python3 cli.py destroy
     destroy_parser = subparsers.add_parser('destroy')
     
-    # python3 cli.py expand <num_dbs>
+    # python3 cli.py expand <num_dbs> [--hash] <hash function>
     expand_parser = subparsers.add_parser('expand', help='Adds new set of databases to the distributed database')
     expand_parser.add_argument('num_dbs', type=int, help='Number of databases in this range')
+    expand_parser.add_argument('--hash', choices=list(HASH_FUNCTIONS), required=False, help='Hash function used to place users within the new range')
+    
+    # python3 cli.py reshard <range start> <modulus> [--dry-run]
+    reshard_parser = subparsers.add_parser('reshard', help='Split an existing range over more databases, moving its users online.', usage='python3 cli.py reshard <range start> <modulus> [--dry-run]')
+    reshard_parser.add_argument('range_start', type=int, help='Start of the range to split, as YYYYMMDDHH')
+    reshard_parser.add_argument('modulus', type=int, help='New number of databases in the range')
+    reshard_parser.add_argument('--dry-run', action='store_true', help='Only estimate the rows that would move')
+    
+    # python3 cli.py stats [--url] <api url> [--raw]
+    stats_parser = subparsers.add_parser('stats', help='Summarize the /metrics of a running API: latency per shard and route, errors and pools.', usage='python3 cli.py stats [--url] <api url> [--raw]')
+    stats_parser.add_argument('--url', default=API_URL, help='Base URL of the running API')
+    stats_parser.add_argument('--raw', action='store_true', help='Print the metrics as served, in the Prometheus text format')
     
 
     return parser
     
 
-def insert(table, data: list[dict]):
+def insert(table, data: list[dict], batch_size: Optional[int] = None, upsert: bool = False):
     """
     nba: inserts all data into all databases
     user/prefs: partitions
+    
+    Records are grouped by shard and bulk inserted, one transaction per shard.
     """
     metadata = dbm.read_metadata()
     
     if table == 'nba':
-        for db in metadata['Connections']:
-            for item in data:
-                try:
-                    dbm.insert_one(item, table, metadata['Connections'][db])
-                except DuplicateDataError as err:
-                    msg = f'Duplicate entry for {item}'
-                    print(msg)
-            
-    elif table == 'users':
-        """
-        for item in data:
-            creds = dbm.locate_db()
-                dbm.insert_one(item, 'users', creds)
-        """
-        for record in data:
-            try:
-                # print(record)
-                username = record['user']
-                date = record['date']
-                db = dbm.locate_db(metadata, date, username)
-                dbm.insert_one(record, table, metadata['Connections'][db])
-            except DuplicateDataError as err:
-                    msg = f'Duplicate entry for {record}'
-                    print(msg)
-            except KeyError as err:
-                print(err)
-                print('Insert a record in the form of {"user": <user>, "date": <date>, "password": <password>}')
-            # except pymysql.err.IntegrityError as err:
-            #     print(err)
-
-    elif table == 'prefs':
-        """
-        for item in data:
-            creds = dbm.locate_db()
-                dbm.insert_one(item, 'prefs', creds)
-        """
-        for record in data:
-            try:
-                print(f'{table.upper()}: {record}')
-                username = record['user']
-                date = record['date']
-                db = dbm.locate_db(metadata, date, username)
-                dbm.insert_one(record, table, metadata['Connections'][db])
-            except DuplicateDataError as err:
-                    msg = f'Duplicate entry for {record}'
-                    print(msg)
-            except KeyError as err:
-                print('Insert a record in the form of {"user": <user>, "date": <date>, "nba_entity": <nba_entity>, "preference": <preference>}')
-                raise err
-            except pymysql.err.IntegrityError as err:
-                if err.args[0] == 1452:
-                    print('Please insert user or nba data first before inserting preferences.')
+        return broadcast(table, data, batch_size=batch_size, upsert=upsert)
+    
+    if batch_size:
+        report = dbm.insert_many(table, data, metadata=metadata, batch_size=batch_size)
+    else:
+        report = dbm.insert_many(table, data, metadata=metadata)
+    
+    print(f"{report['inserted']} rows inserted across {len(report['per_shard'])} DBs")
+    
+    for db, record in report['duplicates']:
+        print(f'Duplicate entry for {record} -- DB {db}')
+    
+    for db, record in report['missing_references']:
+        print(f'Please insert user or nba data first before inserting preferences. {record} -- DB {db}')
+    
+    for db, record, reason in report['errors']:
+        print(f'Could not insert {record}: {reason}')
+        if table == 'users':
+            print('Insert a record in the form of {"user": <user>, "date": <date>, "password": <password>}')
+        elif table == 'prefs':
+            print('Insert a record in the form of {"user": <user>, "date": <date>, "nba_entity": <nba_entity>, "preference": <preference>}')
+    
+    return report
                    
                     
+def broadcast(table, data: list[dict], batch_size: Optional[int] = None, upsert: bool = False):
+    """
+    Write reference data to every database in parallel, skipping (or with upsert, overwriting) rows that exist.
+    """
+    try:
+        if batch_size:
+            report = dbm.broadcast_insert(table, data, upsert=upsert, batch_size=batch_size)
+        else:
+            report = dbm.broadcast_insert(table, data, upsert=upsert)
+    except KeyError as err:
+        print(f'Could not insert: missing field {err}')
+        print('Insert a record in the form of {"name": <name>, "type": <team | player>}')
+        return None
+    
+    rows = [(db, r['written'], r['skipped'], f"{r['elapsed']:.3f}", r['error'] or 'OK') for db, r in report.items()]
+    print(tabulate(rows, headers=['DB', 'Written', 'Skipped', 'Sec', 'Status'], tablefmt='psql'))
+    return report
+                    
+                    
 def delete(table, db: Optional[str] = None, condition: Optional[str] = None):
     metadata = dbm.read_metadata()
     
@@ -194,121 +233,79 @@ def select_all(field):
 
     
     all_users = []
-    for db in metadata['Connections']:
-        output = dbm.query_one( query, metadata['Connections'][db])
-        all_users.extend(output)
+    shard_results = []
+    for result in dbm.scatter_gather(query, metadata=metadata, cache=True):
+        shard_results.append(result)
+        if result.error:
+            print(f'DB {result.db} failed: {result.error}')
+            continue
+        all_users.extend(result.value)
         
     if field in ['nba', 'teams', 'players']:
         all_users = set(all_users)
     
     num_rows = len(all_users)
-    return num_rows, tabulate(all_users, headers=cols[field][1], tablefmt='psql')
+    return num_rows, tabulate(all_users, headers=cols[field][1], tablefmt='psql'), shard_results
 
 
-def select_fandom(nba_name: Optional[str] = None, nba_type: Optional[str]= None, level: Optional[str]= None):
-    
-    metadata = dbm.read_metadata()
-    
-    pref_label = {
-        'favorite': 'Fans',
-        'bandwagon': 'Bandwagoners',
-        'rival': 'Haters'
+def select_stream(field, shard_results: Optional[list] = None):
+    """
+    Stream every row of the users or prefs table across all shards, without holding the whole table in memory.
+    """
+    cols = {
+        'users': 'user, date',
+        'prefs': 'user, nba_entity, preference'
     }
-    params=None
-    
-    if not (nba_name and nba_type and level):
-        query = f"""
-            WITH fandom (type, name, pref, cnt) as (
-                SELECT Nba.type, Preferences.nba_entity, Preferences.preference, COUNT(*) as cnt
-                FROM Preferences, Users, Nba
-                WHERE Preferences.user = Users.user
-                AND Preferences.nba_entity = Nba.name
-                GROUP BY Preferences.nba_entity, Preferences.preference
-                ORDER BY cnt DESC
-            )
-            SELECT * FROM fandom;
-        """
-        title = 'Full NBA Breakdown'
-        columns = ['type', 'name', 'pref', 'cnt']
-        
-    if nba_type and (not (nba_name and level)): # select either all the the teams or all the players
-        query = f"""
-            WITH fandom (type, name, pref, cnt) as (
-                SELECT Nba.type, Preferences.nba_entity, Preferences.preference, COUNT(*) as cnt
-                FROM Preferences, Users, Nba
-                WHERE Preferences.user = Users.user
-                AND Preferences.nba_entity = Nba.name
-                GROUP BY Preferences.nba_entity, Preferences.preference
-                ORDER BY cnt DESC
-            )
-            SELECT name, cnt FROM fandom
-            WHERE type = %s;
-        """
-        params = (nba_type)
-        title = f'{nba_type} Fandom Breakdown'
-        columns = ['name', 'cnt']
-        
-    if nba_name and (not(nba_type and level)):  # select the specific entity in question (ex. the fandom of the spurs)
-        query = f"""
-            WITH fandom (type, name, pref, cnt) as (
-                SELECT Nba.type, Preferences.nba_entity, Preferences.preference, COUNT(*) as cnt
-                FROM Preferences, Users, Nba
-                WHERE Preferences.user = Users.user
-                AND Preferences.nba_entity = Nba.name
-                GROUP BY Preferences.nba_entity, Preferences.preference
-                ORDER BY cnt DESC
-            )
-            SELECT pref, type, cnt FROM fandom
-            WHERE name = %s;
-        """
-        params = (nba_name,)
-        title = f'{nba_name} Fandom Breakdown'
-        columns = ['pref', 'type', 'cnt']
-        
-    if level and (not (nba_type and nba_name)):  # select for example all the 
-        query = f"""
-            WITH fandom (type, name, pref, cnt) as (
-                SELECT Nba.type, Preferences.nba_entity, Preferences.preference, COUNT(*) as cnt
-                FROM Preferences, Users, Nba
-                WHERE Preferences.user = Users.user
-                AND Preferences.nba_entity = Nba.name
-                GROUP BY Preferences.nba_entity, Preferences.preference
-                ORDER BY cnt DESC
-            )
-            SELECT name, cnt FROM fandom
-            WHERE pref = %s;
-        """
-        params = (level)
-        title = f'{level} Breakdown'
-        columns = ['name', 'cnt']
-    
-    if (level and nba_type) and not nba_name: # select for example all bandwagoners of teams
-        query = f"""
-            WITH fandom (type, name, pref, cnt) as (
-                SELECT Nba.type, Preferences.nba_entity, Preferences.preference, COUNT(*) as cnt
-                FROM Preferences, Users, Nba
-                WHERE Preferences.user = Users.user
-                AND Preferences.nba_entity = Nba.name
-                GROUP BY Preferences.nba_entity, Preferences.preference
-                ORDER BY cnt DESC
-            )
-            SELECT name, cnt FROM fandom
-            WHERE pref = %s
-            AND type = %s;
-        """
-        params = (level, nba_type)
-        title = f'{level} {nba_type} Breakdown'
-        columns = ['name', 'cnt']
+    table_options = {
+        'prefs': 'Preferences',
+        'users': 'Users'
+    }
+    query = f"""
+        SELECT {cols[field]} 
+        FROM {table_options[field]};
+    """
+    return dbm.stream_query(query, shard_results=shard_results)
+
+
+def print_stream(field, page_size: int = SELECT_PAGE_SIZE) -> tuple[int, list]:
+    """
+    Print a streamed table one page at a time. Returns the number of rows printed and the per-shard results.
+    """
+    headers = {
+        'users': ['user', 'date'],
+        'prefs': ['user', 'nba', 'preference']
+    }
+    shard_results = []
+    rows = select_stream(field, shard_results=shard_results)
+    num_rows = 0
+    while True:
+        page = list(islice(rows, page_size))
+        if not page:
+            break
+        num_rows += len(page)
+        print(tabulate(page, headers=headers[field], tablefmt='psql'))
+    return num_rows, shard_results
+
+
+def select_fandom(nba_name: Optional[str] = None, nba_type: Optional[str]= None, level: Optional[str]= None, top: Optional[int] = None, live: bool = False):
+    """
+    Fandom counts across every shard. Each shard computes partial counts for the requested filters, and the
+    partials are merged as each shard answers. The shards answer from their FandomCounts tables unless live is set.
+    """
+    metadata = dbm.read_metadata()
     
-    combined_output = []
+    breakdown = FandomBreakdown(nba_name=nba_name, nba_type=nba_type, level=level, use_counters=not live)
+    query, params = breakdown.query()
+    shard_results = []
     
-    for db in metadata['Connections']:
-        
-        output = dbm.query_one(query, metadata['Connections'][db], params=params)
-        
-        combined_output.extend(list(output))
+    for result in dbm.scatter_gather(query, params=params, metadata=metadata, cache=True):
+        shard_results.append(result)
+        if result.error:
+            print(f'DB {result.db} failed: {result.error}')
+            continue
+        breakdown.add(result.value)
     
-    return columns, title, combined_output
+    return breakdown.columns, breakdown.title, breakdown.top(top), shard_results
 
 def select_user(user):
     metadata = dbm.read_metadata()
@@ -321,20 +318,66 @@ def select_user(user):
         AND Preferences.user = %s;
     """
     params = (user,)
+    
+    # a user found in the directory only needs its home shard; anyone else means asking every shard
+    home = dbm.directory.lookup(user)
+    targets = [home[1]] if home and home[1] in metadata['Connections'] else None
+    
     combined_output = []
     dbs = []
+    shard_results = []
+    for result in dbm.scatter_gather(query, params=params, metadata=metadata, dbs=targets):
+        shard_results.append(result)
+        if result.error:
+            print(f'DB {result.db} failed: {result.error}')
+            continue
+        combined_output.append(result.value)
+        dbs.append(result.db)
+        if targets is None and result.value:
+            dbm.directory.register(user, result.value[0][4], result.db)
+    return dbs, combined_output, shard_results
+
+
+def rebuild_directory() -> int:
+    """
+    Rebuild the user directory from the Users table of every shard, and mark it complete so lookups of unknown
+    users stop asking every shard.
+    """
+    metadata = dbm.read_metadata()
+    dbm.directory.clear()
+    
+    total = 0
     for db in metadata['Connections']:
-        output = dbm.query_one(query, metadata['Connections'][db], params=params)
-        combined_output.append(output)
-        dbs.append(db)
-    return dbs, combined_output
+        rows = dbm.stream_query("SELECT user, date FROM Users;", metadata=metadata, dbs=[db])
+        while True:
+            page = list(islice(rows, SELECT_PAGE_SIZE))
+            if not page:
+                break
+            total += dbm.directory.register_many((user, date, db) for user, date in page)
+    dbm.directory.mark_complete()
+    return total
+
+
+def print_shard_timings(shard_results):
+    """
+    Print how long each shard took, slowest first. The slowest shard is the critical path of a fan-out read.
+    """
+    slowest = critical_path(shard_results)
+    if not slowest:
+        return
+    timings = ', '.join(f'{r.db} {r.elapsed:.3f}s' + (' (failed)' if r.error else '') for r in sorted(shard_results, key=lambda r: -r.elapsed))
+    print(f'Critical path: DB {slowest.db} ({slowest.elapsed:.3f} sec) -- {timings}')
 
     
-def show_databases():
+def show_databases(refresh: bool = False):
+    """
+    Sizes come from the last capacity snapshot (only databases that were never polled are queried), so this
+    returns at once; `refresh` polls every database first.
+    """
     metadata = dbm.read_metadata()
     
     dbs = {}
-    capacities, _ = dbp.check_capacities()
+    capacities, _ = dbp.check_capacities(max_age=0 if refresh else float('inf'))
     
     for db in metadata['Connections']:
         keys = db.split('r')[1].split('h')
@@ -342,16 +385,99 @@ def show_databases():
             'range': keys[0],
             'end': metadata['Ranges']['End'][metadata['Ranges']['Start'].index(int(keys[0]))],
             'DB#': keys[1],
-            'host': metadata['Connections'][db]['vm_ip'],
-            'data_size': capacities[db],
-            'db_capacity': '4000 MB'
+            'host': metadata['Connections'][db].get('vm_ip', metadata['Connections'][db].get('path')),
+            'data_size': capacities.get(db, 'unknown'),
+            'db_capacity': f'{CAPACITY_LIMIT_MB} MB'
         }
         
     dbs = pd.DataFrame(dbs).transpose().reset_index()
     
     return dbs
 
-def init_dbs(num_dbs):
+def show_capacity(refresh: bool = False) -> pd.DataFrame:
+    report = dbm.capacity.report(max_age=0 if refresh else None)
+    rows = [
+        [db, r['size_mb'], datetime.fromtimestamp(r['polled']).strftime('%Y-%m-%d %H:%M:%S'), r['growth_mb_per_day'], r['days_to_full'], r['near_full']]
+        for db, r in sorted(report.items())
+    ]
+    return pd.DataFrame(rows, columns=['db', 'size_mb', 'polled', 'growth_mb_per_day', 'days_to_full', 'near_full'])
+
+
+def fetch_metrics(url: str = API_URL) -> str:
+    with urlopen(f"{url.rstrip('/')}/metrics", timeout=10) as response:
+        return response.read().decode()
+
+
+def latency_table(samples, name: str, keys: tuple) -> pd.DataFrame:
+    """
+    One row per label set of histogram `name`: count, mean and p50/p99 (estimated from the buckets) in ms.
+    """
+    series = {}
+    for metric, labels, value in samples:
+        if not metric.startswith(name + '_'):
+            continue
+        key = tuple(labels.get(k, '') for k in keys)
+        entry = series.setdefault(key, {'buckets': [], 'sum': 0.0, 'count': 0})
+        if metric == name + '_bucket':
+            entry['buckets'].append((float(labels['le']), value))
+        elif metric == name + '_sum':
+            entry['sum'] = value
+        elif metric == name + '_count':
+            entry['count'] = int(value)
+    
+    rows = []
+    for key, entry in sorted(series.items()):
+        p50, p99 = (histogram_quantile(q, entry['buckets']) for q in (0.5, 0.99))
+        rows.append(dict(zip(keys, key), count=entry['count'],
+                         mean_ms=round(entry['sum'] / entry['count'] * 1e3, 3) if entry['count'] else None,
+                         p50_ms=round(p50 * 1e3, 3) if p50 is not None else None,
+                         p99_ms=round(p99 * 1e3, 3) if p99 is not None else None))
+    return pd.DataFrame(rows, columns=list(keys) + ['count', 'mean_ms', 'p50_ms', 'p99_ms'])
+
+
+def show_stats(text: str) -> dict:
+    """
+    Returns:
+    	shards - latency, rows and errors per shard and operation.\n
+    	routes - latency per API route, method and status.\n
+    	pools - connections in use and idle, waits and timeouts per shard pool.\n
+    	locate - latency of routing a record to its shard.\n
+    """
+    samples = parse_text(text)
+    
+    shards = latency_table(samples, 'distributed_db_shard_operation_seconds', ('shard', 'operation'))
+    totals = {}
+    for metric, labels, value in samples:
+        key = (labels.get('shard'), labels.get('operation'))
+        if metric == 'distributed_db_shard_rows_total':
+            totals.setdefault(key, {'rows': 0, 'errors': 0})['rows'] += int(value)
+        elif metric == 'distributed_db_shard_errors_total':
+            totals.setdefault(key, {'rows': 0, 'errors': 0})['errors'] += int(value)
+    shards['rows'] = [totals.get(key, {}).get('rows', 0) for key in zip(shards['shard'], shards['operation'])]
+    shards['errors'] = [totals.get(key, {}).get('errors', 0) for key in zip(shards['shard'], shards['operation'])]
+    
+    pools = {}
+    for metric, labels, value in samples:
+        if metric == 'distributed_db_pool_connections':
+            pools.setdefault(labels['shard'], {})[labels['state']] = int(value)
+        elif metric == 'distributed_db_pool_max_size':
+            pools.setdefault(labels['shard'], {})['max_size'] = int(value)
+        elif metric == 'distributed_db_pool_events_total' and labels['event'] in ('created', 'waits', 'timeouts'):
+            pools.setdefault(labels['shard'], {})[labels['event']] = int(value)
+    pools = pd.DataFrame([{'shard': shard, **stats} for shard, stats in sorted(pools.items())],
+                         columns=['shard', 'in_use', 'idle', 'max_size', 'created', 'waits', 'timeouts'])
+    
+    return {
+        'shards': shards,
+        'routes': latency_table(samples, 'distributed_db_api_request_seconds', ('route', 'method', 'status')),
+        'pools': pools,
+        'locate': latency_table(samples, 'distributed_db_locate_db_seconds', ())
+    }
+
+
+def init_dbs(num_dbs, hash_function: Optional[str] = None):
+    if hash_function:
+        dbp.update_hash_function(hash_function)
     dbp.initiate_distributed_db(num_dbs)
     
 def destroy_dbs():
@@ -360,18 +486,47 @@ def destroy_dbs():
 def show_metadata():
     return dbm.read_metadata()
 
+def reshard(range_start: int, modulus: int, dry_run: bool = False):
+    """
+    Estimate a range split, and unless this is a dry run, provision the new databases and move the users.
+    """
+    plan = resharder.plan(range_start, modulus)
+    moves = [[source, target, m['users'], m['preferences']] for (source, target), m in sorted(plan['moves'].items())]
+    print(f"Range {plan['range']} ({plan['hash']} hash): {plan['modulus']} -> {plan['new_modulus']} databases, new: {', '.join(plan['new_shards'])}")
+    print(tabulate(moves, tablefmt='psql', headers=['From', 'To', 'Users', 'Preferences']))
+    print(f"{plan['users']} of {plan['scanned']} users and {plan['preferences']} preferences would move")
+    if dry_run:
+        return None
+    
+    check = input(f'Are you sure you want to split range {range_start} over {modulus} databases? (Y/n) ')
+    if check != 'Y':
+        return None
+    connections = dbp.provision_shards(plan['new_shards'])
+    return resharder.run(range_start, modulus, connections)
+
 
 def main():
     parser = init_parsers()
     args = parser.parse_args()
     
+    # --profile profiles this command; otherwise DISTRIBUTED_DB_PROFILE samples commands as it samples API requests
+    profiler = Profiler(args.profile_dir, min_ms=args.profile_min_ms) if args.profile else Profiler.from_environment()
+    if profiler is None:
+        return run(args)
+    with profiler.session('cli', str(args.command), argv=sys.argv[1:]) as profile:
+        run(args)
+    if profile is not None and profile.path:
+        print(f'Profile ({profile.duration:.3f} sec, {len(profile.shards)} shards): {profile.path}.pstats, .collapsed, .json')
+
+
+def run(args):
     if args.command == 'insert':
         if args.json:
             try:
                 with open(args.json, 'r') as file:
                     data = json.load(file)
                     if isinstance(data, list):
-                        insert(args.table, data)
+                        insert(args.table, data, batch_size=args.batch_size, upsert=args.upsert)
                     else:
                         print('Make sure the json file is a list of objects.')
             except DuplicateDataError as e:
@@ -380,7 +535,7 @@ def main():
 
                 
         elif args.data:
-            insert(args.table, [json.loads(record) for record in args.data])
+            insert(args.table, [json.loads(record) for record in args.data], batch_size=args.batch_size, upsert=args.upsert)
         else:
             print('cli.py insert: error: Pick either json or manual insertion')
     if args.command == 'delete':
@@ -405,28 +560,30 @@ def main():
     if args.command == 'select':
         if args.table:
             starting = datetime.now()
-            num_rows, res = select_all(args.table)
+            if args.table in ['users', 'prefs']:
+                num_rows, shard_results = print_stream(args.table)
+            else:
+                num_rows, res, shard_results = select_all(args.table)
+                print(res)
             ending = datetime.now()
             
             time = ending - starting
             
-            print(res)
             print(f'Total rows: {num_rows} ({time.total_seconds():.2f} sec)')
+            print_shard_timings(shard_results)
         
         if args.nbaType:
             starting = datetime.now()
-            num_rows, res = select_all(args.nbaType)
+            num_rows, res, shard_results = select_all(args.nbaType)
             ending = datetime.now()
             time = ending - starting
             print(res)
             print(f'Total rows: {num_rows} ({time.total_seconds():.2f} sec)')
+            print_shard_timings(shard_results)
         
     if args.command == 'breakdown':
         starting = datetime.now()
-        cols, title, res = select_fandom(nba_name=args.name, nba_type=args.type, level=args.level)
-        
-        df = pd.DataFrame(res, columns=cols)
-        result = df.groupby(cols[:-1]).agg({'cnt': 'sum'}).sort_values(by='cnt', ascending=False).reset_index()
+        cols, title, result, shard_results = select_fandom(nba_name=args.name, nba_type=args.type, level=args.level, top=args.top, live=args.live)
         ending = datetime.now()
         time = ending - starting
         
@@ -435,30 +592,57 @@ def main():
         print('\n', title.title())
         print(tabulate(result, showindex=False, tablefmt='psql', headers=cols))
         print(f'{len(result)} rows in set ({time.total_seconds():.3f} sec)')
+        print_shard_timings(shard_results)
 
     if args.command == 'user':
         
         starting = datetime.now()
-        dbs, res = select_user(args.user)
+        dbs, res, shard_results = select_user(args.user)
         ending = datetime.now()
         time = ending - starting
         
         print(f'{len([item for t in res for item in t])} total rows across DBs ({time.total_seconds():.3f} sec)')
+        print_shard_timings(shard_results)
         
         print(f'\nResults for user "{args.user}"\n')
         for i, user_instance in enumerate(res):
             print(f'Database {dbs[i]}:')
             print(tabulate(user_instance, headers=['type', 'name', 'fandom_level', 'user', 'date'], tablefmt='psql'), '\n')
     
+    if args.command == 'directory':
+        if args.action == 'rebuild':
+            starting = datetime.now()
+            total = rebuild_directory()
+            ending = datetime.now()
+            print(f'{total} users in the directory ({(ending - starting).total_seconds():.3f} sec)')
+        elif args.user:
+            home = dbm.find_user(args.user)
+            if home:
+                print(f'User "{args.user}" -- DB {home[1]} (created {home[0]})')
+            else:
+                print(f'User "{args.user}" not found')
+        else:
+            print('cli.py directory: error: lookup needs a user name')
+    
+    if args.command == 'counters':
+        starting = datetime.now()
+        report = dbm.rebuild_counters(dbs=[args.database] if args.database else None)
+        ending = datetime.now()
+        print(tabulate(sorted(report.items()), tablefmt='psql', headers=['DB', 'Counters']))
+        print(f'Rebuilt {len(report)} databases ({(ending - starting).total_seconds():.3f} sec)')
+    
     if args.command == 'metadata':
         if args.verbose:
             pprint(show_metadata())
             
         else:
-            print(tabulate(show_databases(), tablefmt='psql', showindex=False, headers=['DB', 'Start', 'End', 'Hash Value', 'Host', 'DB Size', 'DB Capacity']))
+            print(tabulate(show_databases(args.refresh), tablefmt='psql', showindex=False, headers=['DB', 'Start', 'End', 'Hash Value', 'Host', 'DB Size', 'DB Capacity']))
+    
+    if args.command == 'capacity':
+        print(tabulate(show_capacity(args.refresh), tablefmt='psql', showindex=False, headers=['DB', 'Size (MB)', 'Polled', 'Growth (MB/day)', 'Days to full', 'Near full']))
             
     if args.command == 'init':
-        init_dbs(args.dbs)
+        init_dbs(args.dbs, hash_function=args.hash)
         
     if args.command == 'destroy':
         check = input(f'Are you sure you want to destroy the distributed database?\nTo confirm the destroy, type "destroy": ')
@@ -474,7 +658,24 @@ def main():
             print('Old Metadata')
             print(tabulate(show_databases(), tablefmt='psql', showindex=False, headers=['DB', 'Start', 'End', 'Hash Value', 'Host', 'DB Size', 'DB Capacity']))
             print(f'\nADDING {args.num_dbs} NEW DATABASES')
-            dbp.add_databases(args.num_dbs)
+            dbp.add_databases(args.num_dbs, hash_function=args.hash)
+    
+    if args.command == 'reshard':
+        starting = datetime.now()
+        report = reshard(args.range_start, args.modulus, dry_run=args.dry_run)
+        ending = datetime.now()
+        if report:
+            print(f"Moved {report['moved']} users ({report['late']} late, {report['resynced']} re-synced, {report['removed']} deleted during the copy) in {(ending - starting).total_seconds():.1f} sec")
+    
+    if args.command == 'stats':
+        text = fetch_metrics(args.url)
+        if args.raw:
+            print(text, end='')
+        else:
+            tables = show_stats(text)
+            for title, table in (('Shard operations', 'shards'), ('API routes', 'routes'), ('Connection pools', 'pools'), ('locate_db', 'locate')):
+                print(title)
+                print(tabulate(tables[table], tablefmt='psql', showindex=False, headers='keys'))
             
     
             
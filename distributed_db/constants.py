@@ -1,4 +1,11 @@
 TERRAFORM_DIR = './db/terraform'
 AZURE_METADATA_PATH = './db/metadata/metadata_azure.json'  
 METADATA_LOCAL = './db/metadata/metadata_local.json'
-METADATA_COPY = './db/metadata/metadata_copy.json'
\ No newline at end of file
+METADATA_COPY = './db/metadata/metadata_copy.json'
+SELECT_PAGE_SIZE = 1000
+LOGIN_CACHE_SIZE = 10000
+LOGIN_CACHE_TTL = 300
+PREFERENCE_CACHE_SIZE = 10000
+PREFERENCE_CACHE_TTL = 120
+PREFERENCE_BATCH_SIZE = 1000
+API_URL = 'http://127.0.0.1:5000'
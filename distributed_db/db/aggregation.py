@@ -0,0 +1,119 @@
+from heapq import nlargest
+from typing import Iterable, Optional
+
+
+class FandomBreakdown():
+    """
+    Two-phase COUNT aggregation of fandoms across shards.
+
+    Phase one is pushed down to every shard: the shard filters its FandomCounts (or, uncached, its Preferences) by
+    whichever of type, level and name were given (as query parameters), groups by the output columns and returns
+    one partial count per group.
+    Phase two runs here: each shard's partial counts are folded into a running total as soon as that shard answers,
+    so memory is bounded by the number of distinct groups rather than the number of rows returned by all shards.
+
+    The output columns follow the filters:
+    \tname given - (pref, type, cnt)\n
+    \ttype and/or level given - (name, cnt)\n
+    \tno filters - (type, name, pref, cnt)\n
+
+    Methods:
+    \tquery - the SQL and parameters to send to every shard.\n
+    \tadd - merge one shard's partial counts.\n
+    \ttop - the k largest groups, or all groups sorted by count.\n
+    """
+    group_columns = {
+        'type': 'Nba.type',
+        'name': 'Preferences.nba_entity',
+        'pref': 'Preferences.preference'
+    }
+    counter_columns = {
+        'type': 'type',
+        'name': 'nba_entity',
+        'pref': 'preference'
+    }
+
+    def __init__(self, nba_name: Optional[str] = None, nba_type: Optional[str] = None, level: Optional[str] = None, use_counters: bool = True) -> None:
+        self.nba_name = nba_name
+        self.nba_type = nba_type
+        self.level = level
+        self.use_counters = use_counters
+        self.totals = {}
+        self.shards_merged = 0
+
+        if nba_name:
+            self.keys = ['pref', 'type']
+        elif nba_type or level:
+            self.keys = ['name']
+        else:
+            self.keys = ['type', 'name', 'pref']
+        self.columns = self.keys + ['cnt']
+
+    @property
+    def title(self) -> str:
+        parts = [p for p in (self.nba_name, self.level, self.nba_type) if p]
+        if not parts:
+            return 'Full NBA Breakdown'
+        return f'{" ".join(parts)} Fandom Breakdown'
+
+    def query(self) -> tuple[str, tuple]:
+        """
+        Build the per-shard partial aggregation. By default it sums the shard's materialized FandomCounts rows;
+        with use_counters=False it counts the Preferences rows directly.
+
+        Returns:
+        \tquery - the SQL, with %s placeholders.\n
+        \tparams - the filter values, in placeholder order.\n
+        """
+        columns = self.counter_columns if self.use_counters else self.group_columns
+        conditions = []
+        params = []
+        for key, value in (('type', self.nba_type), ('pref', self.level), ('name', self.nba_name)):
+            if value:
+                conditions.append(f'{columns[key]} = %s')
+                params.append(value)
+
+        select = ', '.join(columns[k] for k in self.keys)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        if self.use_counters:
+            query = f"""
+            SELECT {select}, SUM(cnt) AS cnt
+            FROM FandomCounts
+            {where}
+            GROUP BY {select};
+        """
+            return query, tuple(params)
+
+        query = f"""
+            SELECT {select}, COUNT(*) AS cnt
+            FROM Preferences
+            JOIN Nba ON Preferences.nba_entity = Nba.name
+            {where}
+            GROUP BY {select};
+        """
+        return query, tuple(params)
+
+    def add(self, partials: Iterable[tuple]) -> None:
+        """
+        Merge one shard's partial counts into the running totals.
+
+        Parameters:
+        \tpartials - rows of (*group key, cnt) as returned by query().\n
+        """
+        totals = self.totals
+        for row in partials:
+            key = tuple(row[:-1])
+            totals[key] = totals.get(key, 0) + int(row[-1])
+        self.shards_merged += 1
+
+    def top(self, k: Optional[int] = None) -> list[tuple]:
+        """
+        The k groups with the highest counts (heap selection), or every group sorted by count if k is None.
+        """
+        items = self.totals.items()
+        if k is None:
+            ranked = sorted(items, key=lambda item: item[1], reverse=True)
+        else:
+            ranked = nlargest(k, items, key=lambda item: item[1])
+        return [key + (count,) for key, count in ranked]
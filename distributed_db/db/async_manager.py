@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
+import asyncio
+
+try:
+    from distributed_db.db.manager import DatabaseManager
+    from distributed_db.db.constants import ASYNC_MAX_WORKERS, SCATTER_TIMEOUT
+    from distributed_db.db.profiling import bind
+except ModuleNotFoundError:
+    from .manager import DatabaseManager
+    from .constants import ASYNC_MAX_WORKERS, SCATTER_TIMEOUT
+    from .profiling import bind
+
+
+class AsyncDatabaseManager():
+    """
+    asyncio front end for DatabaseManager, for the async API.
+
+    pymysql is blocking, so every call that touches a database runs on a dedicated thread pool and is awaited,
+    keeping the event loop free while queries are in flight. The thread pool is separate from the loop's default
+    executor and from the scatter-gather pool, and is sized to the number of requests that may be talking to
+    MySQL at once; further requests wait for a thread without holding up the loop. Connections still come from
+    the per-shard pools of the wrapped manager.
+
+    Calls that do not touch a database (read_metadata, locate_db, the stats and metrics) are plain methods.
+
+    Methods:
+    \trun - await any blocking callable on the manager's thread pool.\n
+    \ttransaction - await `work(connection, ...)` on a pooled connection to one shard.\n
+    \tfind_user, home_shard, query_one, insert_one, insert_many, scatter_gather - awaitable versions of the
+    DatabaseManager methods.\n
+    """
+    def __init__(self, metadata_path, max_workers: int = ASYNC_MAX_WORKERS, manager: Optional[DatabaseManager] = None, **pool_options) -> None:
+        self.manager = manager if manager is not None else DatabaseManager(metadata_path, **pool_options)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-db')
+
+    @property
+    def directory(self):
+        return self.manager.directory
+
+    def read_metadata(self) -> dict:
+        return self.manager.read_metadata()
+
+    def locate_db(self, metadata: dict, data_date: int, user_name: str) -> str:
+        return self.manager.locate_db(metadata, data_date, user_name)
+
+    def invalidate_cache(self, table: str) -> int:
+        return self.manager.invalidate_cache(table)
+
+    def pool_stats(self) -> dict:
+        return self.manager.pool_stats()
+
+    def cache_stats(self) -> dict:
+        return self.manager.cache_stats()
+
+    @property
+    def metrics(self):
+        return self.manager.metrics
+
+    def metrics_text(self) -> str:
+        return self.manager.metrics.render()
+
+    async def run(self, function: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(bind(function), *args, **kwargs))
+
+    async def transaction(self, credentials: dict, work: Callable, *args):
+        """
+        Check a connection to one shard out of its pool and run `work(connection, *args)` with it on the thread
+        pool. Committing is up to `work`; a transaction it leaves open is rolled back when the connection goes
+        back to the pool. The time and any error are recorded in the metrics under the name of `work`.
+        """
+        def call():
+            with self.manager.measure(credentials['mysql_database'], work.__name__.lstrip('_')), self.manager.connection(credentials) as connection:
+                return work(connection, *args)
+        return await self.run(call)
+
+    async def find_user(self, user_name: str, metadata: Optional[dict] = None):
+        return await self.run(self.manager.find_user, user_name, metadata)
+
+    async def home_shard(self, metadata: dict, user_name: str, data_date: Optional[int] = None) -> str:
+        return await self.run(self.manager.home_shard, metadata, user_name, data_date)
+
+    async def query_one(self, query, credentials, params: Optional[tuple] = None):
+        return await self.run(self.manager.query_one, query, credentials, params=params)
+
+    async def insert_one(self, data: dict, table: str, credentials: dict):
+        return await self.run(self.manager.insert_one, data, table, credentials)
+
+    async def insert_many(self, table: str, records: list[dict], metadata: Optional[dict] = None, **kwargs) -> dict:
+        return await self.run(self.manager.insert_many, table, records, metadata, **kwargs)
+
+    async def scatter_gather(self, query, params: Optional[tuple] = None, metadata: Optional[dict] = None, dbs: Optional[list[str]] = None,
+                             timeout: Optional[float] = SCATTER_TIMEOUT, cache: bool = False) -> list:
+        """
+        Returns:
+        \tresults - every shard's ShardResult, in completion order.
+        """
+        return await self.run(lambda: list(self.manager.scatter_gather(query, params=params, metadata=metadata, dbs=dbs, timeout=timeout, cache=cache)))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.manager.close()
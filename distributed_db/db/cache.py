@@ -0,0 +1,252 @@
+from collections import OrderedDict
+from typing import Iterable, Optional
+import hashlib
+import pickle
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    from distributed_db.db.constants import QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+except ModuleNotFoundError:
+    from .constants import QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """
+    Collapse whitespace and drop a trailing semicolon, so the same query written over several lines or with
+    different indentation maps to the same cache key.
+    """
+    return _WHITESPACE.sub(' ', query).strip().rstrip(';').strip()
+
+
+class QueryCache():
+    """
+    LRU cache of cross-shard read results, bounded by number of entries and by age.
+
+    Entries are stored in a small local SQLite file next to the metadata file, so every process using the same
+    metadata shares them: a `cli.py select` or `cli.py breakdown` run twice is answered from the file the second
+    time, and a write through the API drops what the CLI cached (and the other way round).
+
+    Keys are (normalized query, params, metadata fingerprint, shards), so an expand (new metadata) never serves
+    results computed against the old set of shards. Every entry is tagged with the tables its query reads, and a
+    write to a table drops every entry tagged with it.
+
+    A result is only stored if no table it reads was invalidated while it was being computed (each table has a
+    generation number in the file, bumped on every invalidation by any process). The hit, miss, store,
+    invalidation and eviction counters are kept in the file too, so they add up over every process.
+
+    Methods:
+    \tget - the cached value for a key, or None.\n
+    \tgeneration - snapshot of the generation numbers of some tables, taken before computing a value.\n
+    \tput - store a value computed since the given generation snapshot.\n
+    \tinvalidate - drop every entry that reads any of the given tables.\n
+    \tclear - drop everything.\n
+    \tstats - hit, miss, store, invalidation and eviction counters.\n
+    """
+    def __init__(self, path: str = ':memory:', max_entries: int = QUERY_CACHE_SIZE, ttl: Optional[float] = QUERY_CACHE_TTL) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL;')
+        # a lost cache write is only a miss later, so commits are not synced to disk
+        self._db.execute('PRAGMA synchronous=NORMAL;')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS Entries(
+                key TEXT NOT NULL PRIMARY KEY,
+                value BLOB NOT NULL,
+                tables TEXT NOT NULL,
+                expires REAL,
+                used REAL NOT NULL
+            );
+        """)
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_used ON Entries(used);')
+        self._db.execute('CREATE TABLE IF NOT EXISTS Generations(name TEXT NOT NULL PRIMARY KEY, generation INTEGER NOT NULL);')
+        self._db.execute('CREATE TABLE IF NOT EXISTS Stats(event TEXT NOT NULL PRIMARY KEY, count INTEGER NOT NULL);')
+
+    @staticmethod
+    def key(query: str, params=None, version=None, dbs: Optional[Iterable[str]] = None) -> str:
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        elif params is not None:
+            params = tuple(params)
+        key = (normalize_query(query), params, version, tuple(sorted(dbs)) if dbs is not None else None)
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _count(self, event: str, count: int = 1) -> None:
+        if count:
+            self._db.execute('INSERT INTO Stats(event, count) VALUES (?, ?) ON CONFLICT(event) DO UPDATE SET count = count + excluded.count;', (event, count))
+
+    def _transaction(self, work):
+        """
+        Run work() in one write transaction on the file. Call with the lock held.
+        """
+        self._db.execute('BEGIN IMMEDIATE;')
+        try:
+            out = work()
+            self._db.execute('COMMIT;')
+            return out
+        except BaseException:
+            self._db.execute('ROLLBACK;')
+            raise
+
+    def get(self, key: str):
+        with self._lock:
+            def work():
+                row = self._db.execute('SELECT value, expires FROM Entries WHERE key = ?;', (key,)).fetchone()
+                now = time.time()
+                if row is not None:
+                    if row[1] is None or row[1] > now:
+                        try:
+                            value = pickle.loads(row[0])
+                        except Exception:
+                            value = None
+                        if value is not None:
+                            self._db.execute('UPDATE Entries SET used = ? WHERE key = ?;', (now, key))
+                            self._count('hits')
+                            return value
+                    self._db.execute('DELETE FROM Entries WHERE key = ?;', (key,))
+                    self._count('evictions')
+                self._count('misses')
+                return None
+            return self._transaction(work)
+
+    def generation(self, tables: Iterable[str]) -> tuple:
+        tables = tuple(tables)
+        if not tables:
+            return ()
+        with self._lock:
+            rows = self._db.execute(f"SELECT name, generation FROM Generations WHERE name IN ({', '.join(['?'] * len(tables))});", tables).fetchall()
+        generations = dict(rows)
+        return tuple((table, generations.get(table, 0)) for table in tables)
+
+    def put(self, key: str, value, tables: Iterable[str], generation: tuple) -> bool:
+        """
+        Parameters:
+        \tkey - from QueryCache.key.\n
+        \tvalue - the result to cache; anything pickle can store.\n
+        \ttables - the tables the query reads.\n
+        \tgeneration - the snapshot returned by generation() before the value was computed.\n
+
+        Returns:
+        \tstored - False if one of the tables was written to in the meantime and the value was discarded.
+        """
+        if self.max_entries <= 0:
+            return False
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        tags = ',' + ','.join(sorted(set(tables))) + ','
+        with self._lock:
+            def work():
+                seen = dict(generation)
+                if seen:
+                    rows = self._db.execute(f"SELECT name, generation FROM Generations WHERE name IN ({', '.join(['?'] * len(seen))});", tuple(seen)).fetchall()
+                    current = dict(rows)
+                    if any(current.get(table, 0) != number for table, number in seen.items()):
+                        return False
+                now = time.time()
+                expires = now + self.ttl if self.ttl is not None else None
+                self._db.execute('INSERT OR REPLACE INTO Entries(key, value, tables, expires, used) VALUES (?, ?, ?, ?, ?);', (key, blob, tags, expires, now))
+                self._count('stores')
+                excess = self._db.execute('SELECT COUNT(*) FROM Entries;').fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self._db.execute('DELETE FROM Entries WHERE key IN (SELECT key FROM Entries ORDER BY used LIMIT ?);', (excess,))
+                    self._count('evictions', excess)
+                return True
+            return self._transaction(work)
+
+    def invalidate(self, tables: Iterable[str]) -> int:
+        """
+        Returns:
+        \tcount - the number of entries dropped.
+        """
+        tables = sorted(set(tables))
+        if not tables:
+            return 0
+        with self._lock:
+            def work():
+                self._db.executemany('INSERT INTO Generations(name, generation) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET generation = generation + 1;',
+                                     [(table,) for table in tables])
+                dropped = self._db.execute(f"DELETE FROM Entries WHERE {' OR '.join(['tables LIKE ?'] * len(tables))};",
+                                           [f'%,{table},%' for table in tables]).rowcount
+                self._count('invalidations', dropped)
+                return dropped
+            return self._transaction(work)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM Entries;')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM Entries;').fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute('SELECT event, count FROM Stats;').fetchall())
+            entries = self._db.execute('SELECT COUNT(*) FROM Entries;').fetchone()[0]
+        hits, misses = counts.get('hits', 0), counts.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'stores': counts.get('stores', 0),
+            'invalidations': counts.get('invalidations', 0),
+            'evictions': counts.get('evictions', 0)
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class TTLCache():
+    """
+    Small thread-safe mapping whose entries expire `ttl` seconds after they were written. Past `max_entries`, the
+    least recently used entry is dropped.
+    """
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,198 @@
+from typing import Optional
+import sqlite3
+import threading
+import time
+
+try:
+    from distributed_db.db.constants import CAPACITY_TTL, CAPACITY_HISTORY, CAPACITY_LIMIT_MB, CAPACITY_NEAR_FULL_MB, SCATTER_TIMEOUT
+    from distributed_db.db.drivers import get_driver
+except ModuleNotFoundError:
+    from .constants import CAPACITY_TTL, CAPACITY_HISTORY, CAPACITY_LIMIT_MB, CAPACITY_NEAR_FULL_MB, SCATTER_TIMEOUT
+    from .drivers import get_driver
+
+
+def growth_rate(samples: list[tuple[float, float]]) -> Optional[float]:
+    """
+    Least-squares slope of (unix time, size in MB) samples, in MB per day. None with fewer than two samples or
+    if they were all taken at the same time.
+    """
+    if len(samples) < 2:
+        return None
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_size = sum(size for _, size in samples) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if variance == 0:
+        return None
+    slope = sum((t - mean_t) * (size - mean_size) for t, size in samples) / variance
+    return slope * 86400
+
+
+class CapacityMonitor():
+    """
+    Polls the size of every shard in parallel and keeps the results, so reports such as `cli.py metadata` read
+    the last snapshot instead of querying every database.
+
+    Each shard is asked for the size of its own schema only (see the drivers' size_query), on a pooled connection,
+    through the manager's scatter-gather executor. Samples are stored in a small local SQLite file next to the
+    metadata file (shared by the API and the CLI), with the last `history` samples per shard kept for the growth
+    projection. A running API can keep the snapshot fresh with start().
+
+    Parameters:
+    \tmanager - the DatabaseManager whose pools and executor are used.\n
+    \tpath - the SQLite file samples are stored in.\n
+    \tttl - seconds a sample stays fresh; capacities() only polls shards with older samples.\n
+    \thistory - samples kept per shard.\n
+    \tlimit_mb - the capacity of one database, for the projection.\n
+    \tnear_full_mb - size at which a shard is reported as near full.\n
+
+    Methods:
+    \tpoll - query the shards now and record their sizes.\n
+    \tsnapshot - the latest sample of every shard, without touching any database.\n
+    \tcapacities - the snapshot, polling only the shards whose sample is missing or older than the TTL.\n
+    \treport - the snapshot with growth rates and projected days until each shard is full.\n
+    \tstart, stop - poll in a background thread every TTL.\n
+    """
+    def __init__(self, manager, path: str = ':memory:', ttl: float = CAPACITY_TTL, history: int = CAPACITY_HISTORY,
+                 limit_mb: float = CAPACITY_LIMIT_MB, near_full_mb: float = CAPACITY_NEAR_FULL_MB) -> None:
+        self.manager = manager
+        self.path = path
+        self.ttl = ttl
+        self.history = history
+        self.limit_mb = limit_mb
+        self.near_full_mb = near_full_mb
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL;')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS Capacity(
+                db TEXT NOT NULL,
+                polled REAL NOT NULL,
+                size_mb REAL NOT NULL,
+                PRIMARY KEY (db, polled)
+            );
+        """)
+
+    def _size(self, db: str, credentials: dict) -> float:
+        query, params = get_driver(credentials).size_query(credentials['mysql_database'])
+        with self.manager.measure(db, 'capacity'), self.manager.connection(credentials) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                row = cursor.fetchone()
+        return float(row[0] or 0) / 1024 / 1024
+
+    def poll(self, metadata: Optional[dict] = None, dbs: Optional[list[str]] = None, timeout: Optional[float] = SCATTER_TIMEOUT) -> dict:
+        """
+        Returns:
+        \terrors - {db: exception} for the shards that could not be measured; their last sample is kept.
+        """
+        metadata = metadata if metadata is not None else self.manager.read_metadata()
+        connections = metadata['Connections']
+        dbs = list(connections) if dbs is None else [db for db in dbs if db in connections]
+        tasks = {db: (lambda db=db: self._size(db, connections[db])) for db in dbs}
+
+        now = time.time()
+        samples, errors = [], {}
+        for result in self.manager.executor.run(tasks, timeout=timeout):
+            if result.error is not None:
+                errors[result.db] = result.error
+            else:
+                samples.append((result.db, now, round(result.value, 2)))
+
+        with self._lock:
+            self._db.execute('BEGIN;')
+            try:
+                self._db.executemany('INSERT OR REPLACE INTO Capacity(db, polled, size_mb) VALUES (?, ?, ?);', samples)
+                # keep the newest `history` samples of each shard
+                self._db.executemany("""
+                    DELETE FROM Capacity WHERE db = ? AND polled NOT IN (
+                        SELECT polled FROM Capacity WHERE db = ? ORDER BY polled DESC LIMIT ?
+                    );
+                """, [(db, db, self.history) for db, _, _ in samples])
+                self._db.execute('COMMIT;')
+            except Exception:
+                self._db.execute('ROLLBACK;')
+                raise
+        return errors
+
+    def snapshot(self, metadata: Optional[dict] = None) -> dict:
+        """
+        Returns:
+        \tsnapshot - {db: (size in MB, unix time of the sample)} for the shards in the metadata that were ever
+        polled.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT db, size_mb, MAX(polled) FROM Capacity GROUP BY db;').fetchall()
+        snapshot = {db: (size, polled) for db, size, polled in rows}
+        if metadata is not None:
+            snapshot = {db: snapshot[db] for db in metadata['Connections'] if db in snapshot}
+        return snapshot
+
+    def capacities(self, metadata: Optional[dict] = None, max_age: Optional[float] = None) -> dict:
+        """
+        The snapshot, after polling the shards whose sample is missing or older than `max_age` (the TTL by
+        default). With max_age=float('inf') only shards that were never polled are queried.
+        """
+        metadata = metadata if metadata is not None else self.manager.read_metadata()
+        max_age = self.ttl if max_age is None else max_age
+        snapshot = self.snapshot(metadata)
+        now = time.time()
+        stale = [db for db in metadata['Connections'] if db not in snapshot or now - snapshot[db][1] > max_age]
+        if stale:
+            self.poll(metadata, stale)
+            snapshot = self.snapshot(metadata)
+        return snapshot
+
+    def history_of(self, db: str) -> list[tuple[float, float]]:
+        with self._lock:
+            return self._db.execute('SELECT polled, size_mb FROM Capacity WHERE db = ? ORDER BY polled;', (db,)).fetchall()
+
+    def report(self, metadata: Optional[dict] = None, max_age: Optional[float] = None) -> dict:
+        """
+        Returns:
+        \treport - {db: {'size_mb', 'polled', 'growth_mb_per_day', 'days_to_full', 'near_full'}}. Growth is only
+        projected once a shard's samples span at least one TTL.
+        """
+        report = {}
+        for db, (size, polled) in self.capacities(metadata, max_age).items():
+            history = self.history_of(db)
+            growth = growth_rate(history) if history[-1][0] - history[0][0] >= self.ttl else None
+            report[db] = {
+                'size_mb': size,
+                'polled': polled,
+                'growth_mb_per_day': round(growth, 3) if growth is not None else None,
+                'days_to_full': round((self.limit_mb - size) / growth, 1) if growth and growth > 0 else None,
+                'near_full': size > self.near_full_mb
+            }
+        return report
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as err:
+                print(f'Capacity poll failed: {err}')
+            self._stop.wait(self.ttl)
+
+    def start(self) -> None:
+        """
+        Poll every shard now and then every TTL on a daemon thread, until stop().
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='capacity', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+        with self._lock:
+            self._db.close()
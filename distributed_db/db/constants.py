@@ -1,4 +1,37 @@
 DEFAULT_MODULUS = 2
 TERRAFORM_DIR = './terraform'
 METADATA_PATH = './metadata_azure.json' 
-METADATA_PATH = './metadata.json'
\ No newline at end of file
+METADATA_PATH = './metadata.json'
+
+POOL_MAX_SIZE = 8
+POOL_IDLE_TIMEOUT = 300
+POOL_HEALTH_CHECK_INTERVAL = 30
+POOL_ACQUIRE_TIMEOUT = 10
+
+INSERT_BATCH_SIZE = 500
+SCATTER_MAX_WORKERS = 16
+SCATTER_TIMEOUT = 30
+METADATA_CHECK_INTERVAL = 1.0
+DEFAULT_HASH = 'jump'
+STREAM_FETCH_SIZE = 1000
+STREAM_PREFETCH = 8
+DIRECTORY_SUFFIX = '.directory.sqlite'
+DIRECTORY_CACHE_SIZE = 100000
+DIRECTORY_MISS_TTL = 5
+DIRECTORY_CHANGE_LOG = 10000
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 60
+QUERY_CACHE_SUFFIX = '.cache.sqlite'
+RESHARD_BATCH_SIZE = 500
+RESHARD_GRACE_PERIOD = 5
+ASYNC_MAX_WORKERS = 64
+SQLITE_BUSY_TIMEOUT = 30
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOCATE_DB_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.001)
+PROFILE_DIR = './profiles'
+PROFILE_MIN_MS = 100
+CAPACITY_SUFFIX = '.capacity.sqlite'
+CAPACITY_TTL = 300
+CAPACITY_HISTORY = 288
+CAPACITY_LIMIT_MB = 4000
+CAPACITY_NEAR_FULL_MB = 3000
@@ -0,0 +1,88 @@
+"""
+Materialized fandom counters.
+
+Every shard keeps a FandomCounts table with one row per (nba_entity, type, preference) holding the number of
+Preferences rows with that entity and preference on the shard. The counters are updated in the same transaction
+as the preference writes that change them, so `cli.py breakdown` can read a few hundred counter rows instead of
+joining and scanning Preferences and Nba. rebuild() recomputes a shard's counters from scratch for recovery.
+
+All functions take an open cursor and leave committing to the caller.
+"""
+from collections import Counter
+from typing import Iterable, Optional
+
+
+def deltas_for(rows: Iterable[tuple[str, str]], sign: int = 1) -> Counter:
+    """
+    Count changes for a set of inserted (sign=1) or deleted (sign=-1) preferences.
+
+    Parameters:
+    \trows - (nba_entity, preference) pairs.\n
+    """
+    deltas = Counter()
+    for nba_entity, preference in rows:
+        deltas[(nba_entity, preference)] += sign
+    return deltas
+
+
+def deltas_for_condition(cursor, condition: str, params=None) -> Counter:
+    """
+    The negative deltas for deleting the Preferences rows matching `condition`. Run it before the delete.
+    """
+    cursor.execute(f"""
+        SELECT nba_entity, preference, COUNT(*)
+        FROM Preferences
+        WHERE {condition}
+        GROUP BY nba_entity, preference;
+    """, params)
+    return Counter({(nba_entity, preference): -int(cnt) for nba_entity, preference, cnt in cursor.fetchall()})
+
+
+def apply(cursor, deltas: Counter, types: Optional[dict] = None) -> int:
+    """
+    Add the deltas to the counters with one multi-row upsert. Counters that reach zero are removed.
+
+    Parameters:
+    \tdeltas - {(nba_entity, preference): change}.\n
+    \ttypes - {nba_entity: type} the caller already knows. Entities missing from it are looked up in Nba.\n
+
+    Returns:
+    \tcount - the number of counters changed.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+
+    types = dict(types or {})
+    entities = sorted({nba_entity for nba_entity, _ in deltas} - set(types))
+    if entities:
+        cursor.execute(f"SELECT name, type FROM Nba WHERE name IN ({', '.join(['%s'] * len(entities))});", entities)
+        types.update({row[0]: row[1] for row in cursor.fetchall()})
+
+    rows = [(nba_entity, types[nba_entity], preference, delta) for (nba_entity, preference), delta in deltas.items() if nba_entity in types]
+    cursor.executemany("""
+        INSERT INTO FandomCounts(nba_entity, type, preference, cnt)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt);
+    """, rows)
+
+    if any(delta < 0 for delta in deltas.values()):
+        cursor.execute("DELETE FROM FandomCounts WHERE cnt <= 0;")
+    return len(rows)
+
+
+def rebuild(cursor) -> int:
+    """
+    Recompute every counter on the shard from Preferences and Nba.
+
+    Returns:
+    \tcount - the number of counters written.
+    """
+    cursor.execute("DELETE FROM FandomCounts;")
+    return cursor.execute("""
+        INSERT INTO FandomCounts(nba_entity, type, preference, cnt)
+        SELECT Preferences.nba_entity, Nba.type, Preferences.preference, COUNT(*)
+        FROM Preferences
+        JOIN Nba ON Preferences.nba_entity = Nba.name
+        GROUP BY Preferences.nba_entity, Nba.type, Preferences.preference;
+    """)
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from typing import Iterable, Optional
+import sqlite3
+import threading
+
+try:
+    from distributed_db.db.cache import TTLCache
+    from distributed_db.db.constants import DIRECTORY_CACHE_SIZE, DIRECTORY_MISS_TTL, DIRECTORY_CHANGE_LOG
+except ModuleNotFoundError:
+    from .cache import TTLCache
+    from .constants import DIRECTORY_CACHE_SIZE, DIRECTORY_MISS_TTL, DIRECTORY_CHANGE_LOG
+
+
+class UserDirectory():
+    """
+    Maps each user name to its home shard: the date the user was created and the database that date and name
+    route to. A user's shard depends on its creation date, so without the directory a lookup by name alone has to
+    ask every shard.
+
+    Entries are persisted in a small local SQLite file (shared by the API and the CLI) and the most recently used
+    ones are kept in an in-memory LRU, so a warm lookup does not touch any database at all.
+
+    Every write also appends the users it changed to a change log in the file. A lookup first checks SQLite's
+    data_version, which only moves when another connection (e.g. the CLI, for a running API) committed to the file;
+    if it moved, the users logged since the last check are dropped from memory. Past `change_log` entries the
+    oldest are trimmed, and a process that fell further behind drops everything it holds in memory.
+
+    Once `cli.py directory rebuild` has filled it from every shard, the directory is marked complete: every user
+    created since is registered by the code that inserts it, so a user missing from a complete directory does not
+    exist. Users found missing are also remembered for `miss_ttl` seconds, so repeated misses (e.g. the lookup and
+    the insert of a first login) only ask the shards once.
+
+    Methods:
+    \tlookup - (date, db) for a user, or None if the user is not in the directory.\n
+    \tregister - add or replace one user's entry.\n
+    \tregister_many - add or replace many entries in one transaction.\n
+    \tforget - drop users from the directory.\n
+    \tforget_db - drop every user whose home is the given shard.\n
+    \tclear - drop everything, including the complete marker.\n
+    \tmark_complete, complete - set and read the marker that the directory holds every user.\n
+    \tremember_missing, known_missing - the short-lived cache of users found on no shard.\n
+    """
+    def __init__(self, path: str = ':memory:', cache_size: int = DIRECTORY_CACHE_SIZE, miss_ttl: float = DIRECTORY_MISS_TTL,
+                 change_log: int = DIRECTORY_CHANGE_LOG) -> None:
+        self.path = path
+        self.cache_size = cache_size
+        self.change_log = change_log
+        self._cache = OrderedDict()
+        self._missing = TTLCache(cache_size, miss_ttl)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL;')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS Directory(
+                user TEXT NOT NULL PRIMARY KEY,
+                date INTEGER NOT NULL,
+                db TEXT NOT NULL
+            );
+        """)
+        self._db.execute('CREATE INDEX IF NOT EXISTS directory_db ON Directory(db);')
+        self._db.execute('CREATE TABLE IF NOT EXISTS Meta(key TEXT NOT NULL PRIMARY KEY, value TEXT NOT NULL);')
+        # users changed by each write, in order; a NULL user means every user
+        self._db.execute('CREATE TABLE IF NOT EXISTS Changes(seq INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT);')
+        self._data_version = self._db.execute('PRAGMA data_version;').fetchone()[0]
+        self._seen = self._db.execute('SELECT COALESCE(MAX(seq), 0) FROM Changes;').fetchone()[0]
+
+    def _sync(self) -> None:
+        """
+        Drop the in-memory entries of users another process changed since the last call. Call with the lock held.
+        """
+        data_version = self._db.execute('PRAGMA data_version;').fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        oldest, newest = self._db.execute('SELECT MIN(seq), MAX(seq) FROM Changes;').fetchone()
+        if newest is None or newest <= self._seen:
+            return
+        changed = self._db.execute('SELECT user FROM Changes WHERE seq > ?;', (self._seen,)).fetchall()
+        if oldest > self._seen + 1 or any(user is None for (user,) in changed):
+            # changes were trimmed before this process saw them, or a change covered every user
+            self._cache.clear()
+            self._missing.clear()
+        else:
+            for (user,) in changed:
+                self._cache.pop(user, None)
+                self._missing.pop(user)
+        self._seen = newest
+
+    def _log(self, users: Iterable[Optional[str]]) -> None:
+        """
+        Append changed users to the change log and trim it. Call inside the writing transaction.
+        """
+        self._db.executemany('INSERT INTO Changes(user) VALUES (?);', [(user,) for user in users])
+        self._db.execute('DELETE FROM Changes WHERE seq <= (SELECT MAX(seq) FROM Changes) - ?;', (self.change_log,))
+
+    def _write(self, statements: list[tuple], changed: Iterable[Optional[str]]) -> None:
+        """
+        Run (sql, params, many) statements and log the changed users in one transaction. Call with the lock held.
+        """
+        self._db.execute('BEGIN;')
+        try:
+            for sql, params, many in statements:
+                if many:
+                    self._db.executemany(sql, params)
+                else:
+                    self._db.execute(sql, params)
+            self._log(changed)
+            self._db.execute('COMMIT;')
+        except BaseException:
+            self._db.execute('ROLLBACK;')
+            raise
+
+    def _remember(self, user: str, entry: tuple) -> None:
+        cache = self._cache
+        cache[user] = entry
+        cache.move_to_end(user)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def lookup(self, user: str) -> Optional[tuple[int, str]]:
+        with self._lock:
+            self._sync()
+            entry = self._cache.get(user)
+            if entry is not None:
+                self._cache.move_to_end(user)
+                return entry
+            row = self._db.execute('SELECT date, db FROM Directory WHERE user = ?;', (user,)).fetchone()
+            if row is None:
+                return None
+            entry = (row[0], row[1])
+            self._remember(user, entry)
+            return entry
+
+    def register(self, user: str, date: int, db: str) -> None:
+        self.register_many([(user, date, db)])
+
+    def register_many(self, entries: Iterable[tuple[str, int, str]]) -> int:
+        """
+        Parameters:
+        \tentries - (user, date, db) triples.\n
+
+        Returns:
+        \tcount - the number of entries written.
+        """
+        entries = [(user, int(date), db) for user, date, db in entries]
+        if not entries:
+            return 0
+        with self._lock:
+            self._write([('INSERT OR REPLACE INTO Directory(user, date, db) VALUES (?, ?, ?);', entries, True)],
+                        [user for user, _, _ in entries])
+            for user, date, db in entries:
+                self._remember(user, (date, db))
+                self._missing.pop(user)
+        return len(entries)
+
+    def forget(self, users: Iterable[str]) -> None:
+        users = list(users)
+        if not users:
+            return
+        with self._lock:
+            self._write([('DELETE FROM Directory WHERE user = ?;', [(user,) for user in users], True)], users)
+            for user in users:
+                self._cache.pop(user, None)
+
+    def forget_db(self, db: str) -> None:
+        with self._lock:
+            self._write([('DELETE FROM Directory WHERE db = ?;', (db,), False)], [None])
+            for user in [u for u, entry in self._cache.items() if entry[1] == db]:
+                del self._cache[user]
+
+    def drop_cache(self) -> None:
+        """
+        Forget the in-memory entries, so the next lookups read the SQLite file.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._missing.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._write([('DELETE FROM Directory;', (), False), ("DELETE FROM Meta WHERE key = 'complete';", (), False)], [None])
+            self._cache.clear()
+            self._missing.clear()
+
+    def mark_complete(self) -> None:
+        """
+        Record that the directory holds every user (after a rebuild from every shard).
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO Meta(key, value) VALUES ('complete', '1');")
+
+    @property
+    def complete(self) -> bool:
+        """
+        Whether a miss can be trusted. Read from the file, so a rebuild by another process is seen at once.
+        """
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM Meta WHERE key = 'complete';").fetchone() is not None
+
+    def remember_missing(self, user: str) -> None:
+        self._missing.put(user, True)
+
+    def known_missing(self, user: str) -> bool:
+        with self._lock:
+            self._sync()
+        return self._missing.get(user, False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM Directory;').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
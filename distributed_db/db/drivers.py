@@ -0,0 +1,346 @@
+from functools import lru_cache
+from typing import Optional
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+try:
+    from distributed_db.db.exceptions import UnknownDriverError
+    from distributed_db.db.constants import SQLITE_BUSY_TIMEOUT
+except ModuleNotFoundError:
+    from .exceptions import UnknownDriverError
+    from .constants import SQLITE_BUSY_TIMEOUT
+
+
+# the tables created by terraform/scripts/init_mysql.sh, in SQLite. Names compare case-insensitively, as they do
+# under MySQL's default collation.
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS Users(
+        user VARCHAR(32) NOT NULL COLLATE NOCASE,
+        password VARCHAR(32) NOT NULL,
+        date INT NOT NULL,
+        PRIMARY KEY (user)
+    );
+
+    CREATE TABLE IF NOT EXISTS Nba(
+        name VARCHAR(32) NOT NULL COLLATE NOCASE,
+        type VARCHAR(16) NOT NULL,
+        PRIMARY KEY (name)
+    );
+
+    CREATE TABLE IF NOT EXISTS Preferences(
+        user VARCHAR(32) NOT NULL COLLATE NOCASE,
+        nba_entity VARCHAR(32) NOT NULL COLLATE NOCASE,
+        preference VARCHAR(16) NOT NULL,
+        PRIMARY KEY (user, nba_entity, preference),
+        FOREIGN KEY (user)
+            REFERENCES Users(user)
+            ON DELETE CASCADE
+            ON UPDATE CASCADE,
+        FOREIGN KEY (nba_entity)
+            REFERENCES Nba(name)
+            ON DELETE RESTRICT
+            ON UPDATE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS FandomCounts(
+        nba_entity VARCHAR(32) NOT NULL COLLATE NOCASE,
+        type VARCHAR(16) NOT NULL,
+        preference VARCHAR(16) NOT NULL,
+        cnt INT NOT NULL,
+        PRIMARY KEY (nba_entity, type, preference)
+    );
+"""
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s|%%')
+_INSERT_IGNORE = re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_VALUES_OF = re.compile(r'\bVALUES\s*\(\s*(\w+)\s*\)', re.IGNORECASE)
+_LOCKING_READ = re.compile(r'\s+(FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE)\b', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def translate(query: str, placeholders: bool = True) -> str:
+    """
+    Rewrite the MySQL dialect used by this package into SQLite: %s / %(name)s placeholders, INSERT IGNORE,
+    ON DUPLICATE KEY UPDATE ... VALUES(column), and locking reads (SQLite locks the whole database on write anyway).
+
+    Parameters:
+    \tquery - a query written for pymysql.\n
+    \tplaceholders - rewrite the placeholders. pymysql leaves a query without parameters untouched, and so does this.\n
+    """
+    if placeholders:
+        query = _PLACEHOLDER.sub(lambda m: f':{m.group(1)}' if m.group(1) else ('?' if m.group(0) == '%s' else '%'), query)
+    query = _INSERT_IGNORE.sub('INSERT OR IGNORE', query)
+    parts = _ON_DUPLICATE.split(query, maxsplit=1)
+    if len(parts) == 2:
+        query = parts[0] + 'ON CONFLICT DO UPDATE SET' + _VALUES_OF.sub(r'excluded.\1', parts[1])
+    return _LOCKING_READ.sub('', query)
+
+
+def _mysql_error(err: sqlite3.Error) -> pymysql.err.MySQLError:
+    """
+    The pymysql exception (and MySQL error code) callers already handle for a SQLite error, e.g. 1062 for a
+    duplicate key and 1452 for a missing foreign key.
+    """
+    message = str(err)
+    if isinstance(err, sqlite3.IntegrityError):
+        if 'FOREIGN KEY' in message:
+            return pymysql.err.IntegrityError(1452, message)
+        if 'NOT NULL' in message:
+            return pymysql.err.IntegrityError(1048, message)
+        return pymysql.err.IntegrityError(1062, message)
+    if isinstance(err, sqlite3.OperationalError):
+        if 'no such table' in message:
+            return pymysql.err.ProgrammingError(1146, message)
+        if 'no such column' in message:
+            return pymysql.err.OperationalError(1054, message)
+        if 'syntax error' in message:
+            return pymysql.err.ProgrammingError(1064, message)
+        return pymysql.err.OperationalError(2013, message)
+    return pymysql.err.ProgrammingError(1064, message)
+
+
+class SQLiteCursor():
+    """
+    pymysql-style cursor over a sqlite3 cursor. Buffered cursors read the whole result on execute (and return its
+    row count), as pymysql's do; streaming cursors (SSCursor, SSDictCursor) fetch lazily.
+    """
+    def __init__(self, connection: 'SQLiteConnection', cursor_class=None) -> None:
+        cursor_class = cursor_class or pymysql.cursors.Cursor
+        self.connection = connection
+        self.streaming = issubclass(cursor_class, pymysql.cursors.SSCursor)
+        self._cursor = connection._db.cursor()
+        if issubclass(cursor_class, pymysql.cursors.DictCursorMixin):
+            self._cursor.row_factory = lambda cursor, row: {column[0]: value for column, value in zip(cursor.description, row)}
+        self._rows = None
+
+    def _run(self, call, query: str, args) -> int:
+        sql = translate(query, args is not None)
+        deadline = time.monotonic() + self.connection.timeout
+        delay = 0.001
+        while True:
+            try:
+                if args is None:
+                    call(sql)
+                else:
+                    call(sql, args)
+                break
+            except sqlite3.OperationalError as err:
+                # a shared in-memory database reports lock conflicts at once instead of waiting on them
+                if 'locked' not in str(err) or time.monotonic() > deadline:
+                    raise _mysql_error(err) from err
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+            except sqlite3.Error as err:
+                raise _mysql_error(err) from err
+
+        self._rows = None
+        if self._cursor.description is not None and not self.streaming:
+            self._rows = self._cursor.fetchall()
+            return len(self._rows)
+        return max(self._cursor.rowcount, 0)
+
+    def execute(self, query: str, args=None) -> int:
+        return self._run(self._cursor.execute, query, args)
+
+    def executemany(self, query: str, args) -> int:
+        args = list(args)
+        if not args:
+            return 0
+        return self._run(self._cursor.executemany, query, args)
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._rows.pop(0) if self._rows else None
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = size or self._cursor.arraysize
+        if self._rows is not None:
+            chunk, self._rows = self._rows[:size], self._rows[size:]
+            return chunk
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self) -> None:
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SQLiteConnection():
+    """
+    pymysql-style connection to one SQLite shard: cursor(), commit(), rollback(), ping(), open and server_status,
+    so the pools, the manager and the API use it unchanged. Like a pymysql connection it is not in autocommit mode.
+    """
+    def __init__(self, db: sqlite3.Connection, timeout: float) -> None:
+        self._db = db
+        self.timeout = timeout
+        self.open = True
+
+    def cursor(self, cursor_class=None) -> SQLiteCursor:
+        return SQLiteCursor(self, cursor_class)
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def rollback(self) -> None:
+        self._db.rollback()
+
+    def begin(self) -> None:
+        if not self._db.in_transaction:
+            self._db.execute('BEGIN;')
+
+    def ping(self, reconnect: bool = False) -> None:
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, 'Connection is closed.')
+        self._db.execute('SELECT 1;')
+
+    @property
+    def server_status(self) -> int:
+        return SERVER_STATUS.SERVER_STATUS_IN_TRANS if self._db.in_transaction else 0
+
+    def close(self) -> None:
+        if self.open:
+            self.open = False
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class MySQLDriver():
+    """
+    The default shard driver: pymysql connections to the MySQL server in the Connections entry.
+    """
+    name = 'mysql'
+
+    def connection_params(self, credentials: dict, base_params: dict) -> dict:
+        params = dict(base_params)
+        params['host'] = credentials['vm_ip']
+        params['user'] = credentials['mysql_username']
+        params['password'] = credentials['mysql_password']
+        params['database'] = credentials['mysql_database']
+        return params
+
+    def connect(self, params: dict):
+        return pymysql.connect(**params)
+
+    def size_query(self, database: str) -> tuple[str, tuple]:
+        """
+        Query and parameters for the bytes of data and indexes in the shard's schema.
+        """
+        return 'SELECT COALESCE(SUM(data_length + index_length), 0) FROM information_schema.TABLES WHERE table_schema = %s;', (database,)
+
+
+class SQLiteDriver():
+    """
+    Shard driver for local SQLite databases, one per shard, with the schema of init_mysql.sh. Lets the routing,
+    fan-out and API code run (and be benchmarked) on one machine without any MySQL server.
+
+    A Connections entry selects it with "driver": "sqlite" and "path": a database file, or ":memory:" for an
+    in-memory database. In-memory shards are shared by every connection to the same shard name in the process and
+    live until close_memory_databases() is called.
+    """
+    name = 'sqlite'
+
+    def __init__(self, timeout: float = SQLITE_BUSY_TIMEOUT) -> None:
+        self.timeout = timeout
+        self._memory = {}   # shard name -> connection that keeps its in-memory database alive
+        self._lock = threading.Lock()
+
+    def connection_params(self, credentials: dict, base_params: dict) -> dict:
+        return {'database': credentials['mysql_database'], 'path': credentials.get('path', ':memory:')}
+
+    def _open(self, params: dict) -> sqlite3.Connection:
+        if params['path'] == ':memory:':
+            target, uri = f"file:{params['database']}?mode=memory&cache=shared", True
+        else:
+            target, uri = params['path'], False
+        db = sqlite3.connect(target, timeout=self.timeout, uri=uri, check_same_thread=False)
+        db.execute('PRAGMA foreign_keys = ON;')
+        return db
+
+    def connect(self, params: dict) -> SQLiteConnection:
+        if params['path'] == ':memory:':
+            with self._lock:
+                if params['database'] not in self._memory:
+                    anchor = self._open(params)
+                    anchor.executescript(SQLITE_SCHEMA)
+                    self._memory[params['database']] = anchor
+            return SQLiteConnection(self._open(params), self.timeout)
+
+        db = self._open(params)
+        db.execute('PRAGMA journal_mode = WAL;')
+        db.executescript(SQLITE_SCHEMA)
+        return SQLiteConnection(db, self.timeout)
+
+    def size_query(self, database: str) -> tuple[str, tuple]:
+        return 'SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size();', ()
+
+    def close_memory_databases(self, names: Optional[list[str]] = None) -> None:
+        """
+        Drop in-memory shards (all of them by default). Connections still open keep working until closed.
+        """
+        with self._lock:
+            names = list(self._memory) if names is None else [n for n in names if n in self._memory]
+            anchors = [self._memory.pop(name) for name in names]
+        for anchor in anchors:
+            anchor.close()
+
+
+DRIVERS = {
+    'mysql': MySQLDriver(),
+    'sqlite': SQLiteDriver()
+}
+
+
+def get_driver(credentials: dict):
+    """
+    The driver named by a Connections entry's "driver" key; entries without one are MySQL.
+    """
+    name = credentials.get('driver', 'mysql')
+    if name not in DRIVERS:
+        raise UnknownDriverError(f'Choose one of {", ".join(DRIVERS)}.', name)
+    return DRIVERS[name]
+
+
+def sqlite_credentials(db: str, directory: Optional[str] = None) -> dict:
+    """
+    A Connections entry for a SQLite shard named `db`: a file in `directory`, or an in-memory database.
+    """
+    path = os.path.join(directory, f'{db}.sqlite') if directory else ':memory:'
+    return {'driver': 'sqlite', 'path': path, 'mysql_database': db}
@@ -37,4 +37,39 @@ class DuplicateDataError(Exception):
     
     def __str__(self) -> str:
         return f'Duplicate Data Error: This key already exists in the database -- {super().__str__()}'   
-    
\ No newline at end of file
+    
+
+class PoolExhaustedError(Exception):
+    def __init__(self, message, shard):
+        super().__init__(message)
+        self.shard = shard
+
+    def __str__(self) -> str:
+        return f'PoolExhaustedError: No connection available for {self.shard} -- {super().__str__()}'
+
+
+class UnknownHashError(Exception):
+    def __init__(self, message, name):
+        super().__init__(message)
+        self.name = name
+
+    def __str__(self) -> str:
+        return f'UnknownHashError: Invalid hash function {self.name} -- {super().__str__()}'
+
+
+class ReshardError(Exception):
+    def __init__(self, message, range_start):
+        super().__init__(message)
+        self.range_start = range_start
+
+    def __str__(self) -> str:
+        return f'ReshardError: Cannot reshard range {self.range_start} -- {super().__str__()}'
+
+
+class UnknownDriverError(Exception):
+    def __init__(self, message, name):
+        super().__init__(message)
+        self.name = name
+
+    def __str__(self) -> str:
+        return f'UnknownDriverError: Invalid shard driver {self.name} -- {super().__str__()}'
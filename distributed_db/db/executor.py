@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+import threading
+import time
+
+try:
+    from distributed_db.db.constants import SCATTER_MAX_WORKERS
+    from distributed_db.db.profiling import bind, note_shard
+except ModuleNotFoundError:
+    from .constants import SCATTER_MAX_WORKERS
+    from .profiling import bind, note_shard
+
+
+class ShardResult(NamedTuple):
+    """
+    The outcome of running one task against one shard.
+
+    Attributes:
+    \tdb - the shard name.\n
+    \tvalue - whatever the task returned (e.g. the rows of a query), or None if it failed.\n
+    \telapsed - seconds between the task starting on a worker and finishing (or timing out).\n
+    \terror - the exception raised by the task, a TimeoutError, or None.\n
+    """
+    db: str
+    value: Any
+    elapsed: float
+    error: Optional[BaseException] = None
+
+
+class ScatterGatherExecutor():
+    """
+    Runs one task per shard on a bounded thread pool and yields each shard's result as soon as it is ready.
+
+    The timeout is per shard and counts from the moment that shard's task actually starts on a worker, so shards
+    queued behind a full pool are not penalised for the wait. A shard that times out is reported with a
+    TimeoutError; its worker finishes in the background and its connection goes back to the pool.
+    """
+    def __init__(self, max_workers: int = SCATTER_MAX_WORKERS) -> None:
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scatter')
+            return self._pool
+
+    @staticmethod
+    def _timed(db: str, task: Callable[[], Any], started: dict) -> ShardResult:
+        start = time.perf_counter()
+        started[db] = start
+        note_shard(db)
+        try:
+            value = task()
+        except Exception as err:
+            return ShardResult(db, None, time.perf_counter() - start, err)
+        return ShardResult(db, value, time.perf_counter() - start)
+
+    def run(self, tasks: dict[str, Callable[[], Any]], timeout: Optional[float] = None) -> Iterator[ShardResult]:
+        """
+        Run every task concurrently.
+
+        Parameters:
+        \ttasks - {shard name: zero-argument callable}.\n
+        \ttimeout - per-shard timeout in seconds, or None to wait for every shard.\n
+
+        Returns:
+        \tresults - a generator of ShardResult, in completion order.
+        """
+        executor = self._executor()
+        started = {}
+        futures = {executor.submit(bind(self._timed), db, task, started): db for db, task in tasks.items()}
+        pending = set(futures)
+
+        while pending:
+            wait_for = None
+            if timeout is not None:
+                now = time.perf_counter()
+                deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                wait_for = max(0.0, min(deadlines) - now) if deadlines else timeout
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+            if timeout is not None:
+                now = time.perf_counter()
+                for future in list(pending):
+                    db = futures[future]
+                    if db in started and now - started[db] >= timeout and not future.done():
+                        pending.discard(future)
+                        yield ShardResult(db, None, now - started[db], TimeoutError(f'{db} did not answer within {timeout} sec'))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def critical_path(results: list[ShardResult]) -> Optional[ShardResult]:
+    """
+    The slowest shard in a scatter-gather, which is what bounds the latency of the whole read.
+    """
+    return max(results, key=lambda r: r.elapsed) if results else None
@@ -0,0 +1,128 @@
+"""
+Hash functions for placing a user on a shard within a range.
+
+Each range in the metadata records which function it was created with in metadata["Ranges"]["Hashes"]. Ranges
+without an entry use "legacy", the original sum-of-characters hash, so data written before this module existed
+stays addressable.
+
+Available functions:
+\tlegacy - sum(ord(c)) % modulus. Anagrams and similar names collide.\n
+\tmurmur3 - 32-bit MurmurHash3 of the UTF-8 name, % modulus.\n
+\txxhash - 64-bit xxHash of the UTF-8 name, % modulus. Needs the optional `xxhash` package.\n
+\tjump - jump consistent hash (Lamping & Veach) of a 64-bit digest of the name. Raising a range's modulus from n
+to m only moves (m - n) / m of its users.\n
+"""
+from hashlib import blake2b
+from typing import Callable
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    from distributed_db.db.exceptions import UnknownHashError
+except ModuleNotFoundError:
+    from .exceptions import UnknownHashError
+
+
+LEGACY_HASH = 'legacy'
+
+
+def legacy_hash(user: str, modulus: int) -> int:
+    return sum(ord(char) for char in user) % modulus
+
+
+def murmur3_32(data: bytes, seed: int = 0) -> int:
+    """
+    MurmurHash3 x86 32-bit.
+    """
+    c1 = 0xcc9e2d51
+    c2 = 0x1b873593
+    length = len(data)
+    h = seed & 0xffffffff
+    rounded = length & ~0x3
+
+    for i in range(0, rounded, 4):
+        k = data[i] | (data[i + 1] << 8) | (data[i + 2] << 16) | (data[i + 3] << 24)
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & 0xffffffff
+        h = (h * 5 + 0xe6546b64) & 0xffffffff
+
+    k = 0
+    tail = length & 0x3
+    if tail == 3:
+        k ^= data[rounded + 2] << 16
+    if tail >= 2:
+        k ^= data[rounded + 1] << 8
+    if tail >= 1:
+        k ^= data[rounded]
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h
+
+
+def murmur3_hash(user: str, modulus: int) -> int:
+    return murmur3_32(user.encode('utf-8')) % modulus
+
+
+def xxhash_hash(user: str, modulus: int) -> int:
+    return xxhash.xxh64_intdigest(user.encode('utf-8')) % modulus
+
+
+def jump_consistent_hash(key: int, num_buckets: int) -> int:
+    """
+    Jump consistent hash: maps a 64-bit key to a bucket in [0, num_buckets).
+    """
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xffffffffffffffff
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def jump_hash(user: str, modulus: int) -> int:
+    key = int.from_bytes(blake2b(user.encode('utf-8'), digest_size=8).digest(), 'little')
+    return jump_consistent_hash(key, modulus)
+
+
+HASH_FUNCTIONS = {
+    LEGACY_HASH: legacy_hash,
+    'murmur3': murmur3_hash,
+    'xxhash': xxhash_hash,
+    'jump': jump_hash
+}
+
+
+def get_hash_function(name: str) -> Callable[[str, int], int]:
+    """
+    Look up a hash function by the name recorded in the metadata.
+    """
+    if name is None:
+        name = LEGACY_HASH
+    if name not in HASH_FUNCTIONS:
+        raise UnknownHashError(f'Choose one of {", ".join(HASH_FUNCTIONS)}.', name)
+    if name == 'xxhash' and xxhash is None:
+        raise UnknownHashError('The xxhash package is not installed (pip install xxhash).', name)
+    return HASH_FUNCTIONS[name]
+
+
+def range_hashes(ranges: dict) -> list:
+    """
+    The hash function name of every range, filling in "legacy" for ranges created before hashes were recorded.
+    """
+    hashes = list(ranges.get('Hashes') or [])
+    return hashes + [LEGACY_HASH] * (len(ranges['Start']) - len(hashes))
@@ -1,15 +1,45 @@
 from datetime import datetime
 from pprint import pprint
 import json
+import os
+import re
 from typing import Optional
-from time import sleep
+from time import sleep, perf_counter
+from contextlib import contextmanager
+from functools import partial
 
 import pymysql
 
 try:
-    from distributed_db.db.exceptions import DateOutOfRangeError, MetadataDateError, TerraformError, EmptyMetadataError, DuplicateDataError
+    from distributed_db.db.exceptions import DateOutOfRangeError, MetadataDateError, TerraformError, EmptyMetadataError, DuplicateDataError, PoolExhaustedError
+    from distributed_db.db.pool import PoolManager
+    from distributed_db.db.constants import INSERT_BATCH_SIZE, SCATTER_TIMEOUT, STREAM_FETCH_SIZE, STREAM_PREFETCH, DIRECTORY_SUFFIX, LOCATE_DB_BUCKETS, CAPACITY_SUFFIX, QUERY_CACHE_SUFFIX
+    from distributed_db.db.capacity import CapacityMonitor
+    from distributed_db.db.metrics import MetricsRegistry
+    from distributed_db.db.profiling import note_shard
+    from distributed_db.db.streaming import ShardStream
+    from distributed_db.db.directory import UserDirectory
+    from distributed_db.db.cache import QueryCache
+    from distributed_db.db import counters
+    from distributed_db.db.executor import ScatterGatherExecutor, ShardResult
+    from distributed_db.db.routing import RoutingTable, HourClock
+    from distributed_db.db.store import MetadataStore, metadata_fingerprint
+    from distributed_db.db.hashing import get_hash_function, LEGACY_HASH
 except ModuleNotFoundError:
-    from .exceptions import DateOutOfRangeError, MetadataDateError, TerraformError, EmptyMetadataError, DuplicateDataError
+    from .exceptions import DateOutOfRangeError, MetadataDateError, TerraformError, EmptyMetadataError, DuplicateDataError, PoolExhaustedError
+    from .pool import PoolManager
+    from .constants import INSERT_BATCH_SIZE, SCATTER_TIMEOUT, STREAM_FETCH_SIZE, STREAM_PREFETCH, DIRECTORY_SUFFIX, LOCATE_DB_BUCKETS, CAPACITY_SUFFIX, QUERY_CACHE_SUFFIX
+    from .capacity import CapacityMonitor
+    from .metrics import MetricsRegistry
+    from .profiling import note_shard
+    from .streaming import ShardStream
+    from .directory import UserDirectory
+    from .cache import QueryCache
+    from . import counters
+    from .executor import ScatterGatherExecutor, ShardResult
+    from .routing import RoutingTable, HourClock
+    from .store import MetadataStore, metadata_fingerprint
+    from .hashing import get_hash_function, LEGACY_HASH
 
 MODULUS = 2
 
@@ -23,11 +53,45 @@ class DatabaseManager():
     \tcreate_data - create data and insert into database\n
     \tupdate_data - update data in the database\n
     \tdelete_data - delete data in the database\n
+    \tinsert_many - route a list of records to their shards and bulk insert them, one transaction per shard\n
+    \tscatter_gather - run one read query on many shards in parallel, streaming results back as shards finish (optionally through the query cache)\n
+    \tinvalidate_cache - drop cached reads of tables that were written to\n
+    \tstream_query - run one read query on many shards and yield the rows lazily through server-side cursors\n
+    \tbroadcast_insert - write rows of a replicated reference table to every shard in parallel, one statement per shard\n
+    \trebuild_counters - recompute the materialized fandom counters from the Preferences tables\n
+    \tfind_user - look up the shard a user lives on in the user directory\n
+    \tconnection - check a pooled connection to a shard out for the duration of a with-block\n
+    \tcapacity - the CapacityMonitor holding the last polled size of every shard\n
+    \tmeasure - record the latency, rows and errors of one operation on one shard in the metrics\n
     
     """
-    def __init__(self, metadata_path) -> None:
+    def __init__(self, metadata_path, directory_path: Optional[str] = None, capacity_path: Optional[str] = None, cache_path: Optional[str] = None,
+                 **pool_options) -> None:
         self.metadata_path = metadata_path
+        self.metadata_store = MetadataStore(metadata_path)
+        if directory_path is None:
+            directory_path = os.path.splitext(metadata_path)[0] + DIRECTORY_SUFFIX if metadata_path else ':memory:'
+        self.directory = UserDirectory(directory_path)
+        if capacity_path is None:
+            capacity_path = os.path.splitext(metadata_path)[0] + CAPACITY_SUFFIX if metadata_path else ':memory:'
         self.mysql_connection_params = {'port': 3306}
+        self.pools = PoolManager({'port': 3306, 'charset': 'utf8mb4'}, **pool_options)
+        self.executor = ScatterGatherExecutor()
+        if cache_path is None:
+            cache_path = os.path.splitext(metadata_path)[0] + QUERY_CACHE_SUFFIX if metadata_path else ':memory:'
+        self.query_cache = QueryCache(cache_path)
+        self.current_hour = HourClock()
+        self.capacity = CapacityMonitor(self, capacity_path)
+        self._routing_table = None
+        self._directory_version = None
+        
+        # per-shard latency, rows and errors, pool and cache gauges; served by the API at /metrics
+        self.metrics = MetricsRegistry()
+        self.operation_seconds = self.metrics.histogram('distributed_db_shard_operation_seconds', 'Time per operation on one shard, including the wait for a pooled connection.', ('shard', 'operation'))
+        self.operation_rows = self.metrics.counter('distributed_db_shard_rows_total', 'Rows returned or affected per shard and operation.', ('shard', 'operation'))
+        self.operation_errors = self.metrics.counter('distributed_db_shard_errors_total', 'Failed operations per shard, operation and exception type.', ('shard', 'operation', 'error'))
+        self.locate_seconds = self.metrics.histogram('distributed_db_locate_db_seconds', 'Time to route one record to its shard.', buckets=LOCATE_DB_BUCKETS)
+        self.metrics.add_collector(self.__collect_metrics)
         self.mysql_tables = {
             'user': 'Users',
             'users': 'Users',
@@ -35,95 +99,277 @@ class DatabaseManager():
             'nba': 'Nba',
             'username': 'Users'
         }
+        self.reference_tables = {
+            'nba': 'name'
+        }
+        # tables whose contents change when a table is written to (cascading deletes, fandom counters)
+        self.table_dependencies = {
+            'Users': ('Users', 'Preferences', 'FandomCounts'),
+            'Preferences': ('Preferences', 'FandomCounts'),
+            'Nba': ('Nba', 'FandomCounts')
+        }
+        self.insert_columns = {
+            'users': ['user', 'password', 'date'],
+            'prefs': ['user', 'nba_entity', 'preference'],
+            'nba': ['name', 'type']
+        }
         
     def set_database_params(self, credentials):
-        self.mysql_connection_params['host'] = credentials['vm_ip']
-        self.mysql_connection_params['user'] = credentials['mysql_username']
-        self.mysql_connection_params['password'] = credentials['mysql_password']
+        # SQLite shards (see drivers.py) have no host or MySQL user
+        self.mysql_connection_params['host'] = credentials.get('vm_ip')
+        self.mysql_connection_params['user'] = credentials.get('mysql_username')
+        self.mysql_connection_params['password'] = credentials.get('mysql_password')
         self.mysql_connection_params['database'] = credentials['mysql_database']
         
+    def connection(self, credentials: dict, timeout: Optional[float] = None):
+        """
+        Check a connection to one shard out of that shard's pool. Use as a context manager; the connection goes back
+        to the pool when the block exits.
+        
+        Parameters:
+        \tcredentials - the shard's entry in metadata['Connections'].\n
+        \ttimeout - seconds to wait if every connection to the shard is busy.\n
+        """
+        return self.pools.connection(credentials['mysql_database'], credentials, timeout)
+    
+    @contextmanager
+    def measure(self, shard: str, operation: str):
+        """
+        Time a block of work on one shard and record it in the metrics, with its error if it raises. The block can
+        report the rows it read or wrote by setting `outcome['rows']` on the dict it is given.
+        """
+        outcome = {'rows': 0}
+        note_shard(shard)
+        start = perf_counter()
+        try:
+            yield outcome
+        except Exception as err:
+            self.operation_errors.inc(shard=shard, operation=operation, error=type(err).__name__)
+            raise
+        finally:
+            self.operation_seconds.observe(perf_counter() - start, shard=shard, operation=operation)
+            if outcome['rows']:
+                self.operation_rows.inc(outcome['rows'], shard=shard, operation=operation)
+    
+    def __collect_metrics(self) -> None:
+        """
+        Copy the pool and query cache stats into the metrics before they are rendered.
+        """
+        connections = self.metrics.gauge('distributed_db_pool_connections', 'Pooled connections per shard that are checked out (in_use) or idle.', ('shard', 'state'))
+        max_size = self.metrics.gauge('distributed_db_pool_max_size', 'Max connections per shard pool.', ('shard',))
+        events = self.metrics.counter('distributed_db_pool_events_total', 'Pool events per shard (created, reused, evicted, discarded, waits, timeouts, ...).', ('shard', 'event'))
+        for shard, stats in self.pools.stats().items():
+            connections.set(stats['in_use'], shard=shard, state='in_use')
+            connections.set(stats['idle'], shard=shard, state='idle')
+            max_size.set(stats['max_size'], shard=shard)
+            for event in ('created', 'reused', 'evicted', 'discarded', 'failed_health_checks', 'waits', 'timeouts'):
+                events.set(stats[event], shard=shard, event=event)
+        
+        cache = self.query_cache.stats()
+        self.metrics.gauge('distributed_db_query_cache_entries', 'Entries in the query cache.').set(cache['entries'])
+        cache_events = self.metrics.counter('distributed_db_query_cache_events_total', 'Query cache hits, misses, stores, invalidations and evictions.', ('event',))
+        for event in ('hits', 'misses', 'stores', 'invalidations', 'evictions'):
+            cache_events.set(cache[event], event=event)
+        
+        size = self.metrics.gauge('distributed_db_shard_size_mb', 'Size of each shard at its last capacity poll.', ('shard',))
+        for shard, (size_mb, _) in self.capacity.snapshot().items():
+            size.set(size_mb, shard=shard)
+    
+    def cache_stats(self) -> dict:
+        """
+        Query cache counters (entries, hits, misses, hit_rate, stores, invalidations, evictions).
+        """
+        return self.query_cache.stats()
+    
+    def invalidate_cache(self, table: str) -> int:
+        """
+        Drop every cached read of a table that was just written to, and of the tables that change with it.
+        
+        Parameters:
+        \ttable - 'users', 'prefs', 'nba' or a MySQL table name.\n
+        """
+        mysql_table = self.mysql_tables.get(table, table)
+        return self.query_cache.invalidate(self.table_dependencies.get(mysql_table, (mysql_table,)))
+    
+    def tables_read(self, query: str) -> tuple[str, ...]:
+        """
+        The known tables a query mentions, used to tag its cached result.
+        """
+        tables = set(self.mysql_tables.values()) | {t for deps in self.table_dependencies.values() for t in deps}
+        return tuple(sorted(t for t in tables if re.search(rf'\b{t}\b', query, re.IGNORECASE)))
+    
+    def pool_stats(self) -> dict:
+        """
+        Per-shard pool counters (created, reused, evicted, in_use, idle, ...).
+        """
+        return self.pools.stats()
+    
+    def close(self) -> None:
+        self.capacity.close()
+        self.executor.shutdown()
+        self.pools.close_all()
+        self.directory.close()
+        self.query_cache.close()
+        
     def read_metadata(self) -> dict: 
         """
-        Read the metadata.
+        Read the metadata. The parsed file is cached by the metadata store and only re-parsed when it changes on
+        disk, so this is cheap to call per request. The returned dict is shared; do not modify it.
         """
-        with open(self.metadata_path, 'r') as file:
-            metadata = json.load(file)
-        return metadata
+        return self.metadata_store.get()
     
-    def calculate_hash(self, user: str, modulus: int) -> int:
+    @property
+    def metadata_version(self) -> int:
+        """
+        Version number of the metadata currently in use. Changes whenever the metadata file is rewritten.
+        """
+        return self.metadata_store.version
+    
+    def calculate_hash(self, user: str, modulus: int, hash_function: str = LEGACY_HASH) -> int:
         """
         Calculates the hash of the user's name based on the modulus.\n
         
         Parameters:
         \tuser - the user's name to be hashed.\n
         \tmodulus - the modulus for hashing, equal to the number of databases in the user's range partition.\n
+        \thash_function - name of the hash function recorded for the range in metadata["Ranges"]["Hashes"].\n
         
         Returns:
         \thash_value - the hash value of the user's name. 
         """
         
-        hash_value = sum(ord(char) for char in user) % modulus
+        hash_value = get_hash_function(hash_function)(user, modulus)
         
         return hash_value
 
     
-    def locate_db(self, metadata: dict,  data_date: int, user_name: str) -> int:
+    def routing_table(self, metadata: dict) -> RoutingTable:
+        """
+        Return the compiled routing table for this metadata, building it only when the metadata version changes.
+        Metadata that did not come from the metadata store is keyed on its "Ranges" object instead.
+        """
+        version = getattr(metadata, 'version', None)
+        table = self._routing_table
+        
+        if version is not None:
+            if table is None or table.key != version:
+                table = RoutingTable(metadata["Ranges"], key=version)
+                self._routing_table = table
+        elif table is None or table.key is not metadata["Ranges"]:
+            table = RoutingTable(metadata["Ranges"], key=metadata["Ranges"])
+            self._routing_table = table
+        return table
+    
+    def locate_db(self, metadata: dict,  data_date: int, user_name: str) -> str:
         """
-        Locate the index of the Metadata "Ranges" lists based on which range the data-origin-date falls in between.
+        Locate the database a record belongs to, based on which range the data-origin-date falls in between and
+        the hash of the user's name within that range.
         
         Parameters: 
-        \tavailable_partitions - a zip of the Metadata "Ranges" lists ("Start", "End", and "Moduli" sorted arrays).\n
+        \tmetadata - the partition metadata.\n
+        \tdata_date - the date the account/post was created, as YYYYMMDDHH.\n
+        \tuser_name - the user's name.\n
         
         Returns:
-        \ttarget_range_index: the index of the partition metadata two which the data_date belongs.
+        \tdb_name: the name of the database in metadata["Connections"], r<range start>h<hash value>.
         """
-        
-        available_partitions = list(
-            zip(
-                metadata["Ranges"]["Start"], 
-                metadata["Ranges"]["End"], 
-                metadata["Ranges"]["Moduli"]
-            )
-        )
-        
         if not isinstance(data_date, int):
             raise ValueError(f"Date must be of type int - got type {type(data_date).__name__} instead.")
-
-        now = datetime.now()
-        today = int(now.strftime("%Y%m%d%H"))
-        
-        if data_date > today:
-            raise DateOutOfRangeError("This date is in the future.", data_date)
-        elif data_date < available_partitions[0][0]:
-            raise DateOutOfRangeError("This date was prior to the initiation of the database system.", data_date)
-        elif data_date > available_partitions[-1][0]:
-            target_range_index = -1
-        else:
-            left = 0 
-            right = len(available_partitions)
-            while left <= right:
-                mid = (right + left) // 2
-                
-                db_start_date = available_partitions[mid][0]
-                db_end_date = available_partitions[mid][1] if available_partitions[mid][1] else today
-
-                if data_date < db_start_date:
-                    right = mid - 1
-                elif data_date > db_end_date:
-                    left = mid + 1
-                else:
-                    target_range_index = mid
-                    # print(target_range_index)
-                    break
         
-        modulus = available_partitions[target_range_index][2]
-        db_range_value = available_partitions[target_range_index][0]
-        db_hash_value = self.calculate_hash(user=user_name, modulus=modulus) 
+        start = perf_counter()
+        db = self.routing_table(metadata).locate(data_date, user_name, self.current_hour())
+        self.locate_seconds.observe(perf_counter() - start)
+        return db
+        
+    def find_user(self, user_name: str, metadata: Optional[dict] = None) -> Optional[tuple[int, str]]:
+        """
+        Find the shard a user lives on.
+        
+        The user directory answers without touching any database. On a miss (e.g. a user created before the
+        directory existed) every shard is asked once, and the answer is added to the directory. A miss is final
+        without asking any shard if the directory is complete (see UserDirectory), or if the same user was just
+        found on no shard.
+        
+        Returns:
+        \thome - (date the user was created, database name), or None if no shard has the user.
+        """
+        metadata = metadata if metadata is not None else self.read_metadata()
+        
+        # another process (e.g. a resharding) may have moved users and updated the directory file
+        version = getattr(metadata, 'version', None)
+        if version != self._directory_version:
+            self.directory.drop_cache()
+            self._directory_version = version
+        
+        home = self.directory.lookup(user_name)
+        if home is not None and home[1] in metadata['Connections']:
+            return home
+        if home is None and (self.directory.known_missing(user_name) or self.directory.complete):
+            return None
+        
+        found = []
+        query = "SELECT date FROM Users WHERE user = %s;"
+        for result in self.scatter_gather(query, params=(user_name,), metadata=metadata):
+            if not result.error and result.value:
+                found.append((result.value[0][0], result.db))
+        if not found:
+            self.directory.remember_missing(user_name)
+            return None
+        
+        # users logged in before the directory existed may have been created on more than one shard; the oldest
+        # entry is the one that owns the preferences written before then
+        home = min(found)
+        self.directory.register(user_name, home[0], home[1])
+        return home
+    
+    def home_shard(self, metadata: dict, user_name: str, data_date: Optional[int] = None) -> str:
+        """
+        The database a user's rows belong on: the directory entry if the user is known, else where `data_date`
+        routes to (for a brand new user, the creation date).
+        """
+        home = self.find_user(user_name, metadata)
+        if home is not None:
+            if metadata.get('Migrations'):
+                return self.__resharded_home(metadata, user_name, home)
+            return home[1]
+        if data_date is None:
+            raise DateOutOfRangeError("Unknown user and no date to place them with.", data_date)
+        return self.locate_db(metadata, data_date, user_name)
+    
+    def locate_candidates(self, metadata: dict, data_date: int, user_name: str) -> list[str]:
+        """
+        Where a record routes to, followed by where it routed to before if its range has been resharded (cut over)
+        but not cleaned up yet. See RangeResharder.
+        """
+        table = self.routing_table(metadata)
+        index = table.range_index(data_date, self.current_hour())
+        hash_function = table.hash_functions[index]
+        candidates = [table.names[index][hash_function(user_name, table.moduli[index])]]
         
-        db_name = f'r{db_range_value}h{db_hash_value}'
+        migration = metadata.get('Migrations', {}).get(str(table.starts[index]))
+        if migration and migration.get('State') == 'cleanup':
+            previous = f'r{table.starts[index]}h{hash_function(user_name, migration["Previous"])}'
+            if previous != candidates[0]:
+                candidates.append(previous)
+        return candidates
     
-        return db_name
+    def __resharded_home(self, metadata: dict, user_name: str, home: tuple[int, str]) -> str:
+        """
+        Dual read for a user whose range is between cutover and cleanup: the new shard if the user has been copied
+        there, else the old one.
+        """
+        try:
+            candidates = self.locate_candidates(metadata, int(home[0]), user_name)
+        except DateOutOfRangeError:
+            return home[1]
+        if len(candidates) < 2 or home[1] not in candidates:
+            return home[1]
         
+        for db in candidates:
+            if self.query_one("SELECT 1 FROM Users WHERE user = %s;", metadata['Connections'][db], params=(user_name,)):
+                return db
+        return home[1]
+    
     def insert_one(self, data: dict, table: str, credentials: dict):
         """
         Insert one record into one database.
@@ -169,19 +415,231 @@ class DatabaseManager():
             }
         
         try:
-            with pymysql.connect(**self.mysql_connection_params) as connection:
+            with self.measure(credentials['mysql_database'], 'insert') as outcome, self.connection(credentials) as connection:
                 with connection.cursor() as cursor:
-                    rows = cursor.execute(query, query_params)
-                    print(f'Query OK, {rows} rows affected -- DB {self.mysql_connection_params["database"]}')
+                    rows = outcome['rows'] = cursor.execute(query, query_params)
+                    if table == 'prefs':
+                        counters.apply(cursor, counters.deltas_for([(data['nba_entity'], data['preference'])]))
+                    print(f'Query OK, {rows} rows affected -- DB {credentials["mysql_database"]}')
                     connection.commit()
                     # return 1
+            if table == 'users':
+                self.directory.register(data['user'], data['date'], credentials['mysql_database'])
         except pymysql.err.OperationalError as e:
             raise e
         except pymysql.err.IntegrityError as err:
             if err.args[0] == 1062:
                 raise DuplicateDataError(err)
+        finally:
+            self.invalidate_cache(table)
+    
+    def group_by_shard(self, table: str, records: list[dict], metadata: dict) -> tuple[dict, list]:
+        """
+        Route every record to the shard it belongs to. Nba rows are reference data and go to every shard.
+        
+        Returns:
+        \tgroups - {shard name: [records]}\n
+        \tunroutable - [(record, reason)] for records that are missing fields or fall outside every range\n
+        """
+        groups = {}
+        unroutable = []
+        
+        if table in self.reference_tables:
+            for db in metadata['Connections']:
+                groups[db] = list(records)
+            return groups, unroutable
+        
+        for record in records:
+            try:
+                db = self.locate_db(metadata, record['date'], record['user'])
+            except KeyError as err:
+                unroutable.append((record, f'missing field {err}'))
+                continue
+            except (ValueError, DateOutOfRangeError) as err:
+                unroutable.append((record, str(err)))
+                continue
+            groups.setdefault(db, []).append(record)
+        
+        return groups, unroutable
+    
+    def insert_many(self, table: str, records: list[dict], metadata: Optional[dict] = None, batch_size: int = INSERT_BATCH_SIZE) -> dict:
+        """
+        Insert many records at once. Records are routed to their shards first, then each shard's group is written
+        with multi-row INSERTs of up to `batch_size` rows, all inside one transaction per shard.
+        
+        If a batch hits an integrity error, that batch is replayed row by row so the offending rows can be reported
+        and the rest of the batch still goes in.
+        Any other database error, or no free pooled connection to the shard, fails that shard's transaction only: it
+        is reported as (db, None, message) and the remaining shards are still written, so the report always matches
+        what was committed.
+        
+        Parameters:
+        \ttable - 'users', 'prefs' or 'nba'.\n
+        \trecords - the rows to insert, as dicts.\n
+        \tmetadata - the partition metadata. Read from disk if not given.\n
+        \tbatch_size - max number of rows per INSERT statement.\n
+        
+        Returns:
+        \treport - {'inserted': int, 'per_shard': {db: int}, 'duplicates': [...], 'missing_references': [...], 'errors': [...]}.
+        Duplicates and missing references are (db, record) pairs; errors are (db, record, message) triples.
+        """
+        metadata = metadata if metadata is not None else self.read_metadata()
+        
+        if table in self.reference_tables:
+            return self.__broadcast_report(self.broadcast_insert(table, records, metadata=metadata, batch_size=batch_size))
+        
+        columns = self.insert_columns[table]
+        query = f"""
+            INSERT INTO {self.mysql_tables[table]}({', '.join(columns)})
+            VALUES ({', '.join(['%s'] * len(columns))});
+        """
+        
+        report = {
+            'inserted': 0,
+            'per_shard': {},
+            'duplicates': [],
+            'missing_references': [],
+            'errors': []
+        }
+        
+        groups, unroutable = self.group_by_shard(table, records, metadata)
+        for record, reason in unroutable:
+            report['errors'].append((None, record, reason))
+        
+        for db, group in groups.items():
+            credentials = metadata['Connections'][db]
+            inserted = 0
+            inserted_records = []
+            
+            try:
+                with self.measure(db, 'insert_many') as outcome, self.connection(credentials) as connection:
+                    with connection.cursor() as cursor:
+                        for start in range(0, len(group), batch_size):
+                            batch = group[start:start + batch_size]
+                            try:
+                                rows = [tuple(record[c] for c in columns) for record in batch]
+                            except KeyError:
+                                rows = None
+                            
+                            if rows is not None:
+                                # executemany may split a batch into several statements, so a savepoint is needed to
+                                # undo the part of the batch that went in before the failing row
+                                cursor.execute('SAVEPOINT insert_batch;')
+                                try:
+                                    inserted += cursor.executemany(query, rows)
+                                    inserted_records.extend(batch)
+                                    continue
+                                except pymysql.err.IntegrityError:
+                                    cursor.execute('ROLLBACK TO SAVEPOINT insert_batch;')
+                            
+                            for record in batch:
+                                try:
+                                    inserted += cursor.execute(query, tuple(record[c] for c in columns))
+                                    inserted_records.append(record)
+                                except KeyError as err:
+                                    report['errors'].append((db, record, f'missing field {err}'))
+                                except pymysql.err.IntegrityError as err:
+                                    if err.args[0] == 1062:
+                                        report['duplicates'].append((db, record))
+                                    elif err.args[0] == 1452:
+                                        report['missing_references'].append((db, record))
+                                    else:
+                                        report['errors'].append((db, record, str(err)))
+                        
+                        if table == 'prefs':
+                            counters.apply(cursor, counters.deltas_for((r['nba_entity'], r['preference']) for r in inserted_records))
+                    connection.commit()
+                    outcome['rows'] = inserted
+            except (pymysql.err.MySQLError, PoolExhaustedError) as err:
+                # the shard's transaction was rolled back (or never started), and the shards before it are already committed
+                report['errors'].append((db, None, str(err)))
+                report['per_shard'][db] = 0
+                continue
+            
+            if table == 'users':
+                self.directory.register_many((r['user'], r['date'], db) for r in inserted_records)
+            
+            print(f'Query OK, {inserted} rows affected -- DB {db}')
+            report['per_shard'][db] = inserted
+            report['inserted'] += inserted
+        
+        self.invalidate_cache(table)
+        return report
     
+    def broadcast_insert(self, table: str, records: list[dict], metadata: Optional[dict] = None, dbs: Optional[list[str]] = None,
+                         upsert: bool = False, batch_size: int = INSERT_BATCH_SIZE, timeout: Optional[float] = SCATTER_TIMEOUT) -> dict:
+        """
+        Write the same rows of a replicated reference table (Nba) to every shard in parallel.
+        
+        Each shard gets one multi-row INSERT IGNORE per `batch_size` rows (normally a single statement) and one
+        commit, so adding a team to N shards costs one round trip per shard. Rows that already exist are skipped
+        by the database instead of raising; with `upsert` they are overwritten instead.
+        
+        Parameters:
+        \ttable - a replicated table ('nba').\n
+        \trecords - the rows to write, as dicts.\n
+        \tmetadata - the partition metadata. Read from disk if not given.\n
+        \tdbs - the shards to write to. Defaults to every shard.\n
+        \tupsert - update the non-key columns of rows that already exist instead of skipping them.\n
+        
+        Returns:
+        \treport - {db: {'written': rows inserted (or changed), 'skipped': rows already present, 'elapsed': sec, 'error': str or None}}.
+        """
+        if table not in self.reference_tables:
+            raise ValueError(f'{table} is not a replicated table.')
+        
+        columns = self.insert_columns[table]
+        key = self.reference_tables[table]
+        rows = [tuple(record[c] for c in columns) for record in records]
+        
+        if upsert:
+            updates = ', '.join(f'{c} = VALUES({c})' for c in columns if c != key)
+            query = f"""
+                INSERT INTO {self.mysql_tables[table]}({', '.join(columns)})
+                VALUES ({', '.join(['%s'] * len(columns))})
+                ON DUPLICATE KEY UPDATE {updates};
+            """
+        else:
+            query = f"""
+                INSERT IGNORE INTO {self.mysql_tables[table]}({', '.join(columns)})
+                VALUES ({', '.join(['%s'] * len(columns))});
+            """
+        
+        def write(db, credentials):
+            written = 0
+            with self.measure(db, 'broadcast_insert') as outcome, self.connection(credentials) as connection:
+                with connection.cursor() as cursor:
+                    for start in range(0, len(rows), batch_size):
+                        written += cursor.executemany(query, rows[start:start + batch_size])
+                connection.commit()
+                outcome['rows'] = written
+            return written
+        
+        report = {}
+        for result in self.run_on_shards(write, metadata=metadata, dbs=dbs, timeout=timeout):
+            written = result.value or 0
+            report[result.db] = {
+                'written': written,
+                'skipped': 0 if upsert or result.error else len(rows) - written,
+                'elapsed': result.elapsed,
+                'error': str(result.error) if result.error else None
+            }
+            print(f'Query OK, {written} rows affected -- DB {result.db}' if not result.error else f'Query FAILED -- DB {result.db}: {result.error}')
+        self.invalidate_cache(table)
+        return report
     
+    @staticmethod
+    def __broadcast_report(broadcast: dict) -> dict:
+        """
+        Reshape a broadcast_insert report into the insert_many report format.
+        """
+        return {
+            'inserted': sum(r['written'] for r in broadcast.values()),
+            'per_shard': {db: r['written'] for db, r in broadcast.items()},
+            'duplicates': [],
+            'missing_references': [],
+            'errors': [(db, None, r['error']) for db, r in broadcast.items() if r['error']]
+        }
     
     def delete_from_one(self, table, credentials, condition: Optional[str] = None):
         
@@ -189,21 +647,46 @@ class DatabaseManager():
         mysql_table = self.mysql_tables[table]
         
         if not condition:
-            delete_all = input(f'Are you sure you want to everything in {self.mysql_connection_params["database"]}.{mysql_table}? (Y/n): ')
+            delete_all = input(f'Are you sure you want to everything in {credentials["mysql_database"]}.{mysql_table}? (Y/n): ')
             if delete_all == 'Y':
                 query = f"""
                     DELETE FROM {mysql_table};  
                 """   
+            else:
+                return
         else:
             query = f"""
                     DELETE FROM {mysql_table}
                     WHERE {condition};  
                 """
-        with pymysql.connect(**self.mysql_connection_params) as connection:
+        with self.measure(credentials['mysql_database'], 'delete') as outcome, self.connection(credentials) as connection:
                 with connection.cursor() as cursor:
-                    rows = cursor.execute(query)
-                    print(f'Query OK, {rows} rows affected -- DB {self.mysql_connection_params["database"]}')
+                    if mysql_table == 'Users' and condition:
+                        cursor.execute(f'SELECT user FROM Users WHERE {condition};')
+                        deleted_users = [row[0] for row in cursor.fetchall()]
+                    
+                    # keep the fandom counters in step, including preferences removed by ON DELETE CASCADE
+                    if mysql_table == 'Preferences':
+                        deltas = counters.deltas_for_condition(cursor, condition or '1 = 1')
+                    elif mysql_table == 'Users' and condition:
+                        deltas = counters.deltas_for_condition(cursor, f'user IN (SELECT user FROM Users WHERE {condition})')
+                    else:
+                        deltas = None
+                    
+                    rows = outcome['rows'] = cursor.execute(query)
+                    if deltas is not None:
+                        counters.apply(cursor, deltas)
+                    elif mysql_table == 'Users':
+                        cursor.execute('DELETE FROM FandomCounts;')
+                    print(f'Query OK, {rows} rows affected -- DB {credentials["mysql_database"]}')
                     connection.commit()
+        self.invalidate_cache(table)
+        
+        if mysql_table == 'Users':
+            if condition:
+                self.directory.forget(deleted_users)
+            else:
+                self.directory.forget_db(credentials['mysql_database'])
                     
     def update_in_one(self, table, credentials, set_clause, condition: Optional[str] = None):
         
@@ -225,27 +708,130 @@ class DatabaseManager():
             """
         
         try:
-            with pymysql.connect(**self.mysql_connection_params) as connection:
+            with self.measure(credentials['mysql_database'], 'update') as outcome, self.connection(credentials) as connection:
                 with connection.cursor() as cursor:
-                    rows = cursor.execute(query)
-                    print(f'Query OK, {rows} rows affected -- DB {self.mysql_connection_params["database"]}')
+                    rows = outcome['rows'] = cursor.execute(query)
+                    # an arbitrary SET can move preferences between counters (or change an entity's type), so the
+                    # shard's counters are recomputed in the same transaction
+                    if mysql_table in ('Preferences', 'Nba') and rows:
+                        counters.rebuild(cursor)
+                    print(f'Query OK, {rows} rows affected -- DB {credentials["mysql_database"]}')
                     connection.commit()
         except pymysql.err.IntegrityError as err:
             if err.args[0] == 1062:
                 print('This update would create a duplicate row. Update aborted.')
+        finally:
+            self.invalidate_cache(table)
                 
                 
     def query_one(self, query, credentials, params: Optional[tuple[str]] = None):
         self.set_database_params(credentials)
 
-        with pymysql.connect(**self.mysql_connection_params) as connection:
+        with self.measure(credentials['mysql_database'], 'query') as outcome, self.connection(credentials) as connection:
             with connection.cursor() as cursor:
                 if params:
                     rows = cursor.execute(query, params)
                 else:
                     rows = cursor.execute(query)
-                print(f'Query OK, {rows} rows affected -- DB {self.mysql_connection_params["database"]}')
+                print(f'Query OK, {rows} rows affected -- DB {credentials["mysql_database"]}')
                 out = cursor.fetchall()
+                outcome['rows'] = len(out)
                 
                 return out
-        
\ No newline at end of file
+    
+    def run_on_shards(self, task, metadata: Optional[dict] = None, dbs: Optional[list[str]] = None, timeout: Optional[float] = SCATTER_TIMEOUT):
+        """
+        Run `task(db, credentials)` on many shards at once.
+        
+        Parameters:
+        \ttask - callable taking the shard name and its credentials.\n
+        \tmetadata - the partition metadata. Read from disk if not given.\n
+        \tdbs - the shards to run on. Defaults to every shard in metadata['Connections'].\n
+        \ttimeout - per-shard timeout in seconds, or None to wait indefinitely.\n
+        
+        Returns:
+        \tresults - a generator of ShardResult(db, value, elapsed, error), yielded as each shard finishes.
+        """
+        metadata = metadata if metadata is not None else self.read_metadata()
+        dbs = dbs if dbs is not None else list(metadata['Connections'])
+        tasks = {db: partial(task, db, metadata['Connections'][db]) for db in dbs}
+        return self.executor.run(tasks, timeout=timeout)
+    
+    def scatter_gather(self, query, params: Optional[tuple] = None, metadata: Optional[dict] = None, dbs: Optional[list[str]] = None,
+                       timeout: Optional[float] = SCATTER_TIMEOUT, cache: bool = False):
+        """
+        Run the same read query on all (or some) shards in parallel.
+        
+        With `cache`, the per-shard results are served from the query cache (shared by every process using the same
+        metadata file) if the same query, parameters, shards and metadata were read before, the entry has not expired,
+        and none of the tables the query reads has been written to through a DatabaseManager since. Only complete
+        reads, where every shard answered, are cached. Cached results are replayed with an elapsed time of 0.
+        
+        Returns:
+        \tresults - a generator of ShardResult whose value is the shard's rows, yielded as each shard finishes.
+        """
+        if not cache:
+            return self.run_on_shards(lambda db, credentials: self.query_one(query, credentials, params=params), metadata=metadata, dbs=dbs, timeout=timeout)
+        
+        metadata = metadata if metadata is not None else self.read_metadata()
+        fingerprint = getattr(metadata, 'fingerprint', None) or metadata_fingerprint(metadata)
+        key = self.query_cache.key(query, params, fingerprint, dbs)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return (ShardResult(db, value, 0.0, None) for db, value in cached)
+        
+        tables = self.tables_read(query)
+        generation = self.query_cache.generation(tables)
+        results = self.run_on_shards(lambda db, credentials: self.query_one(query, credentials, params=params), metadata=metadata, dbs=dbs, timeout=timeout)
+        return self.__fill_cache(key, tables, generation, results)
+    
+    def __fill_cache(self, key: tuple, tables: tuple, generation: tuple, results):
+        collected = []
+        for result in results:
+            collected.append(result)
+            yield result
+        if not any(result.error for result in collected):
+            self.query_cache.put(key, tuple((result.db, result.value) for result in collected), tables, generation)
+    
+    def stream_query(self, query, params: Optional[tuple] = None, metadata: Optional[dict] = None, dbs: Optional[list[str]] = None,
+                     fetch_size: int = STREAM_FETCH_SIZE, prefetch: int = STREAM_PREFETCH, dict_rows: bool = False,
+                     shard_results: Optional[list] = None):
+        """
+        Run the same read query on all (or some) shards and yield the rows lazily, using unbuffered server-side
+        cursors. Memory stays bounded by roughly (prefetch + shards) * fetch_size rows, however many rows match.
+        
+        Parameters:
+        \tquery - the SELECT to run on every shard.\n
+        \tparams - query parameters.\n
+        \tmetadata - the partition metadata. Read from disk if not given.\n
+        \tdbs - the shards to read. Defaults to every shard in metadata['Connections'].\n
+        \tfetch_size - rows read from a cursor at a time.\n
+        \tprefetch - max number of fetched chunks waiting to be consumed.\n
+        \tdict_rows - yield dicts (SSDictCursor) instead of tuples (SSCursor).\n
+        \tshard_results - optional list that receives a ShardResult(db, row count, elapsed, error) per shard.\n
+        
+        Returns:
+        \trows - a generator over the rows of every shard.
+        """
+        metadata = metadata if metadata is not None else self.read_metadata()
+        dbs = dbs if dbs is not None else list(metadata['Connections'])
+        connections = {db: metadata['Connections'][db] for db in dbs}
+        return iter(ShardStream(self.pools, query, params, connections, fetch_size=fetch_size, prefetch=prefetch,
+                                dict_rows=dict_rows, shard_results=shard_results))
+    
+    def rebuild_counters(self, metadata: Optional[dict] = None, dbs: Optional[list[str]] = None) -> dict:
+        """
+        Recompute the materialized fandom counters of all (or some) shards from their Preferences, in parallel.
+        
+        Returns:
+        \treport - {db: number of counters written, or the error}.
+        """
+        def rebuild(db, credentials):
+            with self.measure(db, 'rebuild_counters') as outcome, self.connection(credentials) as connection:
+                with connection.cursor() as cursor:
+                    written = outcome['rows'] = counters.rebuild(cursor)
+                connection.commit()
+            return written
+        
+        return {result.db: result.error or result.value for result in self.run_on_shards(rebuild, metadata=metadata, dbs=dbs, timeout=None)}
+
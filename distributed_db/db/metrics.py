@@ -0,0 +1,211 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+import math
+import re
+import threading
+import time
+
+try:
+    from distributed_db.db.constants import LATENCY_BUCKETS
+except ModuleNotFoundError:
+    from .constants import LATENCY_BUCKETS
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric():
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """
+        For counters kept elsewhere (e.g. by the pools) and copied in when the metrics are collected.
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def lines(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.label_names, key)} {_number(value)}' for key, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+
+class Histogram(_Metric):
+    """
+    Counts of observations at or below each bucket bound, plus their sum and count, per label set.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def lines(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class MetricsRegistry():
+    """
+    Thread-safe set of counters, gauges and histograms, rendered in the Prometheus text exposition format.
+
+    Collectors are callables run just before rendering, to copy in numbers that are kept elsewhere (pool and cache
+    stats) instead of updating metrics on every event.
+
+    Methods:
+    \tcounter, gauge, histogram - get (or create) a metric by name.\n
+    \tadd_collector - register a callable run before every render.\n
+    \trender - the text format served at /metrics.\n
+    """
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labels: Iterable[str], **options):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} is already registered as a {metric.kind}.')
+            return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.lines())
+        return '\n'.join(lines) + '\n'
+
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_text(text: str) -> list[tuple[str, dict, float]]:
+    """
+    Parse the text format back into (name, labels, value) samples, e.g. to summarize /metrics in the CLI.
+    """
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE.match(line)
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        labels = {key: re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), raw) for key, raw in _LABEL.findall(labels or '')}
+        samples.append((name, labels, float(value)))
+    return samples
+
+
+def histogram_quantile(q: float, buckets: list[tuple[float, float]]) -> Optional[float]:
+    """
+    Estimate a quantile from cumulative (upper bound, count) buckets, interpolating linearly inside the bucket the
+    quantile falls in (as Prometheus' histogram_quantile does). Returns None if there are no observations.
+    """
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == math.inf:
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
@@ -0,0 +1,265 @@
+from contextlib import contextmanager
+from collections import deque
+from typing import Optional
+import threading
+import time
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+try:
+    from distributed_db.db.exceptions import PoolExhaustedError
+    from distributed_db.db.constants import POOL_MAX_SIZE, POOL_IDLE_TIMEOUT, POOL_HEALTH_CHECK_INTERVAL, POOL_ACQUIRE_TIMEOUT
+    from distributed_db.db.drivers import MySQLDriver, get_driver
+except ModuleNotFoundError:
+    from .exceptions import PoolExhaustedError
+    from .constants import POOL_MAX_SIZE, POOL_IDLE_TIMEOUT, POOL_HEALTH_CHECK_INTERVAL, POOL_ACQUIRE_TIMEOUT
+    from .drivers import MySQLDriver, get_driver
+
+
+class ConnectionPool():
+    """
+    A bounded pool of connections to a single shard, opened by the shard's driver (pymysql by default).
+
+    Connections are handed out LIFO so the warmest connection is reused first, which lets the oldest idle
+    connections age out and get evicted after `idle_timeout` seconds. A connection that has sat idle for longer
+    than `health_check_interval` seconds is pinged before being handed out, and replaced if the ping fails.
+
+    Methods:
+    \tacquire - check a connection out of the pool, opening a new one if the pool is not full.\n
+    \trelease - return a connection to the pool, or discard it.\n
+    \tconnection - context manager wrapping acquire/release.\n
+    \tstats - counters and gauges for the pool.\n
+    \tclose - close every idle connection.\n
+    """
+    def __init__(self, name: str, connection_params: dict, max_size: int = POOL_MAX_SIZE,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT, health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+                 acquire_timeout: float = POOL_ACQUIRE_TIMEOUT, driver=None) -> None:
+        self.name = name
+        self.driver = driver if driver is not None else MySQLDriver()
+        self.connection_params = dict(connection_params)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()     # (connection, time it was returned to the pool)
+        self._in_use = 0
+        self._lock = threading.Condition()
+        self._closed = False
+
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'evicted': 0,
+            'discarded': 0,
+            'failed_health_checks': 0,
+            'waits': 0,
+            'timeouts': 0
+        }
+
+    def _open(self):
+        connection = self.driver.connect(self.connection_params)
+        with self._lock:
+            self._stats['created'] += 1
+        return connection
+
+    @staticmethod
+    def _close_quietly(connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now: float) -> list:
+        """
+        Pop connections that have been idle longer than the idle timeout. Must be called holding the lock.
+        The oldest connections sit at the left end of the deque.
+        """
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+            self._stats['evicted'] += 1
+        return expired
+
+    def _is_healthy(self, connection) -> bool:
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._stats['failed_health_checks'] += 1
+            return False
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Check a connection out of the pool.
+
+        Parameters:
+        \ttimeout - seconds to wait for a free connection when the pool is full. Defaults to the pool's acquire timeout.\n
+
+        Returns:
+        \tconnection - an open connection (pymysql, or the driver's equivalent). It must be given back with release().
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise PoolExhaustedError('Pool has been closed.', self.name)
+
+                expired = self._evict_idle(time.monotonic())
+
+                candidate = None
+                idle_since = None
+                if self._idle:
+                    candidate, idle_since = self._idle.pop()
+                    self._in_use += 1
+                elif self._in_use < self.max_size:
+                    self._in_use += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhaustedError(f'No free connection after {timeout} sec.', self.name)
+                    self._stats['waits'] += 1
+                    self._lock.wait(remaining)
+                    continue
+
+            for connection in expired:
+                self._close_quietly(connection)
+
+            # network I/O happens outside of the lock
+            try:
+                if candidate is not None:
+                    if time.monotonic() - idle_since < self.health_check_interval or self._is_healthy(candidate):
+                        with self._lock:
+                            self._stats['reused'] += 1
+                        return candidate
+                    self._close_quietly(candidate)
+                    with self._lock:
+                        self._stats['discarded'] += 1
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+
+    @staticmethod
+    def _reset(connection) -> bool:
+        """
+        Roll back a transaction the borrower left open, so the next borrower does not inherit its locks or its
+        REPEATABLE READ snapshot. Returns False if the connection is no longer usable.
+        """
+        try:
+            if connection.server_status is not None and connection.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def release(self, connection, discard: bool = False) -> None:
+        """
+        Return a connection to the pool. A transaction that was neither committed nor rolled back is rolled back.
+
+        Parameters:
+        \tconnection - a connection previously returned by acquire().\n
+        \tdiscard - close the connection instead of keeping it, e.g. after a network error.\n
+        """
+        if not discard:
+            discard = not self._reset(connection)
+
+        with self._lock:
+            self._in_use -= 1
+            if discard or self._closed or not connection.open:
+                self._stats['discarded'] += 1
+                keep = False
+            else:
+                self._idle.append((connection, time.monotonic()))
+                keep = True
+            self._lock.notify()
+
+        if not keep:
+            self._close_quietly(connection)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Context manager that checks a connection out and gives it back on exit. The connection is dropped if it
+        lost its link to the server.
+        """
+        connection = self.acquire(timeout)
+        discard = False
+        try:
+            yield connection
+        except pymysql.err.OperationalError:
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out['in_use'] = self._in_use
+            out['idle'] = len(self._idle)
+            out['max_size'] = self.max_size
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._lock.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+
+class PoolManager():
+    """
+    Holds one ConnectionPool per shard, keyed by the shard name used in metadata['Connections'].
+
+    A shard's pool is created lazily the first time it is used, with the driver named in the shard's entry (see
+    drivers.get_driver). If the credentials for a shard change (e.g. the metadata file was rewritten with a new
+    vm_ip) the old pool is closed and replaced.
+    """
+    def __init__(self, base_params: Optional[dict] = None, **pool_options) -> None:
+        self.base_params = base_params or {}
+        self.pool_options = pool_options
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def connection_params(self, credentials: dict) -> dict:
+        return get_driver(credentials).connection_params(credentials, self.base_params)
+
+    def get_pool(self, shard: str, credentials: dict) -> ConnectionPool:
+        driver = get_driver(credentials)
+        params = driver.connection_params(credentials, self.base_params)
+        stale = None
+        with self._lock:
+            pool = self._pools.get(shard)
+            if pool is None or pool.connection_params != params or pool.driver is not driver:
+                stale = pool
+                pool = ConnectionPool(shard, params, driver=driver, **self.pool_options)
+                self._pools[shard] = pool
+        if stale is not None:
+            stale.close()
+        return pool
+
+    def connection(self, shard: str, credentials: dict, timeout: Optional[float] = None):
+        return self.get_pool(shard, credentials).connection(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pools = dict(self._pools)
+        return {shard: pool.stats() for shard, pool in pools.items()}
+
+    def close_all(self) -> None:
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
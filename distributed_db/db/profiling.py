@@ -0,0 +1,271 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Optional
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+try:
+    from distributed_db.db.constants import PROFILE_DIR, PROFILE_MIN_MS
+except ModuleNotFoundError:
+    from .constants import PROFILE_DIR, PROFILE_MIN_MS
+
+
+# the profile of the request or command running in this context, if it was sampled
+_current: ContextVar[Optional['Profile']] = ContextVar('profile', default=None)
+
+
+class Profile():
+    """
+    One sampled request or CLI command. Work done on other threads (the async manager's pool, scatter-gather
+    workers) is captured by its own cProfile profiler and merged into the same stats.
+
+    Parameters:
+    \tkind - 'api' or 'cli'.\n
+    \tname - the route or command.\n
+    \ttags - anything else to write next to the profile.\n
+    """
+    def __init__(self, kind: str, name: str, tags: Optional[dict] = None) -> None:
+        self.kind = kind
+        self.name = name
+        self.tags = dict(tags or {})
+        self.shards = set()
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.path = None
+        # set if a slice of the work could not be profiled (Python 3.12+ allows one active profiler at a time)
+        self.partial = False
+        self._profilers = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def capture(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self.partial = True
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._profilers.append(profiler)
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profilers = list(self._profilers)
+        if not profilers:
+            return None
+        return pstats.Stats(*profilers)
+
+
+class _Stepped():
+    """
+    Awaits a coroutine with the profile's profiler enabled only while the coroutine itself runs, so the other
+    requests interleaved on the event loop are not counted in it.
+    """
+    def __init__(self, coroutine, profile: Profile) -> None:
+        self.coroutine = coroutine
+        self.profile = profile
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            with self.profile.capture():
+                try:
+                    yielded = self.coroutine.throw(error) if error is not None else self.coroutine.send(value)
+                except StopIteration as stop:
+                    return stop.value
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                self.coroutine.close()
+                raise
+            except BaseException as err:
+                value, error = None, err
+
+
+class Profiler():
+    """
+    Profiles a sampled fraction of API requests or CLI commands with cProfile, and keeps the ones slower than a
+    threshold. Each kept profile is written to `directory` as three files sharing a name:
+    \t.pstats - the cProfile stats, for `python3 -m pstats` or snakeviz.\n
+    \t.collapsed - collapsed stacks ("a;b;c <microseconds>") for flamegraph.pl or speedscope.\n
+    \t.json - route or command, shards touched, duration and tags.\n
+
+    Parameters:
+    \tdirectory - where profiles are written.\n
+    \tsample_rate - fraction of requests (or commands) profiled, from 0 to 1.\n
+    \tmin_ms - profiles of requests faster than this are thrown away.\n
+    """
+    def __init__(self, directory: str = PROFILE_DIR, sample_rate: float = 1.0, min_ms: float = PROFILE_MIN_MS) -> None:
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.min_ms = min_ms
+        self._random = random.Random()
+
+    @classmethod
+    def from_environment(cls) -> Optional['Profiler']:
+        """
+        A profiler configured by DISTRIBUTED_DB_PROFILE (the sample rate, e.g. 0.01; unset or 0 is off),
+        DISTRIBUTED_DB_PROFILE_DIR and DISTRIBUTED_DB_PROFILE_MIN_MS, or None if profiling is off.
+        """
+        sample_rate = float(os.environ.get('DISTRIBUTED_DB_PROFILE') or 0)
+        if sample_rate <= 0:
+            return None
+        return cls(os.environ.get('DISTRIBUTED_DB_PROFILE_DIR', PROFILE_DIR), min(sample_rate, 1.0),
+                   float(os.environ.get('DISTRIBUTED_DB_PROFILE_MIN_MS', PROFILE_MIN_MS)))
+
+    def start(self, kind: str, name: str, **tags) -> Optional[Profile]:
+        if self._random.random() >= self.sample_rate:
+            return None
+        return Profile(kind, name, tags)
+
+    def finish(self, profile: Profile) -> Optional[str]:
+        """
+        Returns:
+        \tpath - the path of the written profile without its extension, or None if it was faster than min_ms.
+        """
+        profile.duration = time.perf_counter() - profile.start
+        if profile.duration * 1e3 < self.min_ms:
+            return None
+        stats = profile.stats()
+        if stats is None:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', profile.name).strip('_') or 'root'
+        path = os.path.join(self.directory, f"{profile.started:%Y%m%d-%H%M%S-%f}-{profile.kind}-{slug}-{profile.duration * 1e3:.0f}ms")
+        stats.dump_stats(path + '.pstats')
+        with open(path + '.collapsed', 'w') as file:
+            file.writelines(f'{stack} {weight}\n' for stack, weight in collapsed_stacks(stats))
+        with open(path + '.json', 'w') as file:
+            json.dump({
+                'kind': profile.kind,
+                'name': profile.name,
+                'started': profile.started.isoformat(timespec='milliseconds'),
+                'duration_ms': round(profile.duration * 1e3, 3),
+                'shards': sorted(profile.shards),
+                'partial': profile.partial,
+                'pid': os.getpid(),
+                'tags': profile.tags
+            }, file, indent=2)
+        profile.path = path
+        return path
+
+    @contextmanager
+    def session(self, kind: str, name: str, **tags):
+        """
+        Profile the body of a with-block (e.g. a whole CLI command) if it is sampled.
+        """
+        profile = self.start(kind, name, **tags)
+        if profile is None:
+            yield None
+            return
+        token = _current.set(profile)
+        try:
+            with profile.capture():
+                yield profile
+        finally:
+            _current.reset(token)
+            self.finish(profile)
+
+    def wrap(self, view: Callable, name: Callable[[], str]) -> Callable:
+        """
+        Wrap an async view so sampled calls are profiled. `name` is called at the start of each call, e.g. to
+        read the route of the current request.
+        """
+        @wraps(view)
+        async def profiled(*args, **kwargs):
+            profile = self.start('api', name())
+            if profile is None:
+                return await view(*args, **kwargs)
+            token = _current.set(profile)
+            try:
+                return await _Stepped(view(*args, **kwargs), profile)
+            finally:
+                _current.reset(token)
+                self.finish(profile)
+        return profiled
+
+
+def bind(function: Callable) -> Callable:
+    """
+    If the caller is being profiled, return a version of `function` that profiles itself into the caller's
+    profile on whatever thread it runs on. Used when work is handed to a thread pool.
+    """
+    profile = _current.get()
+    if profile is None:
+        return function
+
+    @wraps(function)
+    def bound(*args, **kwargs):
+        token = _current.set(profile)
+        try:
+            with profile.capture():
+                return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
+
+
+def note_shard(db: str) -> None:
+    """
+    Tag the profile being captured, if any, with a shard it touched.
+    """
+    profile = _current.get()
+    if profile is not None:
+        profile.shards.add(db)
+
+
+def _label(function: tuple) -> str:
+    filename, line, name = function
+    label = name if filename == '~' else f'{name} ({os.path.basename(filename)}:{line})'
+    return label.replace(';', ':')
+
+
+def collapsed_stacks(stats: pstats.Stats, max_depth: int = 64) -> list[tuple[str, int]]:
+    """
+    Rebuild collapsed stacks with weights in microseconds from cProfile's caller graph, starting from the
+    functions without callers. cProfile keeps only caller-callee pairs, so the time of a function reached from
+    several places is split between them in proportion to the time each caller spent in it.
+    """
+    children = defaultdict(list)
+    roots = []
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            if caller != function:
+                children[caller].append((function, cumulative))
+        if not any(caller != function for caller in callers):
+            roots.append(function)
+
+    total = sum(stats.stats[root][3] for root in roots)
+    cutoff = max(1e-6, total / 10000)
+    weights = defaultdict(float)
+
+    def walk(function: tuple, stack: tuple, share: float) -> None:
+        _, _, own, cumulative, _ = stats.stats[function]
+        weights[stack] += own * share
+        if len(stack) >= max_depth:
+            return
+        for child, edge in children[function]:
+            child_cumulative = stats.stats[child][3]
+            if child_cumulative <= 0 or edge * share < cutoff or _label(child) in stack:
+                continue
+            walk(child, stack + (_label(child),), edge * share / child_cumulative)
+
+    for root in roots:
+        walk(root, (_label(root),), 1.0)
+    return sorted((';'.join(stack), round(weight * 1e6)) for stack, weight in weights.items() if round(weight * 1e6) > 0)
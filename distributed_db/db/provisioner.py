@@ -10,19 +10,28 @@ import pymysql
 
 try:
     from distributed_db.db.exceptions import DateOutOfRangeError, MetadataDateError, TerraformError, EmptyMetadataError
-    from distributed_db.db.constants import DEFAULT_MODULUS
+    from distributed_db.db.constants import DEFAULT_MODULUS, DEFAULT_HASH
+    from distributed_db.db.hashing import get_hash_function, range_hashes
+    from distributed_db.db.store import write_metadata
+    from distributed_db.db.manager import DatabaseManager
 except ModuleNotFoundError:
     from .exceptions import DateOutOfRangeError, MetadataDateError, TerraformError, EmptyMetadataError
-    from .constants import DEFAULT_MODULUS
+    from .constants import DEFAULT_MODULUS, DEFAULT_HASH
+    from .hashing import get_hash_function, range_hashes
+    from .store import write_metadata
+    from .manager import DatabaseManager
 
 
 class DatabaseProvisioner():
-    def __init__(self, metadata_path, terraform_dir) -> None:
+    def __init__(self, metadata_path, terraform_dir, capacity=None) -> None:
         self._modulus = DEFAULT_MODULUS
+        self._hash_function = DEFAULT_HASH
         self.metadata_path = metadata_path
         self.TERRAFORM_DIR = terraform_dir
         self.instances = []
         self.capacities = {}
+        # CapacityMonitor used by check_capacities; by default that of a DatabaseManager on the same metadata
+        self.capacity = capacity
         self.__init_new_dbs = False
         self.__new_metadata = {}
         
@@ -31,6 +40,20 @@ class DatabaseProvisioner():
     def update_modulus(self, new_modulus: int) -> None:
         self._modulus = new_modulus
     
+    def update_hash_function(self, hash_function: str) -> None:
+        get_hash_function(hash_function)
+        self._hash_function = hash_function
+    
+    @staticmethod
+    def __record_hash(metadata: dict, hash_function: str) -> None:
+        """
+        Record the hash function of a newly appended range. Older metadata files have no "Hashes" list; their
+        existing ranges are back-filled as "legacy" so they keep routing the way they always have.
+        """
+        hashes = range_hashes(metadata['Ranges'])
+        hashes[-1] = hash_function
+        metadata['Ranges']['Hashes'] = hashes
+    
     def read_metadata(self) -> dict:
         """
         Reads the metadata file and returns it as a dictionary
@@ -52,6 +75,7 @@ class DatabaseProvisioner():
         metadata['Ranges']['Start'] = [start_range]
         metadata['Ranges']['End'] = [None]
         metadata['Ranges']['Moduli'] = [modulus]
+        metadata['Ranges']['Hashes'] = [self._hash_function]
         
         for db in db_ips:
             metadata['Connections'][db] = {
@@ -60,8 +84,7 @@ class DatabaseProvisioner():
                 "mysql_database": db,
                 "vm_ip": db_ips[db]
             }
-        with open(self.metadata_path, 'w') as file:
-            json.dump(metadata, file, indent=4)
+        write_metadata(self.metadata_path, metadata)
             
     def __mark_dbs_for_close(self) -> int:
         """
@@ -85,8 +108,7 @@ class DatabaseProvisioner():
         else:
             raise MetadataDateError("Invalid Date", prev_end_range)
         
-        with open(self.metadata_path, 'w') as file:
-            json.dump(metadata, file, indent=4)
+        write_metadata(self.metadata_path, metadata)
         
         return next_range
     
@@ -104,6 +126,7 @@ class DatabaseProvisioner():
         metadata['Ranges']['Start'].append(next_range_start)
         metadata['Ranges']['End'].append(None)
         metadata['Ranges']['Moduli'].append(self._modulus)
+        self.__record_hash(metadata, self._hash_function)
         
         db_dict = {}
         for i, d in enumerate(new_db_ips):
@@ -117,8 +140,7 @@ class DatabaseProvisioner():
                 "vm_ip": db_dict[db]
             }
         
-        with open(self.metadata_path, 'w') as file:
-            json.dump(metadata, file, indent=4)
+        write_metadata(self.metadata_path, metadata)
             
     
     def initiate_distributed_db(self, modulus: Optional[int] = None):
@@ -214,17 +236,18 @@ class DatabaseProvisioner():
         
         metadata['Connections'] = {}
         
-        with open(self.metadata_path, 'w') as file:
-            json.dump(metadata, file, indent=4)
+        write_metadata(self.metadata_path, metadata)
     
     def __get_instance_map(self) -> str:  ###
         
         instances_map = {}
         
         metadata = self.read_metadata()
+        
+        # shards provisioned for a range split that has not been cut over yet are only listed in "Migrations"
+        pending = [db for migration in metadata.get('Migrations', {}).values() for db in migration.get('Connections', {})]
             
-            
-        for instance in metadata['Connections']:
+        for instance in list(metadata['Connections']) + pending:
             instances_map[instance] = {
                 'mysql_username': instance,
                 'mysql_password': instance,
@@ -265,38 +288,27 @@ class DatabaseProvisioner():
     def start_virtual_machines(self, vms: list = None) -> None:
         pass 
     
-    def check_capacities(self):
+    def check_capacities(self, max_age: Optional[float] = None):
+        """
+        Shard sizes from the capacity monitor (capacity.py): the last snapshot, with shards whose sample is missing
+        or older than `max_age` (the monitor's TTL by default) polled in parallel first.
         
-        # current_instances = self.retrieve_previous_session()
-        metadata = self.read_metadata()
-        current_range = metadata['Ranges']['Start'][-1]
+        Returns:
+        \tcapacities - {db: "<size> MB"}.\n
+        \tnear_full - the hosts (or file paths) of shards above the monitor's near_full_mb.\n
+        """
+        if self.capacity is None:
+            self.capacity = DatabaseManager(self.metadata_path).capacity
         
+        metadata = self.read_metadata()
         capacities = {}
         near_full = []
         
-        for db in metadata['Connections']:
-            # if db in [f'r{current_range}h{h}' for h in range(metadata['Ranges']['Moduli'][-1])]:
-            size = f"""select size 
-            from (
-                SELECT 
-                    table_schema AS "Database", 
-                    ROUND(SUM(data_length + index_length) / 1024 / 1024, 2) AS size 
-                FROM 
-                    information_schema.TABLES 
-                GROUP BY 
-                    table_schema
-            ) s 
-            where s.database = "{db}";"""
-            
-            host = metadata['Connections'][db]['vm_ip']
-            
-            with pymysql.Connection(host=host, user=db, database=db, password=db) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(size)
-                    exists = cursor.fetchone()
-                    capacities[db] = f'{exists[0]} MB'
-                    if exists[0] > 3000:
-                        near_full.append(host)
+        for db, (size, _) in self.capacity.capacities(metadata, max_age).items():
+            capacities[db] = f'{size} MB'
+            if size > self.capacity.near_full_mb:
+                credentials = metadata['Connections'][db]
+                near_full.append(credentials.get('vm_ip', credentials.get('path')))
                         
         self.capacities = capacities            
         return capacities, near_full
@@ -305,9 +317,9 @@ class DatabaseProvisioner():
         instances_map = {}
         
         metadata = self.read_metadata()
+        pending = [db for migration in metadata.get('Migrations', {}).values() for db in migration.get('Connections', {})]
             
-            
-        for instance in metadata['Connections']:
+        for instance in list(metadata['Connections']) + pending:
             instances_map[instance] = {
                 'mysql_username': instance,
                 'mysql_password': instance,
@@ -339,21 +351,10 @@ class DatabaseProvisioner():
     #         self.add_databases(modulus)
  
     
-    def add_databases(self, modulus: int): ###
+    def __apply_instances(self, new_dbs: list) -> dict:
         """
-        if capacities over threshold (75%?): create new databases with new modulus
+        Run terraform for every shard in the metadata plus `new_dbs`, and return the public IP of each instance.
         """
-        now = int(datetime.now().strftime("%Y%m%d%H"))
-        
-        
-        metadata = self.read_metadata()
-        current_range = metadata['Ranges']['Start'][-1]   
-        metadata['Ranges']['End'][-1] = now - 1
-
-        new_range = now
-        new_dbs = [f'r{new_range}h{i}' for i in range(modulus)]
-        
-        
         instances_map = self.__new_instance_map(new_instances=new_dbs)
         
         init_command = [
@@ -394,7 +395,46 @@ class DatabaseProvisioner():
 
         output = subprocess.run(outputs_command, capture_output=True)
         
-        db_ips = json.loads(output.stdout.decode())['public_ips']['value']
+        return json.loads(output.stdout.decode())['public_ips']['value']
+    
+    def provision_shards(self, new_dbs: list) -> dict:
+        """
+        Provision MySQL instances for extra shards of an existing range (a range split) without adding them to the
+        metadata "Connections"; the resharder does that at cutover.
+        
+        Returns:
+        \tconnections - {db: credentials} in the metadata "Connections" format.
+        """
+        db_ips = self.__apply_instances(new_dbs)
+        return {
+            db: {
+                "mysql_username": db,
+                "mysql_password": db,
+                "mysql_database": db,
+                "vm_ip": db_ips[db]
+            }
+            for db in new_dbs
+        }
+    
+    def add_databases(self, modulus: int, hash_function: Optional[str] = None): ###
+        """
+        if capacities over threshold (75%?): create new databases with new modulus
+        the new range places users with `hash_function` (defaults to DEFAULT_HASH)
+        """
+        hash_function = hash_function or self._hash_function
+        get_hash_function(hash_function)
+        now = int(datetime.now().strftime("%Y%m%d%H"))
+        
+        
+        metadata = self.read_metadata()
+        current_range = metadata['Ranges']['Start'][-1]   
+        metadata['Ranges']['End'][-1] = now - 1
+
+        new_range = now
+        new_dbs = [f'r{new_range}h{i}' for i in range(modulus)]
+        
+        
+        db_ips = self.__apply_instances(new_dbs)
         
 
         self.__init_new_dbs = False
@@ -403,6 +443,7 @@ class DatabaseProvisioner():
         metadata['Ranges']['Start'].append(new_range)
         metadata['Ranges']['End'].append(None)
         metadata['Ranges']['Moduli'].append(modulus)
+        self.__record_hash(metadata, hash_function)
 
         for db in new_dbs:
             metadata['Connections'][db] = {
@@ -412,8 +453,7 @@ class DatabaseProvisioner():
                 "vm_ip": db_ips[db]
             }
         
-        with open(self.metadata_path, 'w') as file:
-            json.dump(metadata, file, indent=4)
+        write_metadata(self.metadata_path, metadata)
         
 
 
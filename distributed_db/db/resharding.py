@@ -0,0 +1,375 @@
+from typing import Optional
+import json
+import time
+
+try:
+    from distributed_db.db.constants import RESHARD_BATCH_SIZE, RESHARD_GRACE_PERIOD
+    from distributed_db.db.exceptions import ReshardError
+    from distributed_db.db.hashing import get_hash_function, range_hashes
+    from distributed_db.db.store import write_metadata
+except ModuleNotFoundError:
+    from .constants import RESHARD_BATCH_SIZE, RESHARD_GRACE_PERIOD
+    from .exceptions import ReshardError
+    from .hashing import get_hash_function, range_hashes
+    from .store import write_metadata
+
+
+class RangeResharder():
+    """
+    Online split of an existing range: raises the range's modulus from M to N and moves every user (with their
+    preferences) whose hash changes onto the shard it now belongs on, while the range keeps serving traffic.
+
+    Phases:
+    \tplan - dry run. Scans the range and counts the users and preferences that would move.\n
+    \tbegin - records the split in metadata "Migrations". Routing keeps using the old modulus.\n
+    \tcopy - streams the range's users off every old shard and copies the movers to their new shard in batches,
+    then runs a catch-up pass for whatever changed during the first one.\n
+    \tcutover - one atomic metadata write switches the range to the new modulus and adds the new shards.\n
+    \tcleanup - after a grace period, so every process has picked up the new metadata, copies users created on an
+    old shard in the meantime, re-syncs moved users that changed on their old shard since the catch-up pass, and
+    deletes the moved users from their old shards.\n
+
+    Until cutover the old shards are authoritative and serve all reads and writes. Between cutover and cleanup,
+    DatabaseManager.home_shard reads both the new and the old location of a moved user (dual read).
+
+    Writes are not blocked during the split, so a moved user can still be written on its old shard after the
+    catch-up pass: by any process until cutover, and by processes still routing with the old metadata for up to the
+    metadata check interval after it. Cleanup compares every moved user on its old shard with what the catch-up
+    pass copied and copies the changed ones again (or drops the copy of a user deleted in the window) before
+    deleting anything. A user written on both sides in that window keeps the old shard's version; a write reaching
+    an old shard after cleanup's re-sync (a process that missed the metadata change for longer than the grace
+    period) is lost.
+
+    With the jump hash, raising the modulus only moves users onto the new shards. With other hash functions users
+    also move between existing shards, and show up twice in cross-shard reads until cleanup.
+    """
+    def __init__(self, dbm, metadata_path: str, batch_size: int = RESHARD_BATCH_SIZE, grace_period: float = RESHARD_GRACE_PERIOD) -> None:
+        self.dbm = dbm
+        self.metadata_path = metadata_path
+        self.batch_size = batch_size
+        self.grace_period = grace_period
+
+    def read_metadata(self) -> dict:
+        with open(self.metadata_path, 'r') as file:
+            return json.load(file)
+
+    @staticmethod
+    def new_shards(range_start: int, modulus: int, new_modulus: int) -> list[str]:
+        return [f'r{range_start}h{h}' for h in range(modulus, new_modulus)]
+
+    def _range(self, metadata: dict, range_start: int, new_modulus: int) -> dict:
+        """
+        Validate the split and collect what every phase needs to know about the range.
+        """
+        ranges = metadata['Ranges']
+        if range_start not in ranges['Start']:
+            raise ReshardError('No range starts at this date.', range_start)
+        index = ranges['Start'].index(range_start)
+        modulus = ranges['Moduli'][index]
+        if new_modulus <= modulus:
+            raise ReshardError(f'The new modulus must be larger than the current one ({modulus}).', range_start)
+
+        hash_name = range_hashes(ranges)[index]
+        end = ranges['End'][index]
+        where = 'Users.date >= %s' + (' AND Users.date <= %s' if end is not None else '')
+        return {
+            'index': index,
+            'start': range_start,
+            'modulus': modulus,
+            'new_modulus': new_modulus,
+            'hash': hash_name,
+            'hash_function': get_hash_function(hash_name),
+            'sources': [f'r{range_start}h{h}' for h in range(modulus)],
+            'new_shards': self.new_shards(range_start, modulus, new_modulus),
+            'where': where,
+            'params': (range_start,) if end is None else (range_start, end)
+        }
+
+    def _target(self, split: dict, user: str) -> str:
+        return f'r{split["start"]}h{split["hash_function"](user, split["new_modulus"])}'
+
+    def plan(self, range_start: int, new_modulus: int, metadata: Optional[dict] = None) -> dict:
+        """
+        Dry run: count the users and preferences that would move, without writing anything.
+
+        Returns:
+        \tplan - {'range', 'modulus', 'new_modulus', 'hash', 'new_shards', 'scanned', 'users', 'preferences',
+        'moves': {(source, target): {'users': int, 'preferences': int}}}.
+        """
+        metadata = metadata if metadata is not None else self.read_metadata()
+        split = self._range(metadata, range_start, new_modulus)
+
+        query = f"""
+            SELECT Users.user, COUNT(Preferences.user)
+            FROM Users
+            LEFT JOIN Preferences ON Preferences.user = Users.user
+            WHERE {split['where']}
+            GROUP BY Users.user;
+        """
+        moves = {}
+        scanned = 0
+        for source in split['sources']:
+            for user, preferences in self.dbm.stream_query(query, split['params'], metadata=metadata, dbs=[source]):
+                scanned += 1
+                target = self._target(split, user)
+                if target != source:
+                    entry = moves.setdefault((source, target), {'users': 0, 'preferences': 0})
+                    entry['users'] += 1
+                    entry['preferences'] += int(preferences)
+
+        return {
+            'range': range_start,
+            'modulus': split['modulus'],
+            'new_modulus': new_modulus,
+            'hash': split['hash'],
+            'new_shards': split['new_shards'],
+            'scanned': scanned,
+            'users': sum(m['users'] for m in moves.values()),
+            'preferences': sum(m['preferences'] for m in moves.values()),
+            'moves': moves
+        }
+
+    def run(self, range_start: int, new_modulus: int, connections: dict) -> dict:
+        """
+        Split the range, from begin to cleanup.
+
+        Parameters:
+        \trange_start - the "Start" of the range to split.\n
+        \tnew_modulus - the range's new number of shards.\n
+        \tconnections - credentials of the new shards r<start>h<modulus>..r<start>h<new_modulus - 1>, as returned
+        by DatabaseProvisioner.provision_shards.\n
+
+        Returns:
+        \treport - {'moved': users moved before cutover, 'late': users created on an old shard between the
+        catch-up pass and cutover, 'resynced': moved users copied again because they changed on their old shard
+        after the catch-up pass, 'removed': copies dropped because the user was deleted during the copy,
+        'counters': {db: counters rebuilt}}.
+        """
+        metadata = self.read_metadata()
+        split = self._range(metadata, range_start, new_modulus)
+        missing = [db for db in split['new_shards'] if db not in connections]
+        if missing:
+            raise ReshardError(f'No connection details for {", ".join(missing)}.', range_start)
+
+        self.begin(split, connections)
+        view = dict(metadata, Connections={**metadata['Connections'], **connections})
+        self._seed_reference_tables(view, split)
+
+        moved = self._copy_range(view, split)
+        copied = {}
+        caught_up = self._copy_range(view, split, copied=copied)
+        removed = self._drop_copies(view, {user: moved[user] for user in moved.keys() - caught_up.keys()})
+
+        self.cutover(split, caught_up)
+        time.sleep(self.grace_period)
+        report = self.cleanup(split, caught_up, copied)
+        report['removed'] = removed
+        return report
+
+    def begin(self, split: dict, connections: dict) -> None:
+        metadata = self.read_metadata()
+        migrations = metadata.setdefault('Migrations', {})
+        if str(split['start']) in migrations:
+            raise ReshardError('This range is already being resharded.', split['start'])
+        migrations[str(split['start'])] = {
+            'State': 'copying',
+            'Modulus': split['new_modulus'],
+            'Connections': {db: connections[db] for db in split['new_shards']}
+        }
+        write_metadata(self.metadata_path, metadata)
+
+    def cutover(self, split: dict, moved: dict) -> None:
+        """
+        Switch the range to the new modulus and add the new shards to "Connections", in one metadata write.
+        """
+        metadata = self.read_metadata()
+        migration = metadata['Migrations'][str(split['start'])]
+        metadata['Ranges']['Moduli'][split['index']] = split['new_modulus']
+        metadata['Connections'].update(migration.pop('Connections'))
+        migration['State'] = 'cleanup'
+        migration['Previous'] = split['modulus']
+        write_metadata(self.metadata_path, metadata)
+
+        self.dbm.metadata_store.reload()
+        self.dbm.directory.register_many((user, date, target) for user, (date, _, target) in moved.items())
+        self.dbm.query_cache.clear()
+
+    def cleanup(self, split: dict, moved: dict, copied: Optional[dict] = None) -> dict:
+        """
+        Copy users created on an old shard since the catch-up pass, re-sync moved users that changed on their old
+        shard since then, delete every moved user from its old shard, rebuild the fandom counters of every shard
+        involved, and remove the "Migrations" entry.
+
+        Parameters:
+        \tmoved - {user: (date, source, target)} from the catch-up pass.\n
+        \tcopied - {user: state} of what the catch-up pass copied (see _read_users). Without it every moved user is
+        copied again.\n
+        """
+        metadata = self.read_metadata()
+        resynced = self._resync(metadata, moved, copied or {})
+        scanned = self._copy_range(metadata, split, fill=True)
+        late = {user: entry for user, entry in scanned.items() if user not in moved}
+        self.dbm.directory.register_many((user, date, target) for user, (date, _, target) in late.items())
+
+        gone = {**moved, **late}
+        by_source = {}
+        for user, (_, source, _) in gone.items():
+            by_source.setdefault(source, []).append(user)
+        for source, users in by_source.items():
+            credentials = metadata['Connections'][source]
+            for start in range(0, len(users), self.batch_size):
+                batch = users[start:start + self.batch_size]
+                with self.dbm.connection(credentials) as connection:
+                    with connection.cursor() as cursor:
+                        # preferences go with the users through ON DELETE CASCADE
+                        cursor.execute(f"DELETE FROM Users WHERE user IN ({', '.join(['%s'] * len(batch))});", batch)
+                    connection.commit()
+
+        touched = sorted(set(split['sources']) | set(split['new_shards']) | {target for _, _, target in gone.values()})
+        rebuilt = self.dbm.rebuild_counters(metadata=metadata, dbs=touched)
+
+        metadata = self.read_metadata()
+        metadata['Migrations'].pop(str(split['start']), None)
+        if not metadata['Migrations']:
+            del metadata['Migrations']
+        write_metadata(self.metadata_path, metadata)
+        self.dbm.metadata_store.reload()
+        self.dbm.query_cache.clear()
+
+        return {'moved': len(moved), 'late': len(late), 'resynced': resynced, 'counters': rebuilt}
+
+    def _seed_reference_tables(self, view: dict, split: dict) -> None:
+        """
+        New shards start empty; copy the replicated Nba table onto them before any preference is copied.
+        """
+        rows = self.dbm.query_one('SELECT name, type FROM Nba;', view['Connections'][split['sources'][0]])
+        records = [{'name': name, 'type': nba_type} for name, nba_type in rows]
+        if records:
+            self.dbm.broadcast_insert('nba', records, metadata=view, dbs=split['new_shards'])
+
+    def _copy_range(self, view: dict, split: dict, fill: bool = False, copied: Optional[dict] = None) -> dict:
+        """
+        Stream the range's users off every old shard and copy the ones whose shard changes, a batch per target.
+        If `copied` is given, the state of every user copied is recorded in it.
+
+        Returns:
+        \tmoved - {user: (date, source, target)}.
+        """
+        moved = {}
+        query = f"SELECT Users.user, Users.date FROM Users WHERE {split['where']};"
+        for source in split['sources']:
+            pending = {}
+            for user, date in self.dbm.stream_query(query, split['params'], metadata=view, dbs=[source]):
+                target = self._target(split, user)
+                if target == source:
+                    continue
+                moved[user] = (date, source, target)
+                batch = pending.setdefault(target, [])
+                batch.append(user)
+                if len(batch) >= self.batch_size:
+                    self._copy_users(view, source, target, batch, fill, copied)
+                    pending[target] = []
+            for target, batch in pending.items():
+                if batch:
+                    self._copy_users(view, source, target, batch, fill, copied)
+        return moved
+
+    def _read_users(self, credentials: dict, users: list[str]) -> tuple[list, list]:
+        """
+        Returns:
+        \tuser_rows - (user, password, date) of the users found.\n
+        \tpreference_rows - (user, nba_entity, preference) of their preferences.\n
+        """
+        placeholders = ', '.join(['%s'] * len(users))
+        with self.dbm.connection(credentials) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT user, password, date FROM Users WHERE user IN ({placeholders});', users)
+                user_rows = [tuple(row) for row in cursor.fetchall()]
+                cursor.execute(f'SELECT user, nba_entity, preference FROM Preferences WHERE user IN ({placeholders});', users)
+                preference_rows = [tuple(row) for row in cursor.fetchall()]
+            connection.commit()
+        return user_rows, preference_rows
+
+    @staticmethod
+    def _states(user_rows: list, preference_rows: list) -> dict:
+        """
+        {user: (password, date, sorted preferences)}, to tell whether a user changed between two reads.
+        """
+        preferences = {}
+        for user, nba_entity, preference in preference_rows:
+            preferences.setdefault(user, []).append((nba_entity, preference))
+        return {user: (password, str(date), tuple(sorted(preferences.get(user, [])))) for user, password, date in user_rows}
+
+    def _copy_users(self, view: dict, source: str, target: str, users: list[str], fill: bool = False, copied: Optional[dict] = None) -> None:
+        """
+        Copy a batch of users and their preferences from one shard to another, in one transaction on the target.
+
+        By default the target's copy is made identical to the source's (the copy and catch-up passes, and the
+        re-sync at cleanup). With `fill`, only users the target does not have yet are copied, so writes made on the
+        target after cutover are kept. If `copied` is given, the state of every user copied is recorded in it.
+        """
+        placeholders = ', '.join(['%s'] * len(users))
+        user_rows, preference_rows = self._read_users(view['Connections'][source], users)
+        if copied is not None:
+            copied.update(self._states(user_rows, preference_rows))
+
+        with self.dbm.connection(view['Connections'][target]) as connection:
+            with connection.cursor() as cursor:
+                if fill:
+                    cursor.execute(f'SELECT user FROM Users WHERE user IN ({placeholders});', users)
+                    present = {row[0] for row in cursor.fetchall()}
+                    user_rows = [row for row in user_rows if row[0] not in present]
+                    preference_rows = [row for row in preference_rows if row[0] not in present]
+                    cursor.executemany('INSERT IGNORE INTO Users(user, password, date) VALUES (%s, %s, %s);', user_rows)
+                else:
+                    cursor.execute(f'DELETE FROM Preferences WHERE user IN ({placeholders});', users)
+                    cursor.executemany("""
+                        INSERT INTO Users(user, password, date)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE password = VALUES(password), date = VALUES(date);
+                    """, user_rows)
+                cursor.executemany('INSERT IGNORE INTO Preferences(user, nba_entity, preference) VALUES (%s, %s, %s);', preference_rows)
+            connection.commit()
+
+    def _resync(self, metadata: dict, moved: dict, copied: dict) -> int:
+        """
+        Copy again, replacing the target's copy, every moved user whose rows on its old shard differ from what the
+        catch-up pass copied, and drop the copies of moved users deleted from their old shard since then.
+
+        Returns:
+        \tcount - the users copied again or dropped.
+        """
+        by_route = {}
+        for user, (_, source, target) in moved.items():
+            by_route.setdefault((source, target), []).append(user)
+
+        changed = 0
+        for (source, target), users in by_route.items():
+            for start in range(0, len(users), self.batch_size):
+                batch = users[start:start + self.batch_size]
+                states = self._states(*self._read_users(metadata['Connections'][source], batch))
+                stale = [user for user in batch if user in states and states[user] != copied.get(user)]
+                deleted = {user: moved[user] for user in batch if user not in states}
+                if stale:
+                    self._copy_users(metadata, source, target, stale)
+                if deleted:
+                    self._drop_copies(metadata, deleted)
+                changed += len(stale) + len(deleted)
+        return changed
+
+    def _drop_copies(self, view: dict, stale: dict) -> int:
+        """
+        Delete the copies of users that were copied by the first pass but deleted from their old shard before the
+        catch-up pass.
+        """
+        by_target = {}
+        for user, (_, _, target) in stale.items():
+            by_target.setdefault(target, []).append(user)
+        for target, users in by_target.items():
+            with self.dbm.connection(view['Connections'][target]) as connection:
+                with connection.cursor() as cursor:
+                    for start in range(0, len(users), self.batch_size):
+                        batch = users[start:start + self.batch_size]
+                        cursor.execute(f"DELETE FROM Users WHERE user IN ({', '.join(['%s'] * len(batch))});", batch)
+                connection.commit()
+        return len(stale)
@@ -0,0 +1,93 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import time
+
+try:
+    from distributed_db.db.exceptions import DateOutOfRangeError
+    from distributed_db.db.hashing import get_hash_function, range_hashes
+except ModuleNotFoundError:
+    from .exceptions import DateOutOfRangeError
+    from .hashing import get_hash_function, range_hashes
+
+
+class RoutingTable():
+    """
+    Immutable, precompiled view of the metadata "Ranges" used to route a (date, user) pair to a shard.
+
+    The range starts are kept in a sorted tuple for bisect, and the moduli, hash functions and shard names of every
+    range are resolved once up front, so a lookup is one bisect, one hash and a few tuple indexes.
+
+    Methods:
+    \tlocate - return the shard name for a date and a user name.\n
+    \trange_index - return the index of the range a date falls into.\n
+    """
+    __slots__ = ('starts', 'ends', 'moduli', 'hashes', 'hash_functions', 'names', 'key')
+
+    def __init__(self, ranges: dict, key=None) -> None:
+        self.starts = tuple(ranges['Start'])
+        self.ends = tuple(ranges['End'])
+        self.moduli = tuple(ranges['Moduli'])
+        self.hashes = tuple(range_hashes(ranges))
+        self.hash_functions = tuple(get_hash_function(name) for name in self.hashes)
+        self.names = tuple(
+            tuple(f'r{start}h{h}' for h in range(modulus))
+            for start, modulus in zip(self.starts, self.moduli)
+        )
+        self.key = key
+
+    def __setattr__(self, name, value):
+        if hasattr(self, 'key'):
+            raise AttributeError('RoutingTable is immutable')
+        object.__setattr__(self, name, value)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def range_index(self, data_date: int, today: int) -> int:
+        """
+        Find the range the date belongs to.
+
+        Parameters:
+        \tdata_date - the date the account/post was created, as YYYYMMDDHH.\n
+        \ttoday - the current hour as YYYYMMDDHH, used to reject dates in the future.\n
+
+        Returns:
+        \tindex - the index into the "Ranges" lists.
+        """
+        if data_date > today:
+            raise DateOutOfRangeError("This date is in the future.", data_date)
+
+        index = bisect_right(self.starts, data_date) - 1
+        if index < 0:
+            raise DateOutOfRangeError("This date was prior to the initiation of the database system.", data_date)
+
+        end = self.ends[index]
+        if end is not None and data_date > end:
+            raise DateOutOfRangeError("This date falls between two ranges.", data_date)
+
+        return index
+
+    def locate(self, data_date: int, user_name: str, today: int) -> str:
+        """
+        Return the name of the shard holding the user's data, hashing the name with its range's hash function.
+        """
+        index = self.range_index(data_date, today)
+        return self.names[index][self.hash_functions[index](user_name, self.moduli[index])]
+
+
+class HourClock():
+    """
+    Returns the current hour as a YYYYMMDDHH int, only recomputing it once the hour rolls over.
+    """
+    def __init__(self) -> None:
+        self._hour = 0
+        self._expires = 0.0
+
+    def __call__(self) -> int:
+        now = time.time()
+        if now >= self._expires:
+            current = datetime.fromtimestamp(now)
+            self._hour = int(current.strftime("%Y%m%d%H"))
+            next_hour = current.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            self._expires = next_hour.timestamp()
+        return self._hour
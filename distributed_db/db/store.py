@@ -0,0 +1,118 @@
+from typing import Optional
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    from distributed_db.db.constants import METADATA_CHECK_INTERVAL
+except ModuleNotFoundError:
+    from .constants import METADATA_CHECK_INTERVAL
+
+
+def metadata_fingerprint(metadata: dict) -> str:
+    """
+    Digest of the metadata's contents. Unlike the MetadataStore version, which counts reloads in one process, it
+    is the same in every process reading the same file.
+    """
+    return hashlib.sha1(json.dumps(metadata, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class VersionedMetadata(dict):
+    """
+    A parsed metadata file plus the version number the MetadataStore gave it and its fingerprint. Shared between
+    callers, so treat it as read-only.
+    """
+    def __init__(self, metadata: dict, version: int) -> None:
+        super().__init__(metadata)
+        self.version = version
+        self.fingerprint = metadata_fingerprint(metadata)
+
+
+class MetadataStore():
+    """
+    Caches the parsed metadata file and swaps in a new version when the file changes on disk.
+
+    The file's (inode, mtime, size) is checked at most once every `check_interval` seconds. When it changes the
+    file is parsed and the cached copy is replaced in a single assignment, so readers always see either the old or
+    the new version, never a mix. A file caught half-written fails to parse and the old version is kept until the
+    next check.
+
+    Methods:
+    \tget - the current metadata, reloading it first if the file changed.\n
+    \treload - force a re-read of the file.\n
+    \tversion - the current version number. Increases by one each time a new file is loaded.\n
+    """
+    def __init__(self, path: str, check_interval: float = METADATA_CHECK_INTERVAL) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._current = None        # (VersionedMetadata, file signature)
+        self._next_check = 0.0
+        self._version = 0
+
+    def _signature(self) -> tuple:
+        stat = os.stat(self.path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self, signature: tuple) -> None:
+        with open(self.path, 'r') as file:
+            metadata = json.load(file)
+        self._version += 1
+        self._current = (VersionedMetadata(metadata, self._version), signature)
+
+    def get(self) -> VersionedMetadata:
+        current = self._current
+        now = time.monotonic()
+        if current is not None and now < self._next_check:
+            return current[0]
+
+        with self._lock:
+            current = self._current
+            if current is not None and now < self._next_check:
+                return current[0]
+
+            signature = self._signature()
+            if current is None:
+                self._load(signature)
+            elif signature != current[1]:
+                try:
+                    self._load(signature)
+                except json.JSONDecodeError:
+                    # caught mid-write, keep serving the previous version
+                    pass
+            self._next_check = now + self.check_interval
+            return self._current[0]
+
+    def reload(self) -> VersionedMetadata:
+        with self._lock:
+            self._load(self._signature())
+            self._next_check = time.monotonic() + self.check_interval
+            return self._current[0]
+
+    @property
+    def version(self) -> int:
+        return self.get().version
+
+
+def write_metadata(path: str, metadata: dict) -> None:
+    """
+    Atomically replace the metadata file: the new contents are written to a temporary file in the same directory
+    and renamed over the old one, so readers never see a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metadata-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(metadata, file, indent=4)
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+import queue
+import threading
+import time
+
+import pymysql
+
+try:
+    from distributed_db.db.constants import STREAM_FETCH_SIZE, STREAM_PREFETCH, SCATTER_MAX_WORKERS
+    from distributed_db.db.executor import ShardResult
+    from distributed_db.db.profiling import bind
+except ModuleNotFoundError:
+    from .constants import STREAM_FETCH_SIZE, STREAM_PREFETCH, SCATTER_MAX_WORKERS
+    from .executor import ShardResult
+    from .profiling import bind
+
+
+_DONE = object()
+
+
+class ShardStream():
+    """
+    Streams the rows of one query from many shards through unbuffered (server-side) cursors.
+
+    One producer thread per shard reads its cursor `fetch_size` rows at a time and puts each chunk on a shared
+    queue that holds at most `prefetch` chunks. A producer blocks while the queue is full, so no more than
+    (prefetch + number of producers) * fetch_size rows are in memory at once, however large the tables are.
+    Chunks from different shards are interleaved in whatever order they arrive.
+
+    If the consumer stops early (breaks out of the loop, or a shard fails), the producers are told to stop and
+    their connections are discarded rather than drained back into the pool.
+    """
+    def __init__(self, pools, query: str, params: Optional[tuple], connections: dict, fetch_size: int = STREAM_FETCH_SIZE,
+                 prefetch: int = STREAM_PREFETCH, dict_rows: bool = False, max_workers: int = SCATTER_MAX_WORKERS,
+                 shard_results: Optional[list] = None) -> None:
+        self.pools = pools
+        self.query = query
+        self.params = params
+        self.connections = connections
+        self.fetch_size = fetch_size
+        self.cursor_class = pymysql.cursors.SSDictCursor if dict_rows else pymysql.cursors.SSCursor
+        self.max_workers = max(1, min(max_workers, len(connections)))
+        self.shard_results = shard_results if shard_results is not None else []
+
+        self._buffer = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, db: str, credentials: dict) -> None:
+        start = time.perf_counter()
+        pool = self.pools.get_pool(db, credentials)
+        rows = 0
+        finished = False
+        try:
+            connection = pool.acquire()
+        except Exception as err:
+            self._put((db, err))
+            return
+
+        try:
+            cursor = connection.cursor(self.cursor_class)
+            if self.params:
+                cursor.execute(self.query, self.params)
+            else:
+                cursor.execute(self.query)
+            while not self._stop.is_set():
+                chunk = cursor.fetchmany(self.fetch_size)
+                if not chunk:
+                    finished = True
+                    break
+                rows += len(chunk)
+                if not self._put((db, chunk)):
+                    break
+            if finished:
+                cursor.close()
+                self.shard_results.append(ShardResult(db, rows, time.perf_counter() - start))
+                self._put((db, _DONE))
+        except Exception as err:
+            finished = False
+            self.shard_results.append(ShardResult(db, rows, time.perf_counter() - start, err))
+            self._put((db, err))
+        finally:
+            # an unbuffered result that was not read to the end leaves the connection unusable
+            pool.release(connection, discard=not finished)
+
+    def __iter__(self) -> Iterator:
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stream')
+        for db, credentials in self.connections.items():
+            executor.submit(bind(self._produce), db, credentials)
+
+        remaining = len(self.connections)
+        try:
+            while remaining:
+                db, item = self._buffer.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield from item
+        finally:
+            self._stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
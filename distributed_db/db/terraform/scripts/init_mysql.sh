@@ -49,6 +49,14 @@ CREATE TABLE Preferences(
         ON DELETE RESTRICT
         ON UPDATE CASCADE
 );
+
+CREATE TABLE FandomCounts(
+    nba_entity VARCHAR(32) NOT NULL,
+    type VARCHAR(16) NOT NULL,
+    preference VARCHAR(16) NOT NULL,
+    cnt INT NOT NULL,
+    PRIMARY KEY (nba_entity, type, preference)
+);
 EOF
 
 sudo mysql -e "USE $database; SOURCE ~/db.sql;"
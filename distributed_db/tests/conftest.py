@@ -0,0 +1,45 @@
+"""
+Shared fixtures: a throwaway cluster of local SQLite shards (see benchmarks/common.py), and the API module routed
+to it and served in-process by the Quart test client.
+"""
+import os
+
+import pytest
+
+from benchmarks.common import LocalCluster, local_metadata
+from db.async_manager import AsyncDatabaseManager
+from db.store import write_metadata
+
+
+@pytest.fixture
+def cluster():
+    with LocalCluster(2) as cluster:
+        yield cluster
+
+
+@pytest.fixture(scope='session')
+def api_module(tmp_path_factory):
+    # api.py opens its metadata at import time; point it at a cluster of its own so the tests never touch a real one
+    directory = tmp_path_factory.mktemp('api')
+    path = str(directory / 'metadata.json')
+    write_metadata(path, local_metadata(str(directory), 1, on_disk=True))
+    os.environ.setdefault('DISTRIBUTED_DB_METADATA', path)
+    import api
+    return api
+
+
+@pytest.fixture
+def api(api_module, cluster):
+    original = api_module.dbm
+    api_module.dbm = AsyncDatabaseManager(cluster.metadata_path, manager=cluster.dbm)
+    try:
+        yield api_module
+    finally:
+        api_module.dbm = original
+        api_module.login_homes.clear()
+        api_module.preference_docs.clear()
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
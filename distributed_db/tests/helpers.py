@@ -0,0 +1,43 @@
+"""
+Reads and writes straight to the shards of a LocalCluster, to check what the code under test stored.
+"""
+from benchmarks.common import LocalCluster
+
+
+def preferences(cluster: LocalCluster, username: str) -> set:
+    rows = []
+    for db in cluster.metadata['Connections']:
+        rows += cluster.dbm.query_one('SELECT nba_entity, preference FROM Preferences WHERE user = %s;', cluster.metadata['Connections'][db], params=(username,))
+    return {tuple(row) for row in rows}
+
+
+def counters(cluster: LocalCluster) -> dict:
+    """
+    The fandom counters of every shard summed, without zero counts.
+    """
+    counts = {}
+    for credentials in cluster.metadata['Connections'].values():
+        for nba_entity, preference, cnt in cluster.dbm.query_one('SELECT nba_entity, preference, cnt FROM FandomCounts;', credentials):
+            counts[(nba_entity, preference)] = counts.get((nba_entity, preference), 0) + cnt
+    return {key: cnt for key, cnt in counts.items() if cnt}
+
+
+def live_counts(cluster: LocalCluster) -> dict:
+    """
+    The fandom counts computed from the Preferences rows of every shard.
+    """
+    counts = {}
+    for credentials in cluster.metadata['Connections'].values():
+        for nba_entity, preference, cnt in cluster.dbm.query_one('SELECT nba_entity, preference, COUNT(*) FROM Preferences GROUP BY nba_entity, preference;', credentials):
+            counts[(nba_entity, preference)] = counts.get((nba_entity, preference), 0) + cnt
+    return counts
+
+
+def execute(cluster: LocalCluster, credentials: dict, query: str, params: tuple = ()) -> None:
+    """
+    Run one write on a shard and commit it.
+    """
+    with cluster.dbm.connection(credentials) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+        connection.commit()
@@ -0,0 +1,78 @@
+import pytest
+
+from benchmarks.common import NBA_ROWS
+from db.aggregation import FandomBreakdown
+
+from tests.helpers import live_counts
+
+
+TYPES = {row['name']: row['type'] for row in NBA_ROWS}
+
+
+def _breakdown(cluster, **filters):
+    breakdown = FandomBreakdown(**filters)
+    query, params = breakdown.query()
+    for result in cluster.dbm.scatter_gather(query, params=params, metadata=cluster.metadata):
+        assert result.error is None
+        breakdown.add(result.value)
+    return breakdown
+
+
+def _expected(cluster, keys, nba_name=None, nba_type=None, level=None):
+    totals = {}
+    for (name, pref), cnt in live_counts(cluster).items():
+        if nba_name and name != nba_name or nba_type and TYPES[name] != nba_type or level and pref != level:
+            continue
+        fields = {'type': TYPES[name], 'name': name, 'pref': pref}
+        key = tuple(fields[k] for k in keys)
+        totals[key] = totals.get(key, 0) + cnt
+    return totals
+
+
+def test_partials_are_summed_across_shards():
+    breakdown = FandomBreakdown(nba_type='team')
+    breakdown.add([('Miami Heat', 2), ('Denver Nuggets', 1)])
+    breakdown.add([('Miami Heat', 3)])
+    breakdown.add([])
+
+    assert breakdown.shards_merged == 3
+    assert breakdown.top() == [('Miami Heat', 5), ('Denver Nuggets', 1)]
+    assert breakdown.top(1) == [('Miami Heat', 5)]
+
+
+@pytest.mark.parametrize('filters, columns', [
+    ({}, ['type', 'name', 'pref', 'cnt']),
+    ({'nba_type': 'player'}, ['name', 'cnt']),
+    ({'level': 'rival'}, ['name', 'cnt']),
+    ({'nba_type': 'team', 'level': 'favorite'}, ['name', 'cnt']),
+    ({'nba_name': 'Miami Heat'}, ['pref', 'type', 'cnt'])
+])
+@pytest.mark.parametrize('use_counters', [True, False])
+def test_the_merged_breakdown_matches_a_global_count(cluster, filters, columns, use_counters):
+    cluster.populate(60)
+    breakdown = _breakdown(cluster, use_counters=use_counters, **filters)
+    totals = {tuple(row[:-1]): row[-1] for row in breakdown.top()}
+
+    assert breakdown.columns == columns
+    assert breakdown.shards_merged == len(cluster.names)
+    assert totals == _expected(cluster, breakdown.keys, **filters)
+
+
+def test_top_k_keeps_the_largest_groups(cluster):
+    cluster.populate(60)
+    everything = _breakdown(cluster).top()
+    top = _breakdown(cluster).top(3)
+
+    assert [row[-1] for row in top] == sorted((row[-1] for row in everything), reverse=True)[:3]
+
+
+def test_filters_are_sent_as_parameters():
+    query, params = FandomBreakdown(nba_name="Shaquille O'Neal", level='hates').query()
+
+    assert "O'Neal" not in query
+    assert params == ('hates', "Shaquille O'Neal")
+
+
+def test_titles():
+    assert FandomBreakdown().title == 'Full NBA Breakdown'
+    assert FandomBreakdown(nba_name='Miami Heat', level='rival').title == 'Miami Heat rival Fandom Breakdown'
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+from db.async_manager import AsyncDatabaseManager
+
+
+def _manager(cluster, max_workers=8):
+    return AsyncDatabaseManager(cluster.metadata_path, max_workers=max_workers, manager=cluster.dbm)
+
+
+def test_blocking_calls_do_not_block_the_loop(cluster):
+    dbm = _manager(cluster)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(dbm.run(release.wait, 5))
+        # the loop keeps running other work while a call is blocked on the thread pool
+        await asyncio.sleep(0.01)
+        pending = not blocked.done()
+        release.set()
+        return pending, await blocked
+
+    assert asyncio.run(scenario()) == (True, True)
+
+
+def test_calls_run_concurrently_up_to_the_pool_size(cluster):
+    dbm = _manager(cluster, max_workers=4)
+    barrier = threading.Barrier(4, timeout=2)
+
+    async def scenario():
+        return await asyncio.gather(*(dbm.run(barrier.wait) for _ in range(4)))
+
+    assert sorted(asyncio.run(scenario())) == [0, 1, 2, 3]
+
+
+def test_awaitable_reads_match_the_sync_manager(cluster):
+    users = cluster.populate(30)
+    dbm = _manager(cluster)
+    metadata = dbm.read_metadata()
+    user = users[0]
+
+    async def scenario():
+        home = await dbm.home_shard(metadata, user['user'], user['date'])
+        rows = await dbm.query_one('SELECT user FROM Users WHERE user = %s;', metadata['Connections'][home], params=(user['user'],))
+        results = await dbm.scatter_gather('SELECT COUNT(*) FROM Users;', metadata=metadata)
+        return home, rows, results
+
+    home, rows, results = asyncio.run(scenario())
+    assert home == cluster.dbm.locate_db(metadata, user['date'], user['user'])
+    assert [tuple(row) for row in rows] == [(user['user'],)]
+    assert sum(result.value[0][0] for result in results) == 30
+
+
+def test_a_transaction_left_open_is_rolled_back(cluster):
+    dbm = _manager(cluster)
+    credentials = cluster.metadata['Connections'][cluster.names[0]]
+
+    def _forget_to_commit(connection, user):
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO Users(user, password, date) VALUES (%s, %s, %s);', (user, 'password', cluster.start))
+
+    def _commit(connection, user):
+        _forget_to_commit(connection, user)
+        connection.commit()
+
+    async def scenario():
+        await dbm.transaction(credentials, _forget_to_commit, 'lost')
+        await dbm.transaction(credentials, _commit, 'kept')
+
+    asyncio.run(scenario())
+    stored = {row[0] for row in cluster.dbm.query_one('SELECT user FROM Users;', credentials)}
+    assert 'kept' in stored and 'lost' not in stored
+
+
+def test_concurrent_logins_are_served_together(client, cluster):
+    async def scenario():
+        responses = await asyncio.gather(*(
+            client.post('/login', json={'username': f'fan{i}', 'password': 'password', 'date': str(cluster.start)})
+            for i in range(100)
+        ))
+        return [response.status_code for response in responses]
+
+    statuses = asyncio.run(scenario())
+    stored = [row[0] for credentials in cluster.metadata['Connections'].values()
+              for row in cluster.dbm.query_one('SELECT user FROM Users;', credentials)]
+
+    assert statuses == [200] * 100
+    assert sorted(stored) == sorted(f'fan{i}' for i in range(100))
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+
+def _batch(client, users):
+    async def post():
+        response = await client.post('/api/preferences/batch', json=users)
+        return response.status_code, await response.get_data(as_text=True)
+    status, body = asyncio.run(post())
+    return status, [json.loads(line) for line in body.splitlines()] if status == 200 else json.loads(body)
+
+
+def _one(client, user):
+    async def get():
+        response = await client.get(f"/api/preferences/{user['user']}?timestamp={user['date']}")
+        return await response.get_json()
+    return asyncio.run(get())
+
+
+def _count_shard_reads(api, monkeypatch) -> list:
+    reads = []
+    transaction = api.dbm.transaction
+
+    async def counted(credentials, work, *args):
+        reads.append((credentials['mysql_database'], work.__name__))
+        return await transaction(credentials, work, *args)
+    monkeypatch.setattr(api.dbm, 'transaction', counted)
+    return reads
+
+
+def test_every_user_gets_the_document_a_single_read_would(api, client, cluster, monkeypatch):
+    users = cluster.populate(40)
+    reads = _count_shard_reads(api, monkeypatch)
+    status, lines = _batch(client, [{'username': user['user'], 'timestamp': str(user['date'])} for user in users])
+
+    assert status == 200
+    assert sorted(line['username'] for line in lines) == sorted(user['user'] for user in users)
+    # one query per shard
+    assert sorted(reads) == sorted((db, '_batch_preferences') for db in cluster.names)
+
+    api.preference_docs.clear()
+    documents = {line['username']: line['preferences'] for line in lines}
+    assert all(documents[user['user']] == _one(client, user) for user in users[:10])
+
+
+def test_large_batches_are_split_per_shard(api, client, cluster, monkeypatch):
+    users = cluster.populate(40)
+    monkeypatch.setattr(api, 'PREFERENCE_BATCH_SIZE', 8)
+    reads = _count_shard_reads(api, monkeypatch)
+    status, lines = _batch(client, [{'username': user['user'], 'timestamp': str(user['date'])} for user in users])
+
+    homes = [cluster.dbm.locate_db(cluster.metadata, user['date'], user['user']) for user in users]
+    assert len(lines) == 40
+    assert len(reads) == sum(-(-homes.count(db) // 8) for db in cluster.names)
+
+
+def test_cached_profiles_are_not_read_again(api, client, cluster, monkeypatch):
+    users = cluster.populate(10)
+    _one(client, users[0])
+    reads = _count_shard_reads(api, monkeypatch)
+    status, lines = _batch(client, [{'username': users[0]['user'], 'timestamp': str(users[0]['date'])}])
+
+    assert reads == []
+    assert lines == [{'username': users[0]['user'], 'preferences': _one(client, users[0])}]
+
+
+def test_users_that_cannot_be_placed_get_an_error_line(client, cluster):
+    users = cluster.populate(5)
+    status, lines = _batch(client, [{'username': 'nobody'}, {'username': users[0]['user'], 'timestamp': str(users[0]['date'])}])
+    by_user = {line['username']: line for line in lines}
+
+    assert 'error' in by_user['nobody']
+    assert 'preferences' in by_user[users[0]['user']]
+
+
+def test_a_malformed_request_is_rejected(client):
+    assert _batch(client, {'username': 'alice'})[0] == 400
+    assert _batch(client, [{'timestamp': '2024010100'}])[0] == 400
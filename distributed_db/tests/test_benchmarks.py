@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from benchmarks import fanout, inserts, routes, routing
+from benchmarks.common import percentile, sample, summarize, write_results
+from benchmarks.compare import compare, flatten
+
+
+def test_percentiles_and_summaries():
+    samples = [i / 1000 for i in range(1, 101)]
+
+    assert percentile([], 50) == 0.0
+    assert percentile(samples, 0) == 0.001 and percentile(samples, 100) == 0.1
+    assert percentile(samples, 50) == pytest.approx(0.05, abs=0.001)
+    assert summarize([]) == {'n': 0}
+    summary = summarize(samples)
+    assert summary['n'] == 100 and summary['min'] == 1.0 and summary['max'] == 100.0
+    assert summary['p50'] <= summary['p90'] <= summary['p99'] <= summary['max']
+
+
+def test_sample_times_only_the_repeats():
+    calls = []
+    durations = sample(lambda: calls.append(1), repeat=5, warmup=2)
+
+    assert len(calls) == 7 and len(durations) == 5
+
+
+def test_results_are_written_as_json(tmp_path, capsys):
+    path = tmp_path / 'results.json'
+    write_results({'benchmarks': {'routing': {'speedup': 2.0}}}, str(path))
+    write_results({'n': 1}, None)
+
+    assert json.loads(path.read_text()) == {'benchmarks': {'routing': {'speedup': 2.0}}}
+    assert json.loads(capsys.readouterr().out) == {'n': 1}
+
+
+def test_compare_flags_regressions_in_either_direction():
+    before = {'benchmarks': {'fanout': {'shards': {'2': {'live_full_ms': {'n': 10, 'p50': 1.0}}}}, 'routing': {'speedup': 4.0, 'lookups': 100}}}
+    after = {'benchmarks': {'fanout': {'shards': {'2': {'live_full_ms': {'n': 20, 'p50': 1.5}}}}, 'routing': {'speedup': 3.0, 'lookups': 900}}}
+    rows = {metric: (change, regressed) for metric, _, _, change, regressed in compare(before, after, threshold=10)}
+
+    assert rows == {'fanout.shards.2.live_full_ms.p50': (50.0, True), 'routing.speedup': (-25.0, True)}
+    assert not any(row[-1] for row in compare(after, before, threshold=10))
+    assert flatten({'a': {'b': 1, 'c': True, 'd': 'x'}}) == {'a.b': 1}
+
+
+def test_the_routing_baseline_agrees_with_locate_db():
+    results = routing.run(lookups=1000, num_ranges=8)
+
+    assert results['speedup'] > 0
+    assert 'legacy' in results['hash_ns_per_call'] and 'jump' in results['hash_ns_per_call']
+
+
+def test_the_suites_run_on_small_clusters(api_module):
+    results = {
+        'inserts': inserts.run(num_users=40, num_shards=2, single=5),
+        'fanout': fanout.run(shard_counts=[2], num_users=40, repeat=2),
+        'routes': routes.run(requests=2, num_shards=2, batch_size=2)
+    }
+
+    assert json.loads(json.dumps(results)) == results
+    assert set(results['fanout']['shards']['2']) == {'counters_full_ms', 'counters_filtered_ms', 'live_full_ms', 'live_filtered_ms'}
+    assert all(summary['n'] == 2 for summary in results['routes']['routes_ms'].values())
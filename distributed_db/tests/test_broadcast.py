@@ -0,0 +1,78 @@
+import pytest
+
+from benchmarks.common import NBA_ROWS, quiet
+from db.drivers import SQLiteCursor
+
+from tests.helpers import execute
+
+
+NEW_ROWS = [{'name': 'Victor Wembanyama', 'type': 'player'}, {'name': 'Orlando Magic', 'type': 'team'}]
+
+
+def _nba(cluster, db):
+    return dict(cluster.dbm.query_one('SELECT name, type FROM Nba;', cluster.metadata['Connections'][db]))
+
+
+def test_new_rows_reach_every_shard(cluster):
+    with quiet():
+        report = cluster.dbm.broadcast_insert('nba', NEW_ROWS)
+
+    assert sorted(report) == sorted(cluster.names)
+    for db in cluster.names:
+        assert report[db]['written'] == 2 and report[db]['skipped'] == 0 and report[db]['error'] is None
+        assert _nba(cluster, db) == {row['name']: row['type'] for row in NBA_ROWS + NEW_ROWS}
+
+
+def test_existing_rows_are_skipped(cluster):
+    with quiet():
+        report = cluster.dbm.broadcast_insert('nba', NBA_ROWS[:3] + NEW_ROWS[:1])
+
+    assert {(entry['written'], entry['skipped']) for entry in report.values()} == {(1, 3)}
+
+
+def test_upsert_overwrites_existing_rows(cluster):
+    with quiet():
+        cluster.dbm.broadcast_insert('nba', NEW_ROWS)
+        cluster.dbm.broadcast_insert('nba', [{'name': 'Victor Wembanyama', 'type': 'team'}])
+        assert _nba(cluster, cluster.names[0])['Victor Wembanyama'] == 'player'
+
+        report = cluster.dbm.broadcast_insert('nba', [{'name': 'Victor Wembanyama', 'type': 'team'}], upsert=True)
+
+    assert all(entry['error'] is None for entry in report.values())
+    assert all(_nba(cluster, db)['Victor Wembanyama'] == 'team' for db in cluster.names)
+
+
+def test_one_statement_per_shard(cluster, monkeypatch):
+    calls = []
+    executemany = SQLiteCursor.executemany
+    monkeypatch.setattr(SQLiteCursor, 'executemany', lambda self, query, args: calls.append(len(args)) or executemany(self, query, args))
+    rows = [{'name': f'Player {i}', 'type': 'player'} for i in range(50)]
+    with quiet():
+        cluster.dbm.broadcast_insert('nba', rows)
+
+    assert calls == [50] * len(cluster.names)
+
+
+def test_a_failing_shard_is_reported(cluster):
+    broken = cluster.names[0]
+    execute(cluster, cluster.metadata['Connections'][broken], 'DROP TABLE Nba;')
+    with quiet():
+        report = cluster.dbm.broadcast_insert('nba', NEW_ROWS)
+
+    assert 'Nba' in report[broken]['error'] and report[broken]['written'] == 0
+    assert all(report[db]['written'] == 2 for db in cluster.names if db != broken)
+
+
+def test_only_replicated_tables_are_broadcast(cluster):
+    with pytest.raises(ValueError):
+        cluster.dbm.broadcast_insert('users', cluster.users(1))
+
+
+def test_broadcast_drops_cached_reads(cluster):
+    query = 'SELECT COUNT(*) FROM Nba;'
+    before = sum(result.value[0][0] for result in cluster.dbm.scatter_gather(query, cache=True))
+    with quiet():
+        cluster.dbm.broadcast_insert('nba', NEW_ROWS)
+    after = sum(result.value[0][0] for result in cluster.dbm.scatter_gather(query, cache=True))
+
+    assert after == before + 2 * len(cluster.names)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.common import LocalCluster
+from db import capacity
+from db.capacity import CapacityMonitor, growth_rate
+
+
+DAY = 86400
+
+
+def test_growth_is_the_least_squares_slope_per_day():
+    assert growth_rate([]) is None
+    assert growth_rate([(0, 1.0)]) is None
+    assert growth_rate([(5, 1.0), (5, 2.0)]) is None
+    assert growth_rate([(0, 10.0), (DAY, 12.0), (2 * DAY, 14.0)]) == pytest.approx(2.0)
+    assert growth_rate([(0, 10.0), (DAY, 13.0), (2 * DAY, 14.0)]) == pytest.approx(2.0)
+
+
+@pytest.fixture
+def disk_cluster():
+    with LocalCluster(2, on_disk=True) as cluster:
+        yield cluster
+
+
+@pytest.fixture
+def sizes(monkeypatch):
+    """
+    Replaces the size query: {db: size in MB} to report, and the list of shards that were asked.
+    """
+    sizes, asked = {}, []
+
+    def size(self, db, credentials):
+        asked.append(db)
+        if isinstance(sizes.get(db), Exception):
+            raise sizes[db]
+        return sizes.get(db, 1.0)
+    monkeypatch.setattr(CapacityMonitor, '_size', size)
+    return sizes, asked
+
+
+def test_every_shard_is_measured(disk_cluster, tmp_path):
+    disk_cluster.populate(100)
+    monitor = CapacityMonitor(disk_cluster.dbm, str(tmp_path / 'capacity.sqlite'))
+
+    assert monitor.poll() == {}
+    snapshot = monitor.snapshot()
+    assert set(snapshot) == set(disk_cluster.names)
+    assert all(size > 0 and time.time() - polled < 60 for size, polled in snapshot.values())
+
+
+def test_only_stale_shards_are_polled(cluster, sizes, tmp_path):
+    _, asked = sizes
+    monitor = CapacityMonitor(cluster.dbm, str(tmp_path / 'capacity.sqlite'), ttl=60)
+    monitor.capacities()
+    monitor.capacities()
+
+    assert sorted(asked) == sorted(cluster.names)
+    monitor.capacities(max_age=0)
+    assert len(asked) == 2 * len(cluster.names)
+
+
+def test_a_failed_poll_keeps_the_last_sample(cluster, sizes, tmp_path):
+    reported, _ = sizes
+    monitor = CapacityMonitor(cluster.dbm, str(tmp_path / 'capacity.sqlite'))
+    monitor.poll()
+    reported[cluster.names[0]] = TimeoutError('slow shard')
+    reported[cluster.names[1]] = 3.0
+    errors = monitor.poll()
+
+    assert list(errors) == [cluster.names[0]]
+    assert {db: size for db, (size, _) in monitor.snapshot().items()} == {cluster.names[0]: 1.0, cluster.names[1]: 3.0}
+
+
+def test_the_report_projects_when_each_shard_fills_up(cluster, sizes, monkeypatch, tmp_path):
+    reported, _ = sizes
+    monitor = CapacityMonitor(cluster.dbm, str(tmp_path / 'capacity.sqlite'), ttl=DAY, history=3, limit_mb=100, near_full_mb=80)
+    clock = [1_700_000_000.0]
+    monkeypatch.setattr(capacity.time, 'time', lambda: clock[0])
+    growing, steady = cluster.names
+
+    for day, size in enumerate([10.0, 20.0, 30.0, 40.0, 85.0]):
+        clock[0] = 1_700_000_000.0 + day * DAY
+        reported[growing] = size
+        reported[steady] = 5.0
+        monitor.poll()
+        if day == 0:
+            # one sample is not enough to project growth
+            assert monitor.report()[growing]['growth_mb_per_day'] is None
+
+    report = monitor.report()
+    assert len(monitor.history_of(growing)) == 3
+    assert report[growing]['size_mb'] == 85.0 and report[growing]['near_full']
+    assert report[growing]['growth_mb_per_day'] == pytest.approx(27.5)
+    assert report[growing]['days_to_full'] == pytest.approx(0.5)
+    assert report[steady]['growth_mb_per_day'] == 0 and report[steady]['days_to_full'] is None
+
+
+def test_the_samples_are_shared_through_the_file(cluster, sizes, tmp_path):
+    _, asked = sizes
+    path = str(tmp_path / 'capacity.sqlite')
+    CapacityMonitor(cluster.dbm, path).poll()
+    other = CapacityMonitor(cluster.dbm, path)
+
+    assert set(other.capacities()) == set(cluster.names)
+    assert len(asked) == len(cluster.names)
+
+
+def test_removed_shards_are_left_out(cluster, sizes, tmp_path):
+    monitor = CapacityMonitor(cluster.dbm, str(tmp_path / 'capacity.sqlite'))
+    monitor.poll()
+    metadata = dict(cluster.metadata, Connections={cluster.names[0]: cluster.metadata['Connections'][cluster.names[0]]})
+
+    assert list(monitor.snapshot(metadata)) == [cluster.names[0]]
+
+
+def test_the_background_poller_stops(cluster, sizes, tmp_path):
+    _, asked = sizes
+    monitor = CapacityMonitor(cluster.dbm, str(tmp_path / 'capacity.sqlite'), ttl=0.01)
+    monitor.start()
+    time.sleep(0.1)
+    monitor.stop()
+    polled = len(asked)
+
+    assert polled >= 2 * len(cluster.names)
+    time.sleep(0.05)
+    assert len(asked) == polled
+
+
+def test_the_api_reports_capacity_without_repolling(client, cluster, sizes):
+    _, asked = sizes
+    cluster.dbm.capacity.poll()
+
+    async def scenario():
+        response = await client.get('/api/capacity')
+        return response.status_code, await response.get_json()
+
+    status, report = asyncio.run(scenario())
+    assert status == 200 and set(report) == set(cluster.names)
+    assert len(asked) == len(cluster.names)
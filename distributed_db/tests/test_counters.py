@@ -0,0 +1,77 @@
+from collections import Counter
+
+from benchmarks.common import quiet
+from db import counters
+
+from tests.helpers import counters as stored_counters, execute, live_counts
+
+
+def _home(cluster, user):
+    return cluster.metadata['Connections'][cluster.dbm.locate_db(cluster.metadata, user['date'], user['user'])]
+
+
+def test_bulk_inserts_keep_the_counters_in_step(cluster):
+    cluster.populate(60)
+
+    assert stored_counters(cluster) == live_counts(cluster)
+
+
+def test_single_inserts_and_deletes_keep_the_counters_in_step(cluster):
+    users = cluster.populate(20)
+    user = users[0]
+    credentials = _home(cluster, user)
+    with quiet():
+        cluster.dbm.insert_one({'user': user['user'], 'nba_entity': 'Jimmy Butler', 'preference': 'hates'}, 'prefs', credentials)
+        assert stored_counters(cluster)[('Jimmy Butler', 'hates')] == 1
+
+        cluster.dbm.delete_from_one('prefs', credentials, "preference = 'hates'")
+        assert ('Jimmy Butler', 'hates') not in stored_counters(cluster)
+
+        cluster.dbm.delete_from_one('users', credentials, f"user = '{user['user']}'")
+    assert stored_counters(cluster) == live_counts(cluster)
+
+
+def test_updates_recount_the_shard(cluster):
+    cluster.populate(20)
+    with quiet():
+        for credentials in cluster.metadata['Connections'].values():
+            cluster.dbm.update_in_one('prefs', credentials, "preference = 'rival'", "preference = 'bandwagon'")
+
+    assert not any(preference == 'bandwagon' for _, preference in stored_counters(cluster))
+    assert stored_counters(cluster) == live_counts(cluster)
+
+
+def test_rebuild_recovers_lost_counters(cluster):
+    cluster.populate(40)
+    expected = live_counts(cluster)
+    for credentials in cluster.metadata['Connections'].values():
+        execute(cluster, credentials, 'DELETE FROM FandomCounts;')
+    execute(cluster, cluster.metadata['Connections'][cluster.names[0]], "INSERT INTO FandomCounts VALUES ('Miami Heat', 'team', 'hates', 99);")
+
+    report = cluster.dbm.rebuild_counters()
+
+    assert sorted(report) == sorted(cluster.names)
+    assert stored_counters(cluster) == expected
+
+
+def test_counters_reaching_zero_are_removed(cluster):
+    credentials = cluster.metadata['Connections'][cluster.names[0]]
+    with cluster.dbm.connection(credentials) as connection:
+        with connection.cursor() as cursor:
+            assert counters.apply(cursor, counters.deltas_for([('Miami Heat', 'rival')] * 2)) == 1
+            counters.apply(cursor, Counter({('Miami Heat', 'rival'): -2, ('Denver Nuggets', 'rival'): 1}))
+            cursor.execute('SELECT nba_entity, type, preference, cnt FROM FandomCounts;')
+            rows = [tuple(row) for row in cursor.fetchall()]
+        connection.commit()
+
+    assert rows == [('Denver Nuggets', 'team', 'rival', 1)]
+
+
+def test_unknown_entities_and_empty_deltas_are_ignored(cluster):
+    credentials = cluster.metadata['Connections'][cluster.names[0]]
+    with cluster.dbm.connection(credentials) as connection:
+        with connection.cursor() as cursor:
+            assert counters.apply(cursor, Counter()) == 0
+            assert counters.apply(cursor, Counter({('Miami Heat', 'rival'): 0})) == 0
+            assert counters.apply(cursor, counters.deltas_for([('Nobody', 'rival')])) == 0
+        connection.commit()
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from db.directory import UserDirectory
+from db.exceptions import DateOutOfRangeError
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'directory.sqlite')
+
+
+def test_entries_are_persisted(path):
+    directory = UserDirectory(path)
+    directory.register_many([('ann', 2024010100, 'r2024010100h0'), ('bob', 2024010101, 'r2024010100h1')])
+    directory.forget(['bob'])
+    directory.close()
+
+    reopened = UserDirectory(path)
+    assert reopened.lookup('ann') == (2024010100, 'r2024010100h0')
+    assert reopened.lookup('bob') is None
+    assert len(reopened) == 1
+
+
+def test_forget_db_and_clear(path):
+    directory = UserDirectory(path)
+    directory.register_many([('ann', 2024010100, 'h0'), ('bob', 2024010100, 'h1')])
+    directory.mark_complete()
+    directory.forget_db('h0')
+    assert directory.lookup('ann') is None
+    assert directory.lookup('bob') == (2024010100, 'h1')
+
+    directory.clear()
+    assert directory.lookup('bob') is None
+    assert not directory.complete
+
+
+def test_lru_is_bounded(path):
+    directory = UserDirectory(path, cache_size=2)
+    directory.register_many([(f'user{i}', 2024010100, 'h0') for i in range(5)])
+    assert len(directory._cache) == 2
+    assert directory.lookup('user0') == (2024010100, 'h0')
+
+
+def test_changes_by_another_process_are_seen(path):
+    api, cli = UserDirectory(path), UserDirectory(path)
+    api.register('ann', 2024010100, 'h0')
+    assert api.lookup('ann') == (2024010100, 'h0')
+
+    # a reshard run from the CLI moves the user, then it is deleted
+    cli.register('ann', 2024010100, 'h2')
+    assert api.lookup('ann') == (2024010100, 'h2')
+    cli.forget(['ann'])
+    assert api.lookup('ann') is None
+
+    # a user another process registers is no longer known missing
+    api.remember_missing('bob')
+    assert api.known_missing('bob')
+    cli.register('bob', 2024010100, 'h1')
+    assert not api.known_missing('bob')
+    assert api.lookup('bob') == (2024010100, 'h1')
+
+    api.lookup('bob')
+    cli.forget_db('h1')
+    assert api.lookup('bob') is None
+
+
+def test_a_trimmed_change_log_drops_everything(path):
+    api, cli = UserDirectory(path), UserDirectory(path, change_log=3)
+    api.register('ann', 2024010100, 'h0')
+    api.lookup('ann')
+    cli.register_many([('ann', 2024010100, 'h1')] + [(f'user{i}', 2024010100, 'h0') for i in range(10)])
+    assert api.lookup('ann') == (2024010100, 'h1')
+
+
+def test_misses_expire(path):
+    directory = UserDirectory(path, miss_ttl=0)
+    directory.remember_missing('ann')
+    assert not directory.known_missing('ann')
+
+
+def test_find_user_falls_back_to_the_shards_once(cluster):
+    users = cluster.users(10)
+    cluster.dbm.insert_many('users', users)
+    cluster.dbm.directory.clear()
+
+    home = cluster.dbm.find_user(users[3]['user'])
+    assert home == (users[3]['date'], cluster.dbm.locate_db(cluster.metadata, users[3]['date'], users[3]['user']))
+    assert cluster.dbm.directory.lookup(users[3]['user']) == home
+
+
+def test_home_shard_of_an_unknown_user(cluster):
+    metadata = cluster.metadata
+    assert cluster.dbm.home_shard(metadata, 'nobody', cluster.start) == cluster.dbm.locate_db(metadata, cluster.start, 'nobody')
+    with pytest.raises(DateOutOfRangeError):
+        cluster.dbm.home_shard(metadata, 'nobody')
+
+
+def test_unknown_users_do_not_fan_out(client, cluster):
+    cluster.populate(20)
+    scatter_gather = cluster.dbm.scatter_gather
+    fanouts = []
+    cluster.dbm.scatter_gather = lambda *args, **kwargs: fanouts.append(args) or scatter_gather(*args, **kwargs)
+
+    # a miss is cached
+    for _ in range(3):
+        cluster.dbm.find_user('nobody')
+    assert len(fanouts) == 1
+
+    # and not asked at all once the directory is complete
+    cluster.dbm.directory.mark_complete()
+    fanouts.clear()
+    response = asyncio.run(client.post('/login', json={'username': 'newcomer', 'password': 'password', 'date': str(cluster.start)}))
+    assert response.status_code == 200
+    assert fanouts == []
+    assert cluster.dbm.find_user('newcomer') == (cluster.start, cluster.dbm.locate_db(cluster.metadata, cluster.start, 'newcomer'))
+    assert cluster.dbm.find_user('user1') is not None
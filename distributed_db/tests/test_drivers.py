@@ -0,0 +1,105 @@
+import pymysql
+import pytest
+
+from db.drivers import MySQLDriver, SQLiteDriver, get_driver, sqlite_credentials, translate
+from db.exceptions import UnknownDriverError
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('SELECT * FROM Users WHERE user = %s AND date > %s;', 'SELECT * FROM Users WHERE user = ? AND date > ?;'),
+    ('SELECT * FROM Users WHERE user = %(user)s;', 'SELECT * FROM Users WHERE user = :user;'),
+    ("SELECT * FROM Nba WHERE name LIKE 'Miami%%';", "SELECT * FROM Nba WHERE name LIKE 'Miami%';"),
+    ('INSERT IGNORE INTO Nba(name, type) VALUES (%s, %s);', 'INSERT OR IGNORE INTO Nba(name, type) VALUES (?, ?);'),
+    ('INSERT INTO Users(user, password) VALUES (%s, %s) ON DUPLICATE KEY UPDATE password = VALUES(password);',
+     'INSERT INTO Users(user, password) VALUES (?, ?) ON CONFLICT DO UPDATE SET password = excluded.password;'),
+    ('SELECT user FROM Users WHERE user = %s FOR UPDATE;', 'SELECT user FROM Users WHERE user = ?;'),
+    ('SELECT user FROM Users LOCK IN SHARE MODE;', 'SELECT user FROM Users;')
+])
+def test_mysql_queries_are_translated(query, expected):
+    assert translate(query) == expected
+
+
+def test_placeholders_are_left_alone_without_parameters():
+    # pymysql only formats a query when it is given parameters
+    assert translate("SELECT * FROM Nba WHERE name LIKE 'M%%';", False) == "SELECT * FROM Nba WHERE name LIKE 'M%%';"
+
+
+def test_drivers_are_chosen_by_the_connections_entry():
+    assert isinstance(get_driver({'vm_ip': '127.0.0.1'}), MySQLDriver)
+    assert isinstance(get_driver(sqlite_credentials('shard')), SQLiteDriver)
+    with pytest.raises(UnknownDriverError):
+        get_driver({'driver': 'postgres'})
+
+
+def test_connection_params():
+    mysql = MySQLDriver().connection_params(
+        {'vm_ip': '10.0.0.4', 'mysql_username': 'u', 'mysql_password': 'p', 'mysql_database': 'r1h0'}, {'port': 3306})
+    assert mysql == {'port': 3306, 'host': '10.0.0.4', 'user': 'u', 'password': 'p', 'database': 'r1h0'}
+    assert SQLiteDriver().connection_params(sqlite_credentials('r1h0', '/data'), {}) == {'database': 'r1h0', 'path': '/data/r1h0.sqlite'}
+
+
+@pytest.fixture
+def connection(tmp_path):
+    driver = SQLiteDriver(timeout=0.2)
+    connection = driver.connect(driver.connection_params(sqlite_credentials('shard', str(tmp_path)), {}))
+    yield connection
+    connection.close()
+
+
+def test_sqlite_errors_are_raised_as_mysql_errors(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO Users VALUES ('alice', 'password', 2024010100);")
+        with pytest.raises(pymysql.err.IntegrityError) as duplicate:
+            cursor.execute("INSERT INTO Users VALUES ('ALICE', 'password', 2024010100);")
+        with pytest.raises(pymysql.err.IntegrityError) as missing:
+            cursor.execute("INSERT INTO Preferences VALUES ('alice', 'Nobody', 'rival');")
+        with pytest.raises(pymysql.err.ProgrammingError) as no_table:
+            cursor.execute('SELECT * FROM Teams;')
+
+    assert duplicate.value.args[0] == 1062
+    assert missing.value.args[0] == 1452
+    assert no_table.value.args[0] == 1146
+
+
+def test_sqlite_connections_behave_like_pymysql(connection):
+    assert connection.server_status == 0
+    with connection.cursor() as cursor:
+        assert cursor.executemany('INSERT INTO Nba VALUES (%s, %s);', [('Miami Heat', 'team'), ('Jimmy Butler', 'player')]) == 2
+        assert connection.server_status & pymysql.constants.SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        connection.rollback()
+        assert cursor.execute('SELECT * FROM Nba;') == 0
+
+        cursor.executemany('INSERT INTO Nba VALUES (%s, %s);', [('Miami Heat', 'team'), ('Jimmy Butler', 'player')])
+        connection.commit()
+        assert cursor.execute('SELECT name FROM Nba ORDER BY name;') == 2
+        assert cursor.fetchone() == ('Jimmy Butler',)
+        assert cursor.fetchall() == [('Miami Heat',)]
+
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute('SELECT name, type FROM Nba WHERE name = %s;', ('miami heat',))
+        assert cursor.fetchall() == [{'name': 'Miami Heat', 'type': 'team'}]
+
+    connection.ping()
+    connection.close()
+    with pytest.raises(pymysql.err.InterfaceError):
+        connection.ping()
+
+
+def test_in_memory_shards_are_shared_until_closed():
+    driver = SQLiteDriver()
+    params = driver.connection_params(sqlite_credentials('shared-shard'), {})
+    writer, reader = driver.connect(params), driver.connect(params)
+    with writer.cursor() as cursor:
+        cursor.execute("INSERT INTO Nba VALUES ('Miami Heat', 'team');")
+    writer.commit()
+    with reader.cursor() as cursor:
+        assert cursor.execute('SELECT * FROM Nba;') == 1
+    writer.close()
+    reader.close()
+
+    driver.close_memory_databases(['shared-shard'])
+    fresh = driver.connect(params)
+    with fresh.cursor() as cursor:
+        assert cursor.execute('SELECT * FROM Nba;') == 0
+    fresh.close()
+    driver.close_memory_databases(['shared-shard'])
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from db.executor import ScatterGatherExecutor, ShardResult, critical_path
+
+
+def test_results_come_back_in_completion_order():
+    executor = ScatterGatherExecutor()
+    results = list(executor.run({
+        'slow': lambda: time.sleep(0.05) or 'slow',
+        'fast': lambda: 'fast'
+    }))
+    executor.shutdown()
+
+    assert [result.db for result in results] == ['fast', 'slow']
+    assert [result.value for result in results] == ['fast', 'slow']
+    assert critical_path(results).db == 'slow'
+
+
+def test_tasks_run_concurrently():
+    executor = ScatterGatherExecutor(max_workers=4)
+    barrier = threading.Barrier(4, timeout=1)
+    results = list(executor.run({f'h{i}': barrier.wait for i in range(4)}))
+    executor.shutdown()
+
+    assert all(result.error is None for result in results)
+
+
+def test_a_failing_shard_does_not_fail_the_others():
+    def fail():
+        raise ValueError('broken shard')
+
+    executor = ScatterGatherExecutor()
+    results = {result.db: result for result in executor.run({'ok': lambda: 1, 'broken': fail})}
+    executor.shutdown()
+
+    assert results['ok'].value == 1
+    assert isinstance(results['broken'].error, ValueError)
+    assert results['broken'].value is None
+
+
+def test_a_slow_shard_times_out_on_its_own():
+    release = threading.Event()
+    executor = ScatterGatherExecutor()
+    start = time.perf_counter()
+    results = {result.db: result for result in executor.run({'stuck': release.wait, 'ok': lambda: 1}, timeout=0.05)}
+    elapsed = time.perf_counter() - start
+    release.set()
+    executor.shutdown()
+
+    assert results['ok'].value == 1
+    assert isinstance(results['stuck'].error, TimeoutError)
+    assert elapsed < 1
+
+
+def test_the_timeout_starts_when_the_shard_starts():
+    # with one worker the second task waits for the first; it must not be timed out for that wait
+    executor = ScatterGatherExecutor(max_workers=1)
+    results = list(executor.run({'a': lambda: time.sleep(0.04), 'b': lambda: time.sleep(0.04)}, timeout=0.06))
+    executor.shutdown()
+
+    assert [result.error for result in results] == [None, None]
+
+
+def test_scatter_gather_reads_every_shard(cluster):
+    cluster.populate(30)
+    results = list(cluster.dbm.scatter_gather('SELECT COUNT(*) FROM Users;'))
+
+    assert sorted(result.db for result in results) == sorted(cluster.names)
+    assert sum(result.value[0][0] for result in results) == 30
+    assert critical_path([]) is None
+    assert isinstance(results[0], ShardResult)
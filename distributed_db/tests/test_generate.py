@@ -0,0 +1,65 @@
+from collections import Counter
+import json
+
+from benchmarks.generate import (CONTENDERS, PLAYERS_BY_POPULARITY, TEAMS_BY_POPULARITY, DataGenerator, insert, nba_rows,
+                                 write_json)
+
+
+RANGES = {'Start': [2024010100, 2024020100], 'End': [2024013123, 2024030100]}
+
+
+def _favorite_teams(generator, num_users):
+    return Counter(
+        preference['nba_entity']
+        for _, preferences in generator.generate(num_users)
+        for preference in preferences
+        if preference['preference'] == 'favorite' and preference['nba_entity'] in TEAMS_BY_POPULARITY
+    )
+
+
+def test_the_data_is_deterministic_for_a_seed():
+    assert list(DataGenerator(RANGES, seed=7).generate(50)) == list(DataGenerator(RANGES, seed=7).generate(50))
+    assert list(DataGenerator(RANGES, seed=7).generate(50)) != list(DataGenerator(RANGES, seed=8).generate(50))
+
+
+def test_dates_fall_inside_the_ranges():
+    dates = [user['date'] for user, _ in DataGenerator(RANGES).generate(2000)]
+
+    assert all(any(start <= date <= end for start, end in zip(RANGES['Start'], RANGES['End'])) for date in dates)
+    # both ranges get users
+    assert {date < RANGES['Start'][1] for date in dates} == {True, False}
+
+
+def test_popularity_is_skewed_towards_the_top_teams():
+    skewed = _favorite_teams(DataGenerator(RANGES, skew=1.1), 5000)
+    uniform = _favorite_teams(DataGenerator(RANGES, skew=0), 5000)
+
+    assert skewed.most_common(1)[0][0] == TEAMS_BY_POPULARITY[0]
+    assert skewed[TEAMS_BY_POPULARITY[0]] > 10 * skewed[TEAMS_BY_POPULARITY[-1]]
+    assert max(uniform.values()) < 2 * min(uniform.values())
+
+
+def test_a_user_has_at_most_one_preference_per_entity():
+    for user, preferences in DataGenerator(RANGES).generate(500):
+        entities = [preference['nba_entity'] for preference in preferences]
+        assert len(entities) == len(set(entities))
+        assert all(preference['user'] == user['user'] for preference in preferences)
+    assert {row['name'] for row in nba_rows()} >= set(CONTENDERS) | set(PLAYERS_BY_POPULARITY)
+
+
+def test_json_output_is_valid(tmp_path):
+    report = write_json(DataGenerator(RANGES), 100, str(tmp_path))
+    users = json.loads((tmp_path / 'users.json').read_text())
+    prefs = json.loads((tmp_path / 'prefs.json').read_text())
+
+    assert report['users'] == len(users) == 100
+    assert report['prefs'] == len(prefs) and json.loads((tmp_path / 'nba.json').read_text()) == nba_rows()
+
+
+def test_generated_data_can_be_inserted(cluster):
+    generator = DataGenerator(cluster.metadata['Ranges'])
+    totals = insert(generator, 200, cluster.metadata_path, chunk_size=64)
+
+    assert totals['users'] == 200 and totals['errors'] == 0
+    stored = sum(cluster.dbm.query_one('SELECT COUNT(*) FROM Users;', credentials)[0][0] for credentials in cluster.metadata['Connections'].values())
+    assert stored == 200
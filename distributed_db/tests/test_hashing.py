@@ -0,0 +1,88 @@
+from collections import Counter
+
+import pytest
+
+from db.exceptions import UnknownHashError
+from db.hashing import (HASH_FUNCTIONS, LEGACY_HASH, get_hash_function, jump_consistent_hash, legacy_hash,
+                        murmur3_32, range_hashes)
+
+
+USERS = [f'user{i}' for i in range(4000)]
+
+
+def _functions():
+    names = list(HASH_FUNCTIONS)
+    try:
+        get_hash_function('xxhash')
+    except UnknownHashError:
+        names.remove('xxhash')
+    return names
+
+
+@pytest.mark.parametrize('data, expected', [
+    (b'', 0),
+    (b'hello', 0x248bfa47),
+    (b'The quick brown fox jumps over the lazy dog', 0x2e4ff723)
+])
+def test_murmur3_matches_the_reference(data, expected):
+    assert murmur3_32(data) == expected
+
+
+def test_the_legacy_hash_is_unchanged():
+    # data written before hashes were recorded must keep routing to the same shard
+    assert legacy_hash('alice', 7) == sum(map(ord, 'alice')) % 7
+    assert legacy_hash('alice', 7) == legacy_hash('eilca', 7)
+
+
+@pytest.mark.parametrize('name', _functions())
+def test_hashes_are_deterministic_and_in_range(name):
+    hash_function = get_hash_function(name)
+    for modulus in (1, 2, 5, 16):
+        values = [hash_function(user, modulus) for user in USERS[:200]]
+        assert values == [hash_function(user, modulus) for user in USERS[:200]]
+        assert all(0 <= value < modulus for value in values)
+
+
+@pytest.mark.parametrize('name', [name for name in _functions() if name != LEGACY_HASH])
+def test_new_hashes_spread_similar_names_evenly(name):
+    counts = Counter(get_hash_function(name)(user, 8) for user in USERS)
+
+    assert len(counts) == 8
+    assert max(counts.values()) < 1.2 * len(USERS) / 8
+
+
+def test_jump_only_moves_users_to_the_new_shards():
+    hash_function = get_hash_function('jump')
+    moved = 0
+    for user in USERS:
+        before, after = hash_function(user, 4), hash_function(user, 6)
+        if before != after:
+            assert after >= 4
+            moved += 1
+
+    # (m - n) / m of the users move, about a third here
+    assert abs(moved / len(USERS) - 2 / 6) < 0.05
+
+
+def test_jump_consistent_hash_edge_cases():
+    assert jump_consistent_hash(0, 1) == 0
+    assert jump_consistent_hash(2 ** 64 - 1, 1) == 0
+    assert all(0 <= jump_consistent_hash(key, 3) < 3 for key in range(1000))
+
+
+def test_unknown_hashes_are_rejected():
+    assert get_hash_function(None) is legacy_hash
+    with pytest.raises(UnknownHashError):
+        get_hash_function('md5')
+
+
+def test_ranges_without_hashes_use_legacy():
+    assert range_hashes({'Start': [1, 2, 3], 'Hashes': ['jump']}) == ['jump', LEGACY_HASH, LEGACY_HASH]
+    assert range_hashes({'Start': [1]}) == [LEGACY_HASH]
+
+
+def test_the_cluster_routes_with_its_recorded_hash(cluster):
+    assert cluster.metadata['Ranges']['Hashes'] == ['jump']
+    for user in cluster.users(20):
+        expected = f"r{cluster.start}h{get_hash_function('jump')(user['user'], len(cluster.names))}"
+        assert cluster.dbm.locate_db(cluster.metadata, cluster.start + 1, user['user']) == expected
@@ -0,0 +1,106 @@
+import asyncio
+
+from benchmarks.common import LocalCluster
+from tests.helpers import counters, execute, live_counts
+
+
+def _stored_users(cluster: LocalCluster, dbs: list = None) -> dict:
+    """
+    {user: shard} for every user stored on the given shards (all by default).
+    """
+    stored = {}
+    for db in dbs or cluster.names:
+        for (user,) in cluster.dbm.query_one('SELECT user FROM Users;', cluster.metadata['Connections'][db]):
+            stored[user] = db
+    return stored
+
+
+def test_records_go_to_the_shard_they_route_to(cluster):
+    users = cluster.users(50)
+    report = cluster.dbm.insert_many('users', users)
+
+    stored = _stored_users(cluster)
+    metadata = cluster.metadata
+    assert report['inserted'] == 50
+    assert stored == {user['user']: cluster.dbm.locate_db(metadata, user['date'], user['user']) for user in users}
+    assert report['per_shard'] == {db: list(stored.values()).count(db) for db in report['per_shard']}
+    assert all(cluster.dbm.directory.lookup(user['user'])[1] == stored[user['user']] for user in users)
+
+
+def test_a_failing_batch_is_replayed_row_by_row(cluster):
+    users = cluster.users(30)
+    cluster.dbm.insert_many('users', users[:1])
+    report = cluster.dbm.insert_many('users', users + [{'user': 'nodate', 'password': 'password'}], batch_size=10)
+
+    assert [record['user'] for _, record in report['duplicates']] == [users[0]['user']]
+    assert [record['user'] for _, record, _ in report['errors']] == ['nodate']
+    assert report['inserted'] == 29
+    assert len(_stored_users(cluster)) == 30
+
+
+def test_missing_fields_are_reported_and_the_rest_inserted(cluster):
+    users = cluster.users(10)
+    cluster.dbm.insert_many('users', users)
+    records = [{'user': users[0]['user'], 'date': users[0]['date'], 'nba_entity': 'Miami Heat'}]
+    records += cluster.preferences(users[1:], per_user=2)
+    report = cluster.dbm.insert_many('prefs', records, batch_size=4)
+
+    assert [(record['user'], message) for _, record, message in report['errors']] == [(users[0]['user'], "missing field 'preference'")]
+    assert report['inserted'] == 18
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_unroutable_records_are_reported_without_a_shard(cluster):
+    report = cluster.dbm.insert_many('users', [{'user': 'early', 'password': 'password', 'date': 2000010100}] + cluster.users(5))
+
+    assert [(db, record['user']) for db, record, _ in report['errors']] == [(None, 'early')]
+    assert report['inserted'] == 5
+
+
+def test_reference_rows_go_to_every_shard(cluster):
+    report = cluster.dbm.insert_many('nba', [{'name': 'Sacramento Kings', 'type': 'team'}])
+
+    assert report['per_shard'] == {db: 1 for db in cluster.names}
+    for credentials in cluster.metadata['Connections'].values():
+        assert [tuple(row) for row in cluster.dbm.query_one("SELECT type FROM Nba WHERE name = 'Sacramento Kings';", credentials)] == [('team',)]
+
+
+def test_a_shard_error_fails_only_that_shard(cluster):
+    broken, healthy = cluster.names[0], cluster.names[1:]
+    execute(cluster, cluster.metadata['Connections'][broken], 'ALTER TABLE Users RENAME TO UsersMoved;')
+    report = cluster.dbm.insert_many('users', cluster.users(40))
+
+    stored = _stored_users(cluster, healthy)
+    assert [db for db, record, _ in report['errors'] if record is None] == [broken]
+    assert report['per_shard'][broken] == 0
+    assert report['inserted'] == len(stored) > 0
+
+
+def test_an_exhausted_pool_fails_only_that_shard():
+    with LocalCluster(2, max_size=1, acquire_timeout=0.05) as cluster:
+        busy = cluster.names[0]
+        # hold the only connection to one shard, so insert_many times out waiting for it
+        with cluster.dbm.connection(cluster.metadata['Connections'][busy]):
+            report = cluster.dbm.insert_many('users', cluster.users(40))
+
+        stored = _stored_users(cluster)
+        assert [db for db, record, message in report['errors'] if record is None] == [busy]
+        assert 'PoolExhaustedError' in report['errors'][0][2]
+        assert report['per_shard'][busy] == 0
+        assert report['inserted'] == len(stored) > 0
+        assert busy not in stored.values()
+
+
+def test_bulk_insert_route_returns_the_report(client, cluster):
+    async def scenario():
+        records = [{'user': user['user'], 'password': 'password', 'date': user['date']} for user in cluster.users(20)]
+        unknown = await client.post('/api/bulk_insert/teams', json=records)
+        first = await client.post('/api/bulk_insert/users', json=records)
+        again = await client.post('/api/bulk_insert/users?batch_size=5', json=records)
+        return unknown.status_code, await first.get_json(), await again.get_json()
+
+    unknown, first, again = asyncio.run(scenario())
+    assert unknown == 400
+    assert first['inserted'] == 20
+    assert again['inserted'] == 0
+    assert len(again['duplicates']) == 20
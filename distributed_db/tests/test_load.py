@@ -0,0 +1,55 @@
+from collections import Counter
+import time
+
+import pytest
+
+from benchmarks.generate import PLAYERS_BY_POPULARITY, TEAMS_BY_POPULARITY
+
+# the load driver talks to the API over HTTP
+requests = pytest.importorskip('requests')
+from benchmarks.load import CATEGORIES, LoadDriver, parse_mix
+
+
+def test_the_mix_is_parsed():
+    assert parse_mix('login=1,get=6.5') == {'login': 1.0, 'get': 6.5}
+    with pytest.raises(ValueError):
+        parse_mix('login=1,explode=2')
+
+
+class FakeResponse():
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+
+def test_requests_follow_the_schedule_and_errors_are_counted(monkeypatch):
+    users = [{'user': f'load{i}', 'password': 'password', 'date': 2024010100} for i in range(5)]
+    driver = LoadDriver('http://api', users, {'get': 3, 'save': 1}, rate=200, duration=0.25, concurrency=8)
+    outcomes = iter([FakeResponse(200), FakeResponse(500), requests.ConnectionError()] * 100)
+
+    def request(op, user):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    monkeypatch.setattr(driver, 'request', request)
+    start = time.perf_counter()
+    results = driver.run()
+
+    assert time.perf_counter() - start >= 0.24
+    assert results['requests'] == sum(op['requests'] for op in results['operations'].values()) == 50
+    assert results['errors'] == sum(sum(op['error_kinds'].values()) for op in results['operations'].values())
+    kinds = Counter()
+    for op in results['operations'].values():
+        kinds.update(op['error_kinds'])
+    assert set(kinds) == {'HTTP 500', 'ConnectionError'}
+    assert results['latency_ms']['n'] == 50 - results['errors']
+
+
+def test_saved_preferences_are_sorted_into_the_ui_categories():
+    driver = LoadDriver('http://api', [], {'save': 1}, rate=1, duration=1)
+    for i in range(50):
+        payload = driver._payload({'user': f'load{i}', 'date': 2024010100})
+        assert set(payload) == set(CATEGORIES.values())
+        assert all(name in PLAYERS_BY_POPULARITY for name in payload['favorite_players'])
+        assert all(name in TEAMS_BY_POPULARITY for name in payload['favorite_teams'] + payload['bandwagon_teams'] + payload['rival_teams'])
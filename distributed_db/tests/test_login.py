@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from db.drivers import SQLiteCursor, sqlite_credentials
+from db.store import write_metadata
+
+
+@pytest.fixture
+def later(cluster):
+    """
+    Adds a second range of two shards starting 50 hours after the first, and returns its start date.
+    """
+    later = cluster.start + 50
+    metadata = dict(cluster.metadata)
+    names = [f'r{later}h{h}' for h in range(2)]
+    metadata['Ranges'] = {
+        'Start': [cluster.start, later],
+        'End': [later - 1, None],
+        'Moduli': [len(cluster.names), 2],
+        'Hashes': ['jump', 'jump']
+    }
+    metadata['Connections'] = dict(metadata['Connections'], **{db: sqlite_credentials(db) for db in names})
+    cluster.names += names
+    write_metadata(cluster.metadata_path, metadata)
+    cluster.dbm.metadata_store.reload()
+    return later
+
+
+def _login(client, username: str, date: int, password: str = 'password'):
+    async def post():
+        response = await client.post('/login', json={'username': username, 'password': password, 'date': str(date)})
+        return response.status_code, await response.get_json()
+    return asyncio.run(post())
+
+
+def _stored(cluster, username: str) -> dict:
+    """
+    {shard: (password, date)} of every copy of the user.
+    """
+    stored = {}
+    for db, credentials in cluster.metadata['Connections'].items():
+        for password, date in cluster.dbm.query_one('SELECT password, date FROM Users WHERE user = %s;', credentials, params=(username,)):
+            stored[db] = (password, date)
+    return stored
+
+
+def test_a_returning_user_stays_on_their_home_shard(api, client, cluster, later):
+    status, first = _login(client, 'alice', cluster.start + 1)
+    home = cluster.dbm.locate_db(cluster.metadata, cluster.start + 1, 'alice')
+    api.login_homes.clear()
+    status, second = _login(client, 'alice', later + 1)
+
+    assert status == 200
+    assert first['timestamp'] == second['timestamp'] == str(cluster.start + 1)
+    assert _stored(cluster, 'alice') == {home: ('password', cluster.start + 1)}
+
+
+def test_a_new_password_is_stored(client, cluster):
+    _login(client, 'bob', cluster.start)
+    _login(client, 'bob', cluster.start, password='secret')
+
+    assert list(_stored(cluster, 'bob').values()) == [('secret', cluster.start)]
+
+
+def test_a_login_is_one_statement(client, cluster, monkeypatch):
+    _login(client, 'carol', cluster.start)
+    statements = []
+    execute = SQLiteCursor.execute
+    monkeypatch.setattr(SQLiteCursor, 'execute', lambda self, query, args=None: statements.append(query) or execute(self, query, args))
+    _login(client, 'carol', cluster.start)
+
+    assert len(statements) == 1 and 'ON DUPLICATE KEY UPDATE' in statements[0]
+
+
+def test_repeated_logins_skip_the_directory(api, client, cluster, monkeypatch):
+    _login(client, 'dave', cluster.start)
+
+    async def unexpected(*args):
+        raise AssertionError('looked up a cached user')
+    monkeypatch.setattr(api.dbm, 'find_user', unexpected)
+
+    assert _login(client, 'dave', cluster.start + 5)[1]['timestamp'] == str(cluster.start)
+
+
+def test_cached_homes_from_older_metadata_are_not_used(api, client, cluster, later):
+    _login(client, 'erin', cluster.start)
+    version, date, db = api.login_homes.get('erin')
+    api.login_homes.put('erin', (version - 1, later, f'r{later}h0'))
+
+    assert _login(client, 'erin', later + 1)[1]['timestamp'] == str(cluster.start)
+    assert list(_stored(cluster, 'erin')) == [db]
@@ -0,0 +1,92 @@
+import json
+import os
+import time
+
+import pytest
+
+from db.store import MetadataStore, metadata_fingerprint, write_metadata
+
+
+METADATA = {'Ranges': {'Start': [2024010100], 'End': [None], 'Moduli': [2]}, 'Connections': {}}
+
+
+def _expanded():
+    return dict(METADATA, Ranges={'Start': [2024010100], 'End': [None], 'Moduli': [4]})
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'metadata.json')
+    write_metadata(path, METADATA)
+    return path
+
+
+def test_the_parsed_file_is_shared_until_it_changes(path):
+    store = MetadataStore(path, check_interval=0)
+    first = store.get()
+
+    assert first == METADATA
+    assert store.get() is first
+    assert store.version == 1
+
+    write_metadata(path, _expanded())
+    second = store.get()
+
+    assert second['Ranges']['Moduli'] == [4]
+    assert second.version == 2
+    assert first['Ranges']['Moduli'] == [2]
+
+
+def test_changes_are_picked_up_after_the_check_interval(path):
+    store = MetadataStore(path, check_interval=0.05)
+    store.get()
+    write_metadata(path, _expanded())
+
+    assert store.get()['Ranges']['Moduli'] == [2]
+    time.sleep(0.06)
+    assert store.get()['Ranges']['Moduli'] == [4]
+
+
+def test_a_half_written_file_keeps_the_old_version(path):
+    store = MetadataStore(path, check_interval=0)
+    store.get()
+    with open(path, 'w') as file:
+        file.write('{"Ranges": ')
+
+    assert store.get() == METADATA
+    assert store.version == 1
+
+
+def test_reload_forces_a_new_version(path):
+    store = MetadataStore(path, check_interval=60)
+    store.get()
+
+    assert store.reload().version == 2
+
+
+def test_write_metadata_replaces_the_file_atomically(path):
+    os.chmod(path, 0o640)
+    write_metadata(path, _expanded())
+
+    with open(path) as file:
+        assert json.load(file) == _expanded()
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert [name for name in os.listdir(os.path.dirname(path))] == ['metadata.json']
+
+
+def test_a_failed_write_leaves_the_old_file(path):
+    with pytest.raises(TypeError):
+        write_metadata(path, {'Ranges': object()})
+
+    with open(path) as file:
+        assert json.load(file) == METADATA
+    assert os.listdir(os.path.dirname(path)) == ['metadata.json']
+
+
+def test_the_fingerprint_ignores_key_order_and_the_version(path):
+    reordered = {'Connections': {}, 'Ranges': {'Moduli': [2], 'End': [None], 'Start': [2024010100]}}
+
+    assert metadata_fingerprint(reordered) == metadata_fingerprint(METADATA)
+    assert MetadataStore(path).get().fingerprint == metadata_fingerprint(METADATA)
+    assert metadata_fingerprint(_expanded()) != metadata_fingerprint(METADATA)
+
@@ -0,0 +1,107 @@
+import asyncio
+import math
+
+import pytest
+
+from db.metrics import MetricsRegistry, histogram_quantile, parse_text
+
+from tests.helpers import execute
+
+
+def _samples(text: str, name: str) -> dict:
+    return {tuple(sorted(labels.items())): value for sample, labels, value in parse_text(text) if sample == name}
+
+
+def test_counters_and_gauges_render_in_the_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests.', ('route',))
+    requests.inc(route='/login')
+    requests.inc(2, route='/login')
+    requests.inc(route='/api/preferences/<username>')
+    registry.gauge('temperature', 'Temperature.').set(21.5)
+    text = registry.render()
+
+    assert '# TYPE requests_total counter' in text and '# TYPE temperature gauge' in text
+    assert _samples(text, 'requests_total') == {(('route', '/login'),): 3, (('route', '/api/preferences/<username>'),): 1}
+    assert _samples(text, 'temperature') == {(): 21.5}
+
+
+def test_histograms_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        latency.observe(value)
+    text = registry.render()
+    buckets = {labels['le']: value for name, labels, value in parse_text(text) if name == 'latency_seconds_bucket'}
+
+    assert buckets == {'0.1': 1, '1': 3, '+Inf': 4}
+    assert _samples(text, 'latency_seconds_count') == {(): 4}
+    assert _samples(text, 'latency_seconds_sum') == {(): pytest.approx(6.05)}
+
+
+def test_label_values_are_escaped_and_parsed_back():
+    registry = MetricsRegistry()
+    registry.counter('errors_total', 'Errors.', ('error',)).inc(error='say "hi"\\\nbye')
+
+    assert parse_text(registry.render()) == [('errors_total', {'error': 'say "hi"\\\nbye'}, 1.0)]
+
+
+def test_a_name_has_one_kind():
+    registry = MetricsRegistry()
+    counter = registry.counter('events_total', 'Events.')
+
+    assert registry.counter('events_total', 'Events.') is counter
+    with pytest.raises(ValueError):
+        registry.gauge('events_total', 'Events.')
+
+
+def test_collectors_run_before_rendering():
+    registry = MetricsRegistry()
+    gauge = registry.gauge('queue_length', 'Queue length.')
+    queue = [1, 2, 3]
+    registry.add_collector(lambda: gauge.set(len(queue)))
+
+    assert _samples(registry.render(), 'queue_length') == {(): 3}
+    queue.pop()
+    assert _samples(registry.render(), 'queue_length') == {(): 2}
+
+
+def test_quantiles_interpolate_inside_the_bucket():
+    buckets = [(0.1, 10), (0.2, 60), (math.inf, 100)]
+
+    assert histogram_quantile(0.5, buckets) == pytest.approx(0.18)
+    assert histogram_quantile(0.05, buckets) == pytest.approx(0.05)
+    assert histogram_quantile(0.99, buckets) == 0.2
+    assert histogram_quantile(0.5, [(0.1, 0), (math.inf, 0)]) is None
+
+
+def test_shard_operations_are_measured(cluster):
+    cluster.populate(20)
+    broken = cluster.names[0]
+    execute(cluster, cluster.metadata['Connections'][broken], 'DROP TABLE FandomCounts;')
+    list(cluster.dbm.scatter_gather('SELECT COUNT(*) FROM FandomCounts;'))
+    text = cluster.dbm.metrics.render()
+
+    errors = _samples(text, 'distributed_db_shard_errors_total')
+    assert [dict(labels)['shard'] for labels in errors if dict(labels)['operation'] == 'query'] == [broken]
+    counts = _samples(text, 'distributed_db_shard_operation_seconds_count')
+    assert {dict(labels)['shard'] for labels in counts if dict(labels)['operation'] == 'query'} == set(cluster.names)
+    pools = _samples(text, 'distributed_db_pool_connections')
+    assert {dict(labels)['shard'] for labels in pools} == set(cluster.names)
+
+
+def test_the_api_serves_its_metrics(api, client, cluster):
+    async def scenario():
+        await client.post('/login', json={'username': 'metered', 'password': 'password', 'date': str(cluster.start)})
+        await client.get(f'/api/preferences/metered?timestamp={cluster.start}')
+        response = await client.get('/metrics')
+        return response.status_code, response.headers['Content-Type'], await response.get_data(as_text=True)
+
+    status, content_type, text = asyncio.run(scenario())
+    # the route histogram was registered with the API's own manager, which the api fixture swaps out
+    routes = {labels['route'] for name, labels, _ in parse_text('\n'.join(api.request_seconds.lines())) if name.endswith('_count')}
+
+    assert status == 200 and content_type.startswith('text/plain; version=0.0.4')
+    # labelled by the route template, not the URL
+    assert {'/login', '/api/preferences/<username>'} <= routes
+    assert _samples(text, 'distributed_db_locate_db_seconds_count')
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pymysql
+import pytest
+from pymysql.constants import SERVER_STATUS
+
+from db.exceptions import PoolExhaustedError
+from db.pool import ConnectionPool, PoolManager
+
+
+class FakeConnection():
+    def __init__(self) -> None:
+        self.open = True
+        self.healthy = True
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    @property
+    def server_status(self) -> int:
+        return SERVER_STATUS.SERVER_STATUS_IN_TRANS if self.in_transaction else 0
+
+    def ping(self, reconnect: bool = False) -> None:
+        if not self.healthy:
+            raise pymysql.err.OperationalError(2006, 'MySQL server has gone away')
+
+    def rollback(self) -> None:
+        self.in_transaction = False
+        self.rollbacks += 1
+
+    def close(self) -> None:
+        self.open = False
+
+
+class FakeDriver():
+    def __init__(self) -> None:
+        self.opened = []
+
+    def connect(self, params: dict) -> FakeConnection:
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+
+def _pool(**options) -> ConnectionPool:
+    return ConnectionPool('shard', {}, driver=FakeDriver(), **options)
+
+
+def test_connections_are_reused_last_in_first_out():
+    pool = _pool()
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+
+    assert pool.acquire() is second
+    assert pool.acquire() is first
+    assert pool.stats()['created'] == 2
+    assert pool.stats()['reused'] == 2
+
+
+def test_a_full_pool_waits_then_times_out():
+    pool = _pool(max_size=1, acquire_timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+
+    # a connection given back while a borrower waits is handed to it
+    threading.Timer(0.02, pool.release, (held,)).start()
+    assert pool.acquire(timeout=1) is held
+
+
+def test_an_open_transaction_is_rolled_back_on_release():
+    pool = _pool()
+    connection = pool.acquire()
+    connection.in_transaction = True
+    pool.release(connection)
+
+    assert connection.rollbacks == 1
+    assert pool.acquire() is connection
+
+
+def test_a_connection_that_lost_its_server_is_discarded():
+    pool = _pool()
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection() as connection:
+            raise pymysql.err.OperationalError(2013, 'Lost connection')
+
+    assert not connection.open
+    assert pool.stats()['discarded'] == 1
+    assert pool.acquire() is not connection
+
+
+def test_idle_connections_are_checked_and_evicted():
+    pool = _pool(idle_timeout=0.05, health_check_interval=0)
+    connection = pool.acquire()
+    pool.release(connection)
+    connection.healthy = False
+    assert pool.acquire() is not connection
+    assert pool.stats()['failed_health_checks'] == 1
+
+    stale = pool.acquire()
+    pool.release(stale)
+    time.sleep(0.06)
+    assert pool.acquire() is not stale
+    assert pool.stats()['evicted'] == 1
+
+
+def test_a_closed_pool_refuses_connections():
+    pool = _pool()
+    pool.release(pool.acquire())
+    pool.close()
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+
+
+def test_pools_are_replaced_when_credentials_change(cluster, tmp_path):
+    credentials = cluster.metadata['Connections'][cluster.names[0]]
+    manager = PoolManager()
+    pool = manager.get_pool(cluster.names[0], credentials)
+    assert manager.get_pool(cluster.names[0], credentials) is pool
+
+    moved = dict(credentials, path=str(tmp_path / 'moved.sqlite'))
+    assert manager.get_pool(cluster.names[0], moved) is not pool
+    manager.close_all()
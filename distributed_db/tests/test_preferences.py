@@ -0,0 +1,124 @@
+import asyncio
+
+from tests.helpers import counters, live_counts, preferences
+
+
+async def _login(client, cluster, username: str) -> None:
+    await client.post('/login', json={'username': username, 'password': 'password', 'date': str(cluster.start)})
+
+
+async def _save(client, cluster, username: str, **categories) -> None:
+    response = await client.post('/api/save_preferences', json={'username': username, 'timestamp': str(cluster.start), **categories})
+    assert response.status_code == 200, await response.get_data(as_text=True)
+
+
+async def _get(client, cluster, username: str):
+    response = await client.get(f'/api/preferences/{username}?timestamp={cluster.start}')
+    return await response.get_json(), response.headers['ETag']
+
+
+def test_save_keeps_an_entity_under_two_preferences(client, cluster):
+    async def scenario():
+        await _login(client, cluster, 'both')
+        await _save(client, cluster, 'both', favorite_teams=['Boston Celtics'], bandwagon_teams=['Boston Celtics'])
+        return await _get(client, cluster, 'both')
+
+    document, _ = asyncio.run(scenario())
+    assert preferences(cluster, 'both') == {('Boston Celtics', 'favorite'), ('Boston Celtics', 'bandwagon')}
+    assert document['favorite_teams'] == ['Boston Celtics']
+    assert document['bandwagon_teams'] == ['Boston Celtics']
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_empty_save_removes_every_row_of_an_entity(client, cluster):
+    async def scenario():
+        await _login(client, cluster, 'twice')
+        cluster.dbm.insert_many('prefs', [
+            {'user': 'twice', 'date': cluster.start, 'nba_entity': 'Denver Nuggets', 'preference': preference} for preference in ('favorite', 'rival')
+        ])
+        await _save(client, cluster, 'twice', favorite_teams=[], bandwagon_teams=[], rival_teams=[], favorite_players=[])
+
+    asyncio.run(scenario())
+    assert preferences(cluster, 'twice') == set()
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_save_replaces_only_the_categories_sent(client, cluster):
+    async def scenario():
+        await _login(client, cluster, 'partial')
+        await _save(client, cluster, 'partial', favorite_teams=['Miami Heat'], rival_teams=['Boston Celtics'], favorite_players=['Jimmy Butler'])
+        await _save(client, cluster, 'partial', favorite_teams=['Denver Nuggets'])
+
+    asyncio.run(scenario())
+    assert preferences(cluster, 'partial') == {('Denver Nuggets', 'favorite'), ('Boston Celtics', 'rival'), ('Jimmy Butler', 'favorite')}
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_saved_document_uses_the_stored_entity_type(api, client, cluster):
+    # Jimmy Butler is already stored as a player, so saving him as a favorite team must not cache him as a team
+    async def scenario():
+        await _login(client, cluster, 'mixed')
+        await _save(client, cluster, 'mixed', favorite_teams=['Jimmy Butler', 'Miami Heat'])
+        cached = await _get(client, cluster, 'mixed')
+        api.preference_docs.clear()
+        return cached, await _get(client, cluster, 'mixed')
+
+    cached, cold = asyncio.run(scenario())
+    assert cached == cold
+    assert cold[0]['favorite_players'] == ['Jimmy Butler']
+    assert cold[0]['favorite_teams'] == ['Miami Heat']
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_delete_removes_every_row_and_its_counters(client, cluster):
+    async def scenario():
+        await _login(client, cluster, 'leaving')
+        await _save(client, cluster, 'leaving', favorite_teams=['Miami Heat'], rival_teams=['Miami Heat'], favorite_players=['Jimmy Butler'])
+        response = await client.post('/api/delete_preferences', json={'username': 'leaving', 'timestamp': str(cluster.start)})
+        assert response.status_code == 200, await response.get_data(as_text=True)
+        return await _get(client, cluster, 'leaving')
+
+    document, _ = asyncio.run(scenario())
+    assert preferences(cluster, 'leaving') == set()
+    assert not any(document.values())
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_an_unchanged_profile_is_answered_with_304_from_the_cache(api, client, cluster, monkeypatch):
+    async def scenario():
+        await _login(client, cluster, 'etag')
+        await _save(client, cluster, 'etag', favorite_teams=['Miami Heat'])
+        api.preference_docs.clear()
+        document, etag = await _get(client, cluster, 'etag')
+
+        async def unexpected(*args):
+            raise AssertionError('read a cached profile from the shard')
+        monkeypatch.setattr(api.dbm, 'transaction', unexpected)
+
+        unchanged = await client.get(f'/api/preferences/etag?timestamp={cluster.start}', headers={'If-None-Match': etag})
+        stale = await client.get(f'/api/preferences/etag?timestamp={cluster.start}', headers={'If-None-Match': '"old"'})
+        return document, etag, unchanged, await stale.get_json(), stale.headers['ETag']
+
+    document, etag, unchanged, refreshed, refreshed_etag = asyncio.run(scenario())
+    assert unchanged.status_code == 304
+    assert unchanged.headers['ETag'] == etag
+    assert refreshed == document and refreshed_etag == etag
+
+
+def test_saves_and_deletes_write_the_document_through(api, client, cluster, monkeypatch):
+    async def scenario():
+        await _login(client, cluster, 'through')
+        await _save(client, cluster, 'through', favorite_teams=['Miami Heat'])
+        first = await _get(client, cluster, 'through')
+        await _save(client, cluster, 'through', favorite_teams=['Boston Celtics'], favorite_players=['Stephen Curry'])
+        # served from the document the save wrote, not from the shard
+        monkeypatch.setattr(api, '_get_preferences', None)
+        saved = await _get(client, cluster, 'through')
+        await client.post('/api/delete_preferences', json={'username': 'through', 'timestamp': str(cluster.start)})
+        return first, saved, await _get(client, cluster, 'through')
+
+    first, saved, deleted = asyncio.run(scenario())
+    assert first[0]['favorite_teams'] == ['Miami Heat']
+    assert saved[0]['favorite_teams'] == ['Boston Celtics'] and saved[0]['favorite_players'] == ['Stephen Curry']
+    assert not any(deleted[0].values())
+    assert len({first[1], saved[1], deleted[1]}) == 3
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import pstats
+import time
+
+import pytest
+
+from db.profiling import Profiler, bind, collapsed_stacks, note_shard
+
+
+def _spin(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_a_session_writes_the_stats_stacks_and_tags(tmp_path, cluster):
+    cluster.populate(10)
+    profiler = Profiler(str(tmp_path), min_ms=0)
+    with profiler.session('cli', 'breakdown', argv=['breakdown']) as profile:
+        list(cluster.dbm.scatter_gather('SELECT COUNT(*) FROM Users;'))
+        _spin(0.02)
+
+    with open(profile.path + '.json') as file:
+        tags = json.load(file)
+    with open(profile.path + '.collapsed') as file:
+        stacks = file.read()
+
+    assert os.path.basename(profile.path).split('-')[3:5] == ['cli', 'breakdown']
+    assert tags['kind'] == 'cli' and tags['tags'] == {'argv': ['breakdown']}
+    assert tags['shards'] == sorted(cluster.names) and tags['duration_ms'] >= 20
+    # the scatter-gather workers ran on other threads and are merged into the same profile
+    assert '_spin (test_profiling.py' in stacks and 'execute' in stacks
+    assert pstats.Stats(profile.path + '.pstats').total_tt > 0
+
+
+def test_unsampled_and_fast_work_is_not_kept(tmp_path):
+    with Profiler(str(tmp_path), sample_rate=0).session('cli', 'select') as profile:
+        note_shard('r1h0')
+    assert profile is None
+
+    with Profiler(str(tmp_path), min_ms=10_000).session('cli', 'select') as profile:
+        pass
+    assert profile.path is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_bind_only_wraps_profiled_callers():
+    assert bind(_spin) is _spin
+
+
+def test_async_views_are_profiled_without_the_requests_they_interleave_with(tmp_path):
+    profiler = Profiler(str(tmp_path), min_ms=0)
+
+    async def profiled_view():
+        await asyncio.sleep(0.05)
+        _spin(0.01)
+        return 'ok'
+
+    async def other_request():
+        await asyncio.sleep(0.01)
+        _spin(0.03)
+
+    async def scenario():
+        view = profiler.wrap(profiled_view, lambda: 'GET /api/preferences/<username>')
+        results = await asyncio.gather(view(), other_request())
+        return results[0]
+
+    assert asyncio.run(scenario()) == 'ok'
+    [path] = {name.rsplit('.', 1)[0] for name in os.listdir(tmp_path)}
+    stats = pstats.Stats(str(tmp_path / path) + '.pstats')
+    spin = [value for function, value in stats.stats.items() if function[2] == '_spin']
+    # only the view's own 10ms of spinning, not the 30ms of the request interleaved with it
+    assert len(spin) == 1 and spin[0][3] < 0.025
+
+
+def test_collapsed_stacks_follow_the_call_graph(tmp_path):
+    def leaf():
+        _spin(0.02)
+
+    def middle():
+        leaf()
+
+    profiler = Profiler(str(tmp_path), min_ms=0)
+    with profiler.session('cli', 'stacks') as profile:
+        middle()
+
+    stacks = dict(collapsed_stacks(profile.stats()))
+    spinning = [stack.split(';') for stack in stacks if stack.rsplit(';', 1)[-1].startswith('_spin (')]
+    assert any([frame.split(' ')[0] for frame in stack[-3:]] == ['middle', 'leaf', '_spin'] for stack in spinning)
+    assert sum(stacks.values()) == pytest.approx(profile.stats().total_tt * 1e6, rel=0.2)
+
+
+def test_profiling_is_configured_from_the_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv('DISTRIBUTED_DB_PROFILE', raising=False)
+    assert Profiler.from_environment() is None
+
+    monkeypatch.setenv('DISTRIBUTED_DB_PROFILE', '5')
+    monkeypatch.setenv('DISTRIBUTED_DB_PROFILE_DIR', str(tmp_path))
+    monkeypatch.setenv('DISTRIBUTED_DB_PROFILE_MIN_MS', '250')
+    profiler = Profiler.from_environment()
+    assert (profiler.sample_rate, profiler.directory, profiler.min_ms) == (1.0, str(tmp_path), 250.0)
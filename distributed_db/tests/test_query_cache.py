@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from benchmarks.common import quiet
+from db.cache import QueryCache
+from db.manager import DatabaseManager
+from db.store import write_metadata
+
+BREAKDOWN = 'SELECT nba_entity, preference, cnt FROM FandomCounts ORDER BY nba_entity, preference;'
+
+
+@pytest.fixture
+def other(cluster):
+    """
+    A second manager on the cluster's metadata file, as another process (e.g. the next `cli.py` command) would have.
+    """
+    manager = DatabaseManager(cluster.metadata_path)
+    yield manager
+    manager.close()
+
+
+def _count_shard_reads(manager) -> list:
+    reads = []
+    query_one = manager.query_one
+    manager.query_one = lambda query, credentials, params=None: reads.append(credentials['mysql_database']) or query_one(query, credentials, params=params)
+    return reads
+
+
+def _read(manager, query: str = BREAKDOWN) -> dict:
+    return {result.db: [tuple(row) for row in result.value] for result in manager.scatter_gather(query, cache=True)}
+
+
+def test_a_repeated_read_does_not_touch_the_shards(cluster):
+    cluster.populate(50)
+    reads = _count_shard_reads(cluster.dbm)
+    first = _read(cluster.dbm)
+    assert sorted(reads) == sorted(cluster.names)
+
+    reads.clear()
+    assert _read(cluster.dbm) == first
+    assert reads == []
+    assert cluster.dbm.cache_stats()['hits'] == 1
+
+
+def test_the_cache_is_shared_between_processes(cluster, other):
+    cluster.populate(50)
+    first = _read(cluster.dbm)
+
+    reads = _count_shard_reads(other)
+    assert _read(other) == first
+    assert reads == []
+    assert cluster.dbm.cache_stats()['hits'] == other.cache_stats()['hits'] == 1
+
+
+def test_a_write_in_another_process_drops_the_entries(cluster, other):
+    users = cluster.populate(50)
+    _read(cluster.dbm)
+    with quiet():
+        other.insert_many('prefs', [{'user': users[0]['user'], 'date': users[0]['date'], 'nba_entity': 'Jimmy Butler', 'preference': 'rival'}])
+
+    reads = _count_shard_reads(cluster.dbm)
+    fresh = _read(cluster.dbm)
+    assert sorted(reads) == sorted(cluster.names)
+    assert any(('Jimmy Butler', 'rival', 1) in rows for rows in fresh.values())
+
+
+def test_new_metadata_is_not_served_old_results(cluster):
+    cluster.populate(10)
+    _read(cluster.dbm)
+    metadata = cluster.metadata
+    write_metadata(cluster.metadata_path, dict(metadata, Connections=dict(list(metadata['Connections'].items())[:1])))
+    cluster.dbm.metadata_store.reload()
+
+    assert list(_read(cluster.dbm)) == cluster.names[:1]
+
+
+def test_a_result_computed_across_an_invalidation_is_not_stored(tmp_path):
+    cache = QueryCache(str(tmp_path / 'cache.sqlite'))
+    key = cache.key(BREAKDOWN)
+    generation = cache.generation(['FandomCounts'])
+    QueryCache(str(tmp_path / 'cache.sqlite')).invalidate(['FandomCounts'])
+
+    assert not cache.put(key, 'stale', ['FandomCounts'], generation)
+    assert cache.get(key) is None
+    assert cache.put(key, 'fresh', ['FandomCounts'], cache.generation(['FandomCounts']))
+    assert cache.get(key) == 'fresh'
+
+
+def test_entries_expire_and_are_evicted(tmp_path):
+    expired = QueryCache(str(tmp_path / 'expired.sqlite'), ttl=0)
+    expired.put('a', 1, ['Users'], ())
+    assert expired.get('a') is None
+
+    cache = QueryCache(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key, ['Users'], ())
+    assert len(cache) == 2
+    assert cache.get('a') is None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_queries_are_normalized(tmp_path):
+    assert QueryCache.key('SELECT  *\n   FROM Users;') == QueryCache.key('SELECT * FROM Users')
+    assert QueryCache.key('SELECT * FROM Users', (1,)) != QueryCache.key('SELECT * FROM Users', (2,))
+
+
+def test_api_serves_the_shared_counters(client, cluster, other):
+    cluster.populate(10)
+    _read(other)
+    _read(other)
+
+    async def fetch():
+        response = await client.get('/api/cache_stats')
+        return await response.get_json()
+
+    stats = asyncio.run(fetch())
+    assert stats['hits'] == 1
+    assert stats['stores'] == 1
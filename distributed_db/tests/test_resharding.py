@@ -0,0 +1,145 @@
+import pytest
+
+from db.drivers import sqlite_credentials
+from db.exceptions import ReshardError
+from db.resharding import RangeResharder
+from tests.helpers import counters, execute, live_counts, preferences
+
+
+@pytest.fixture
+def resharder(cluster):
+    cluster.populate(200)
+    return RangeResharder(cluster.dbm, cluster.metadata_path, batch_size=16, grace_period=0)
+
+
+def _connections(cluster, new_modulus: int) -> dict:
+    names = RangeResharder.new_shards(cluster.start, len(cluster.names), new_modulus)
+    # closed with the cluster's own shards
+    cluster.names += [db for db in names if db not in cluster.names]
+    return {db: sqlite_credentials(db) for db in names}
+
+
+def _homes(cluster) -> dict:
+    """
+    {user: [shards holding the user]}.
+    """
+    homes = {}
+    for db, credentials in cluster.metadata['Connections'].items():
+        for (user,) in cluster.dbm.query_one('SELECT user FROM Users;', credentials):
+            homes.setdefault(user, []).append(db)
+    return homes
+
+
+def test_plan_counts_without_writing(cluster, resharder):
+    before = _homes(cluster)
+    plan = resharder.plan(cluster.start, 4)
+
+    assert plan['scanned'] == 200
+    assert plan['users'] == sum(moves['users'] for moves in plan['moves'].values()) > 0
+    assert plan['preferences'] == 3 * plan['users']
+    assert {target for _, target in plan['moves']} <= set(plan['new_shards'])
+    assert _homes(cluster) == before
+
+
+def test_run_moves_every_user_to_its_new_shard(cluster, resharder):
+    originals = {user: preferences(cluster, user) for user in ('user0', 'user7', 'user199')}
+    plan = resharder.plan(cluster.start, 4)
+    report = resharder.run(cluster.start, 4, _connections(cluster, 4))
+
+    metadata = cluster.metadata
+    homes = _homes(cluster)
+    assert report['moved'] == plan['users']
+    assert metadata['Ranges']['Moduli'] == [4]
+    assert 'Migrations' not in metadata
+    assert len(homes) == 200
+    for user, dbs in homes.items():
+        date, db = cluster.dbm.find_user(user, metadata)
+        assert dbs == [db] == [cluster.dbm.locate_db(metadata, date, user)]
+    assert {user: preferences(cluster, user) for user in originals} == originals
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_run_refuses_bad_splits(cluster, resharder):
+    with pytest.raises(ReshardError):
+        resharder.run(cluster.start + 1, 4, {})
+    with pytest.raises(ReshardError):
+        resharder.run(cluster.start, 2, {})
+    with pytest.raises(ReshardError):
+        resharder.run(cluster.start, 4, {})
+
+    split = resharder._range(cluster.metadata, cluster.start, 4)
+    resharder.begin(split, _connections(cluster, 4))
+    with pytest.raises(ReshardError):
+        resharder.begin(split, _connections(cluster, 4))
+
+
+def _copy(cluster, resharder):
+    """
+    Run the phases up to cutover by hand. Returns the split, its view of the metadata, the users caught up and
+    what was copied of them.
+    """
+    metadata = cluster.metadata
+    split = resharder._range(metadata, cluster.start, 4)
+    connections = _connections(cluster, 4)
+    resharder.begin(split, connections)
+    view = dict(metadata, Connections={**metadata['Connections'], **connections})
+    resharder._seed_reference_tables(view, split)
+    resharder._copy_range(view, split)
+    copied = {}
+    moved = resharder._copy_range(view, split, copied=copied)
+    return split, view, moved, copied
+
+
+def test_writes_to_either_side_around_cutover_are_kept(cluster, resharder):
+    split, view, moved, copied = _copy(cluster, resharder)
+    written = ('Jimmy Butler', 'bandwagon')
+    old_write, new_write = [user for user in sorted(moved) if written not in copied[user][2]][:2]
+    insert = 'INSERT INTO Preferences(user, nba_entity, preference) VALUES (%s, %s, %s);'
+
+    # between the catch-up pass and cutover the old shard still takes writes
+    execute(cluster, view['Connections'][moved[old_write][1]], insert, (old_write, *written))
+    resharder.cutover(split, moved)
+    # after cutover the new shard does
+    execute(cluster, cluster.metadata['Connections'][moved[new_write][2]], insert, (new_write, *written))
+    report = resharder.cleanup(split, moved, copied)
+
+    assert written in preferences(cluster, old_write)
+    assert written in preferences(cluster, new_write)
+    assert report['resynced'] == 1
+    assert counters(cluster) == live_counts(cluster)
+
+
+def test_users_created_or_deleted_during_the_copy(cluster, resharder):
+    split, view, moved, copied = _copy(cluster, resharder)
+    # a user created on an old shard after the catch-up pass, and a moved user deleted there
+    late = next(f'late{i}' for i in range(1000) if resharder._target(split, f'late{i}') in split['new_shards'])
+    source = cluster.dbm.locate_db(view, cluster.start, late)
+    execute(cluster, view['Connections'][source], 'INSERT INTO Users(user, password, date) VALUES (%s, %s, %s);', (late, 'password', cluster.start))
+    deleted = sorted(moved)[0]
+    execute(cluster, view['Connections'][moved[deleted][1]], 'DELETE FROM Users WHERE user = %s;', (deleted,))
+
+    resharder.cutover(split, moved)
+    report = resharder.cleanup(split, moved, copied)
+
+    homes = _homes(cluster)
+    assert report['late'] == 1
+    assert homes[late] == [resharder._target(split, late)]
+    assert cluster.dbm.find_user(late) == (cluster.start, resharder._target(split, late))
+    assert deleted not in homes
+
+
+def test_reads_follow_users_between_cutover_and_cleanup(cluster, resharder):
+    split, view, moved, copied = _copy(cluster, resharder)
+    resharder.cutover(split, moved)
+    metadata = cluster.metadata
+    user = sorted(moved)[0]
+    date, source, target = moved[user]
+
+    assert metadata['Migrations'][str(cluster.start)]['State'] == 'cleanup'
+    assert cluster.dbm.locate_candidates(metadata, date, user) == [target, source]
+    assert cluster.dbm.home_shard(metadata, user) == target
+
+    # a user not copied yet is still read from its old shard
+    cluster.dbm.directory.register(user, date, source)
+    execute(cluster, metadata['Connections'][target], 'DELETE FROM Users WHERE user = %s;', (user,))
+    assert cluster.dbm.home_shard(metadata, user) == source
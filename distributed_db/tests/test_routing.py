@@ -0,0 +1,79 @@
+import copy
+
+import pytest
+
+from db.exceptions import DateOutOfRangeError
+from db.hashing import get_hash_function
+from db.routing import HourClock, RoutingTable
+from db.store import write_metadata
+
+
+RANGES = {'Start': [2024010100, 2024020100], 'End': [2024013123, None], 'Moduli': [2, 3], 'Hashes': ['jump', 'murmur3']}
+TODAY = 2024060100
+
+
+def test_dates_route_to_their_range():
+    table = RoutingTable(RANGES)
+
+    assert len(table) == 2
+    assert table.range_index(2024010100, TODAY) == 0
+    assert table.range_index(2024013123, TODAY) == 0
+    assert table.range_index(2024020100, TODAY) == 1
+    assert table.range_index(TODAY, TODAY) == 1
+
+
+def test_users_hash_with_their_range_function():
+    table = RoutingTable(RANGES)
+    for user in ('alice', 'bob', 'carol', 'dave'):
+        assert table.locate(2024010500, user, TODAY) == f"r2024010100h{get_hash_function('jump')(user, 2)}"
+        assert table.locate(2024030500, user, TODAY) == f"r2024020100h{get_hash_function('murmur3')(user, 3)}"
+
+
+@pytest.mark.parametrize('date', [2023123123, 2024060101, 2024020100 - 1])
+def test_dates_outside_the_ranges_are_rejected(date):
+    ranges = dict(RANGES, End=[2024013100, None])
+    with pytest.raises(DateOutOfRangeError):
+        RoutingTable(ranges).range_index(date, TODAY)
+
+
+def test_the_table_is_immutable():
+    table = RoutingTable(RANGES)
+    with pytest.raises(AttributeError):
+        table.moduli = (4, 4)
+
+
+def test_the_manager_reuses_the_table_until_the_metadata_changes(cluster):
+    table = cluster.dbm.routing_table(cluster.metadata)
+
+    assert cluster.dbm.routing_table(cluster.metadata) is table
+
+    changed = copy.deepcopy(dict(cluster.metadata))
+    changed['Ranges']['Moduli'] = [1]
+    write_metadata(cluster.metadata_path, changed)
+    cluster.dbm.metadata_store.reload()
+    rebuilt = cluster.dbm.routing_table(cluster.metadata)
+
+    assert rebuilt is not table
+    assert rebuilt.moduli == (1,)
+    assert cluster.dbm.locate_db(cluster.metadata, cluster.start + 1, 'alice') == f'r{cluster.start}h0'
+
+
+def test_plain_dicts_are_keyed_on_their_ranges(cluster):
+    metadata = copy.deepcopy(dict(cluster.metadata))
+    table = cluster.dbm.routing_table(metadata)
+
+    assert cluster.dbm.routing_table(metadata) is table
+
+    metadata['Ranges'] = dict(metadata['Ranges'], Moduli=[1])
+
+    assert cluster.dbm.routing_table(metadata).moduli == (1,)
+
+
+def test_the_hour_clock_is_the_current_hour():
+    from datetime import datetime
+
+    before = int(datetime.now().strftime("%Y%m%d%H"))
+    hour = HourClock()()
+    after = int(datetime.now().strftime("%Y%m%d%H"))
+
+    assert before <= hour <= after
@@ -0,0 +1,69 @@
+import time
+
+import pymysql
+import pytest
+
+from tests.helpers import execute
+
+
+QUERY = 'SELECT user, nba_entity, preference FROM Preferences;'
+
+
+def _all_rows(cluster):
+    rows = []
+    for credentials in cluster.metadata['Connections'].values():
+        rows += cluster.dbm.query_one(QUERY, credentials)
+    return sorted(tuple(row) for row in rows)
+
+
+def test_every_row_of_every_shard_is_streamed(cluster):
+    cluster.populate(50)
+    shard_results = []
+    rows = list(cluster.dbm.stream_query(QUERY, fetch_size=7, prefetch=2, shard_results=shard_results))
+
+    assert sorted(tuple(row) for row in rows) == _all_rows(cluster)
+    assert len(rows) == 150
+    assert sorted(result.db for result in shard_results) == sorted(cluster.names)
+    assert sum(result.value for result in shard_results) == 150
+    assert all(result.error is None for result in shard_results)
+
+
+def test_dict_rows_parameters_and_shard_selection(cluster):
+    cluster.populate(50)
+    db = cluster.names[0]
+    rows = list(cluster.dbm.stream_query('SELECT user, preference FROM Preferences WHERE preference = %s;',
+                                         params=('rival',), dbs=[db], dict_rows=True))
+    expected = cluster.dbm.query_one("SELECT user, preference FROM Preferences WHERE preference = 'rival';", cluster.metadata['Connections'][db])
+
+    assert rows and all(row['preference'] == 'rival' for row in rows)
+    assert sorted(row['user'] for row in rows) == sorted(user for user, _ in expected)
+
+
+def test_stopping_early_discards_the_unfinished_connections(cluster):
+    cluster.populate(50)
+    stream = cluster.dbm.stream_query(QUERY, fetch_size=1, prefetch=1)
+    next(stream)
+    stream.close()
+
+    # the producers notice the stop within one queue timeout and give their connections back to the pools
+    for _ in range(50):
+        stats = cluster.dbm.pools.stats()
+        if all(pool['in_use'] == 0 for pool in stats.values()):
+            break
+        time.sleep(0.02)
+    assert all(pool['in_use'] == 0 for pool in stats.values())
+    assert sum(pool['discarded'] for pool in stats.values()) >= 1
+
+    # the pools still work afterwards
+    assert len(list(cluster.dbm.stream_query(QUERY))) == 150
+
+
+def test_a_failing_shard_stops_the_stream(cluster):
+    cluster.populate(50)
+    broken = cluster.names[0]
+    execute(cluster, cluster.metadata['Connections'][broken], 'ALTER TABLE Preferences RENAME TO PreferencesMoved;')
+    shard_results = []
+
+    with pytest.raises(pymysql.err.ProgrammingError):
+        list(cluster.dbm.stream_query(QUERY, shard_results=shard_results))
+    assert [result.db for result in shard_results if result.error] == [broken]
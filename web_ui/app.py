@@ -4,9 +4,7 @@ from datetime import datetime
 import os
 import requests
 import pandas as pd
-from nba_api.stats.static import teams
-from nba_api.stats.static import players
-from nba_api.stats.endpoints import teamyearbyyearstats, playercareerstats
+from stats import default_stats_cache
 
 
 def main():
@@ -54,22 +52,24 @@ def login_page():
             st.session_state['logged_in'] = True
             st.session_state['current_page'] = 'favorites'
             st.session_state['username'] = username
-            st.session_state['login_timestamp'] = timestamp
+            # the API answers with the user's home date, which keeps a returning user on the shard they were created on
+            st.session_state['login_timestamp'] = response.json().get('timestamp', timestamp)
             st.success("Logged in successfully!")
             favorites_page()  # Direct call after success
         else:
             st.error("Failed to log in: " + response.json().get('error', 'Unknown error'))
         st.rerun()
 
+@st.cache_resource
+def stats_cache():
+    # one cache (and one SQLite connection) shared by every session and rerun
+    return default_stats_cache()
+
 def get_nba_teams():
-    nba_teams = teams.get_teams()
-    team_names = [team['full_name'] for team in nba_teams]
-    return team_names
+    return stats_cache().team_names()
 
 def get_nba_players():
-    nba_players = players.get_active_players()
-    player_names = [player['full_name'] for player in nba_players]
-    return player_names
+    return stats_cache().player_names()
 
 
 def favorites_page():
@@ -145,14 +145,33 @@ def delete_preferences():
     else:
         st.error('No preferences found to delete.')
 
+def fetch_preferences(username, timestamp):
+    """
+    GET the user's preferences, revalidating the copy kept in the session with its ETag. An unchanged profile comes
+    back as 304 with no body, and the kept copy is used.
+    
+    Returns:
+    \tstatus - the HTTP status, 200 for a kept copy.\n
+    \tpreferences - the preferences, or the error body.\n
+    """
+    url = f'http://127.0.0.1:5000/api/preferences/{username}?timestamp={timestamp}'
+    kept = st.session_state.get('preferences_etag')
+    headers = {'If-None-Match': kept[1]} if kept and kept[0] == username else {}
+    response = requests.get(url, headers=headers)
+    
+    if response.status_code == 304:
+        return 200, kept[2]
+    if response.status_code == 200:
+        st.session_state['preferences_etag'] = (username, response.headers.get('ETag'), response.json())
+    return response.status_code, response.json()
+
+
 def display_user_preferences(username):
     if 'login_timestamp' in st.session_state:
         timestamp = st.session_state['login_timestamp']
-        url = f'http://127.0.0.1:5000/api/preferences/{username}?timestamp={timestamp}'
-        response = requests.get(url)
+        status, preferences = fetch_preferences(username, timestamp)
         
-        if response.status_code == 200:
-            preferences = response.json()
+        if status == 200:
             print("Preferences fetched from the server:", preferences)
             st.subheader("Your Profile:")
 
@@ -175,7 +194,7 @@ def display_user_preferences(username):
             df.reset_index(drop=True, inplace=True)
             st.dataframe(df)
         else:
-            st.error(f"Failed to fetch preferences: {response.json().get('error', 'Unknown error')}")
+            st.error(f"Failed to fetch preferences: {preferences.get('error', 'Unknown error')}")
     else:
         st.error("No login date found. Please log in again.")
 
@@ -185,11 +204,9 @@ def expanded_profile_page():
     if 'username' in st.session_state and 'login_timestamp' in st.session_state:
         username = st.session_state['username']
         timestamp = st.session_state['login_timestamp']
-        url = f'http://127.0.0.1:5000/api/preferences/{username}?timestamp={timestamp}'
-        response = requests.get(url)
+        status, preferences = fetch_preferences(username, timestamp)
 
-        if response.status_code == 200:
-            preferences = response.json()
+        if status == 200:
             print("Preferences fetched from the server:", preferences)
             st.subheader("Detailed Profile Page:")
 
@@ -197,19 +214,22 @@ def expanded_profile_page():
             rival_team_rows = []
             player_rows = []
 
+            # look every entity up in one batch, so uncached stats are fetched concurrently rather than one by one
+            team_names = [entity for pref_type, entities in preferences.items() if 'team' in pref_type or 'rival' in pref_type for entity in entities]
+            player_names = [entity for pref_type, entities in preferences.items() if 'player' in pref_type for entity in entities]
+            records = stats_cache().team_records(team_names)
+            player_stats = stats_cache().player_stats(player_names)
+
             for pref_type, entities in preferences.items():
                 for entity in entities:
                     if 'team' in pref_type:
-                        record = get_team_record(entity)
-                        liked_team_rows.append((entity, pref_type, record))
+                        liked_team_rows.append((entity, pref_type, records[entity]))
 
                     elif 'rival' in pref_type:
-                        record = get_team_record(entity)
-                        rival_team_rows.append((entity, pref_type, record))
+                        rival_team_rows.append((entity, pref_type, records[entity]))
 
                     elif 'player' in pref_type:
-                        # Placeholder for potential actual data fetching function
-                        stats = get_player_stats(entity)
+                        stats = player_stats[entity]
                         if stats:
                             player_rows.append((entity, pref_type) + stats)
 
@@ -237,7 +257,7 @@ def expanded_profile_page():
                 st.write("You do not have any favorite players")
 
         else:
-            st.error(f"Failed to fetch preferences: {response.json().get('error', 'Unknown error')}")
+            st.error(f"Failed to fetch preferences: {preferences.get('error', 'Unknown error')}")
     else:
         st.error("Login or username data missing. Please log in again.")
 
@@ -245,49 +265,11 @@ def expanded_profile_page():
 
 
 def get_team_record(team_name):
-    nba_teams = teams.get_teams()
-    team_dict = [team for team in nba_teams if team['full_name'] == team_name]
-    if team_dict:
-        team_id = team_dict[0]['id']
-        team_stats = teamyearbyyearstats.TeamYearByYearStats(team_id=team_id)
-        recent_season = team_stats.get_data_frames()[0].iloc[-1]  # Get the most recent season record
-        return f"{recent_season['WINS']}-{recent_season['LOSSES']}"
-    return "N/A"
+    return stats_cache().team_records([team_name])[team_name]
 
 
 def get_player_stats(player_name):
-    from nba_api.stats.static import players
-    from nba_api.stats.endpoints import playercareerstats
-    
-    nba_players = players.get_active_players()
-    player_dict = [player for player in nba_players if player['full_name'] == player_name]
-    if player_dict:
-        player_id = player_dict[0]['id']
-        player_stats = playercareerstats.PlayerCareerStats(player_id=player_id)
-        stats_df = player_stats.get_data_frames()[0]
-        
-        # Extracting required statistics
-        player_age = stats_df.iloc[0]['PLAYER_AGE']
-        GP = stats_df.iloc[0]['GP']
-        FG3_PCT = stats_df.iloc[0]['FG3_PCT']
-        FG_PCT = stats_df.iloc[0]['FG_PCT']
-        FT_PCT = stats_df.iloc[0]['FT_PCT']
-        PTS = stats_df.iloc[0]['PTS']
-        REB = stats_df.iloc[0]['REB']
-        AST = stats_df.iloc[0]['AST']
-        
-        # Calculating additional statistics
-        Pts_per_game = PTS / GP
-        REB_per_game = REB / GP
-        Ast_per_game = AST / GP
-        
-        # Returning the selected and calculated statistics as a tuple
-        return (
-            player_age, GP, FG3_PCT, FG_PCT, FT_PCT, 
-            Pts_per_game, REB_per_game, Ast_per_game
-        )
-    else:
-        return None
+    return stats_cache().player_stats([player_name])[player_name]
 
 # def social_page():
 #     st.title("Social Connections")
@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+STATS_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stats_cache.sqlite')
+STATS_TTL = 6 * 60 * 60
+INDEX_TTL = 24 * 60 * 60
+STATS_MAX_WORKERS = 4
+
+
+class NbaApiSource():
+    """
+    Upstream stats source backed by nba_api. nba_api is only imported when this source is used.
+    """
+    def teams(self) -> list[dict]:
+        from nba_api.stats.static import teams
+        return [{'id': team['id'], 'full_name': team['full_name']} for team in teams.get_teams()]
+
+    def players(self) -> list[dict]:
+        from nba_api.stats.static import players
+        return [{'id': player['id'], 'full_name': player['full_name']} for player in players.get_active_players()]
+
+    def team_record(self, team_id: int) -> str:
+        from nba_api.stats.endpoints import teamyearbyyearstats
+        team_stats = teamyearbyyearstats.TeamYearByYearStats(team_id=team_id)
+        recent_season = team_stats.get_data_frames()[0].iloc[-1]  # Get the most recent season record
+        return f"{recent_season['WINS']}-{recent_season['LOSSES']}"
+
+    def player_stats(self, player_id: int) -> Optional[list]:
+        from nba_api.stats.endpoints import playercareerstats
+        stats_df = playercareerstats.PlayerCareerStats(player_id=player_id).get_data_frames()[0]
+        if stats_df.empty:
+            return None
+        first = stats_df.iloc[0]
+        GP = int(first['GP'])
+
+        # age, games played, 3PT FG%, FG%, FT%, then points, rebounds and assists per game
+        return [
+            float(first['PLAYER_AGE']), GP, float(first['FG3_PCT']), float(first['FG_PCT']), float(first['FT_PCT']),
+            float(first['PTS']) / GP, float(first['REB']) / GP, float(first['AST']) / GP
+        ]
+
+
+class FixtureSource():
+    """
+    Stats source that reads a local JSON file instead of calling the NBA stats API, e.g. for tests or offline demos.
+
+    The file holds {"teams": [{"id", "full_name"}], "players": [...], "team_records": {id: "W-L"},
+    "player_stats": {id: [age, GP, 3PT FG%, FG%, FT%, PPG, RPG, APG]}}.
+    """
+    def __init__(self, path: str) -> None:
+        with open(path, 'r') as file:
+            self.data = json.load(file)
+
+    def teams(self) -> list[dict]:
+        return self.data.get('teams', [])
+
+    def players(self) -> list[dict]:
+        return self.data.get('players', [])
+
+    def team_record(self, team_id: int) -> str:
+        return self.data.get('team_records', {}).get(str(team_id), 'N/A')
+
+    def player_stats(self, player_id: int) -> Optional[list]:
+        return self.data.get('player_stats', {}).get(str(player_id))
+
+
+class StatsCache():
+    """
+    Team records and player stats for the profile page, kept in a small SQLite file so they survive Streamlit
+    reruns and restarts.
+
+    The name -> id index of teams and active players is built once from the source (and refreshed daily), so a
+    lookup is a dict access instead of a scan over every team or player. Entries older than `ttl` seconds are
+    fetched again; missing or expired entries for one page are fetched concurrently on a bounded thread pool. If a
+    fetch fails, the expired value is served when there is one.
+
+    Methods:
+    \tteam_names, player_names - names for the selection widgets.\n
+    \tteam_records - {team name: "W-L"} for many teams.\n
+    \tplayer_stats - {player name: stats tuple or None} for many players.\n
+    """
+    def __init__(self, source=None, path: str = STATS_CACHE_PATH, ttl: float = STATS_TTL, max_workers: int = STATS_MAX_WORKERS) -> None:
+        self.source = source if source is not None else NbaApiSource()
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL;')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS Stats(
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                fetched REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            );
+        """)
+
+    def _read(self, kind: str, keys: Iterable[str]) -> dict:
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, value, fetched FROM Stats WHERE kind = ? AND key IN ({', '.join(['?'] * len(keys))});",
+                [kind, *keys]
+            ).fetchall()
+        return {key: (json.loads(value), fetched) for key, value, fetched in rows}
+
+    def _write(self, kind: str, entries: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO Stats(kind, key, value, fetched) VALUES (?, ?, ?, ?);',
+                [(kind, key, json.dumps(value), now) for key, value in entries.items()]
+            )
+
+    def _index(self, kind: str, load: Callable[[], list[dict]]) -> dict:
+        """
+        {full name: id} for 'teams' or 'players', from memory, the SQLite file, or the source, in that order.
+        """
+        index = self._indexes.get(kind)
+        if index is not None:
+            return index
+
+        stored = self._read('index', [kind]).get(kind)
+        if stored is not None and time.time() - stored[1] < INDEX_TTL:
+            index = stored[0]
+        else:
+            try:
+                index = {entry['full_name']: entry['id'] for entry in load()}
+                self._write('index', {kind: index})
+            except Exception:
+                if stored is None:
+                    raise
+                index = stored[0]
+        self._indexes[kind] = index
+        return index
+
+    def team_names(self) -> list[str]:
+        return list(self._index('teams', self.source.teams))
+
+    def player_names(self) -> list[str]:
+        return list(self._index('players', self.source.players))
+
+    def _lookup(self, kind: str, names: Iterable[str], index: dict, fetch: Callable, missing):
+        """
+        Serve fresh entries from the store and fetch the rest concurrently, keyed by id.
+        """
+        ids = {name: index[name] for name in dict.fromkeys(names) if name in index}
+        stored = self._read(kind, [str(i) for i in ids.values()])
+        now = time.time()
+        stale = sorted({i for i in ids.values() if str(i) not in stored or now - stored[str(i)][1] >= self.ttl})
+
+        fetched = {}
+        if stale:
+            def attempt(entity_id):
+                try:
+                    return entity_id, fetch(entity_id), None
+                except Exception as err:
+                    return entity_id, None, err
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stale)), thread_name_prefix='stats') as executor:
+                for entity_id, value, err in executor.map(attempt, stale):
+                    if err is None:
+                        fetched[str(entity_id)] = value
+                    else:
+                        print(f'Failed to fetch {kind} {entity_id}: {err}')
+            self._write(kind, fetched)
+
+        result = {}
+        for name in dict.fromkeys(names):
+            if name not in ids:
+                result[name] = missing
+                continue
+            key = str(ids[name])
+            if key in fetched:
+                result[name] = fetched[key]
+            elif key in stored:
+                result[name] = stored[key][0]
+            else:
+                result[name] = missing
+        return result
+
+    def team_records(self, names: Iterable[str]) -> dict:
+        return self._lookup('team_record', names, self._index('teams', self.source.teams), self.source.team_record, 'N/A')
+
+    def player_stats(self, names: Iterable[str]) -> dict:
+        stats = self._lookup('player_stats', names, self._index('players', self.source.players), self.source.player_stats, None)
+        return {name: tuple(value) if value else None for name, value in stats.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def default_stats_cache() -> StatsCache:
+    """
+    The cache the app uses: backed by nba_api, or by the JSON file named in NBA_STATS_FIXTURE if that is set.
+    """
+    fixture = os.environ.get('NBA_STATS_FIXTURE')
+    return StatsCache(source=FixtureSource(fixture) if fixture else None)
@@ -0,0 +1,124 @@
+from functools import partial
+import json
+import threading
+
+import pytest
+
+import stats
+from stats import FixtureSource, StatsCache
+
+
+FIXTURE = {
+    'teams': [{'id': 1, 'full_name': 'Miami Heat'}, {'id': 2, 'full_name': 'Denver Nuggets'}, {'id': 3, 'full_name': 'Boston Celtics'}],
+    'players': [{'id': 10, 'full_name': 'Jimmy Butler'}, {'id': 11, 'full_name': 'Nikola Jokic'}],
+    'team_records': {'1': '46-36', '2': '57-25', '3': '64-18'},
+    'player_stats': {'10': [34, 60, 0.41, 0.5, 0.86, 20.8, 5.3, 5.0]}
+}
+
+
+class CountingSource(FixtureSource):
+    """
+    The fixture source, counting the calls made to it.
+    """
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.calls = {'teams': 0, 'players': 0, 'team_record': 0, 'player_stats': 0}
+
+    def teams(self):
+        self.calls['teams'] += 1
+        return super().teams()
+
+    def players(self):
+        self.calls['players'] += 1
+        return super().players()
+
+    def team_record(self, team_id):
+        self.calls['team_record'] += 1
+        return super().team_record(team_id)
+
+    def player_stats(self, player_id):
+        self.calls['player_stats'] += 1
+        return super().player_stats(player_id)
+
+
+@pytest.fixture
+def fixture_path(tmp_path):
+    path = str(tmp_path / 'fixture.json')
+    with open(path, 'w') as file:
+        json.dump(FIXTURE, file)
+    return path
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'stats_cache.sqlite')
+
+
+def test_stats_come_from_the_source_once(fixture_path, cache_path):
+    source = CountingSource(fixture_path)
+    cache = StatsCache(source, path=cache_path)
+
+    assert cache.team_records(['Miami Heat', 'Boston Celtics']) == {'Miami Heat': '46-36', 'Boston Celtics': '64-18'}
+    assert cache.team_records(['Boston Celtics', 'Miami Heat', 'Denver Nuggets'])['Denver Nuggets'] == '57-25'
+    assert cache.player_stats(['Jimmy Butler', 'Nikola Jokic']) == {'Jimmy Butler': (34, 60, 0.41, 0.5, 0.86, 20.8, 5.3, 5.0), 'Nikola Jokic': None}
+    assert sorted(cache.team_names()) == ['Boston Celtics', 'Denver Nuggets', 'Miami Heat']
+    assert source.calls == {'teams': 1, 'players': 1, 'team_record': 3, 'player_stats': 2}
+
+
+def test_the_store_survives_a_restart(fixture_path, cache_path):
+    StatsCache(CountingSource(fixture_path), path=cache_path).team_records(['Miami Heat'])
+    source = CountingSource(fixture_path)
+
+    assert StatsCache(source, path=cache_path).team_records(['Miami Heat']) == {'Miami Heat': '46-36'}
+    assert source.calls['teams'] == source.calls['team_record'] == 0
+
+
+def test_expired_entries_are_fetched_again(fixture_path, cache_path):
+    source = CountingSource(fixture_path)
+    cache = StatsCache(source, path=cache_path, ttl=0)
+    cache.team_records(['Miami Heat'])
+    cache.team_records(['Miami Heat'])
+
+    assert source.calls['team_record'] == 2
+
+
+def test_an_expired_entry_is_served_when_the_source_fails(fixture_path, cache_path):
+    StatsCache(CountingSource(fixture_path), path=cache_path).team_records(['Miami Heat'])
+    source = CountingSource(fixture_path)
+    source.team_record = lambda team_id: 1 / 0
+    cache = StatsCache(source, path=cache_path, ttl=0)
+
+    assert cache.team_records(['Miami Heat', 'Denver Nuggets']) == {'Miami Heat': '46-36', 'Denver Nuggets': 'N/A'}
+
+
+def test_missing_entries_are_fetched_concurrently(fixture_path, cache_path):
+    source = CountingSource(fixture_path)
+    barrier = threading.Barrier(3, timeout=2)
+    team_record = source.team_record
+
+    def together(team_id):
+        # only returns once three fetches are in flight at the same time
+        barrier.wait()
+        return team_record(team_id)
+    source.team_record = together
+    cache = StatsCache(source, path=cache_path, max_workers=3)
+
+    assert cache.team_records(['Miami Heat', 'Denver Nuggets', 'Boston Celtics'])['Boston Celtics'] == '64-18'
+
+
+def test_unknown_names_are_not_fetched(fixture_path, cache_path):
+    source = CountingSource(fixture_path)
+    cache = StatsCache(source, path=cache_path)
+
+    assert cache.team_records(['Seattle SuperSonics']) == {'Seattle SuperSonics': 'N/A'}
+    assert cache.player_stats(['Michael Jordan']) == {'Michael Jordan': None}
+    assert source.calls['team_record'] == source.calls['player_stats'] == 0
+
+
+def test_the_app_reads_the_fixture_named_in_the_environment(fixture_path, cache_path, monkeypatch):
+    monkeypatch.setenv('NBA_STATS_FIXTURE', fixture_path)
+    monkeypatch.setattr(stats, 'StatsCache', partial(StatsCache, path=cache_path))
+
+    cache = stats.default_stats_cache()
+    assert isinstance(cache.source, FixtureSource)
+    assert cache.team_records(['Denver Nuggets']) == {'Denver Nuggets': '57-25'}